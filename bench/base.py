@@ -0,0 +1,29 @@
+import time
+from typing import Callable, Dict
+
+import numpy as np
+
+
+def measure(func: Callable[[], object], repeat: int = 20, warmup: int = 2) -> Dict[str, float]:
+    # per-call latency in milliseconds
+    for _ in range(warmup):
+        func()
+
+    costs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        costs.append((time.perf_counter() - start) * 1000.0)
+
+    costs = np.array(costs)
+    return {
+        'mean_ms': float(costs.mean()),
+        'p50_ms': float(np.percentile(costs, 50)),
+        'p95_ms': float(np.percentile(costs, 95)),
+        'repeat': repeat,
+    }
+
+
+def format_result(name: str, result: Dict[str, float]) -> str:
+    return f'{name:<40} mean: {result["mean_ms"]:9.3f} ms, ' \
+           f'p50: {result["p50_ms"]:9.3f} ms, p95: {result["p95_ms"]:9.3f} ms'
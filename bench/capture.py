@@ -0,0 +1,90 @@
+import base64
+import io
+import os
+import shutil
+import subprocess
+from tempfile import TemporaryDirectory
+
+import click
+import numpy as np
+from PIL import Image, ImageGrab
+
+from br.page.vision import _base64_url_to_image, _BASE64_URL_PREFIX
+from br.utils import X11Grabber
+from .base import measure, format_result
+
+GLOBAL_CONTEXT_SETTINGS = dict(
+    help_option_names=['-h', '--help']
+)
+
+
+def _base64_url_to_image_tempfile(url: str):
+    # the implementation before in-memory decoding, kept as the baseline
+    with TemporaryDirectory() as td:
+        filename = os.path.join(td, 'file.png')
+        with open(filename, 'wb') as f:
+            f.write(base64.b64decode(url[len(_BASE64_URL_PREFIX):]))
+
+        image = Image.open(filename)
+        image.load()
+        return image
+
+
+def _capture_screen_scrot():
+    with TemporaryDirectory() as td:
+        filename = os.path.join(td, 'screen.png')
+        process = subprocess.run([shutil.which('scrot'), '-z', '-o', filename])
+        process.check_returncode()
+
+        image = Image.open(filename)
+        image.load()
+        return np.asarray(image.convert('RGB'))
+
+
+def _page_png_url(width: int, height: int) -> str:
+    rng = np.random.default_rng(0)
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    for _ in range(200):  # some blocks of text-like noise, so that png does not compress to nothing
+        x, y = rng.integers(0, width - 200), rng.integers(0, height - 40)
+        image[y:y + 40, x:x + 200] = rng.integers(0, 255, (40, 200, 3), dtype=np.uint8)
+    with io.BytesIO() as bio:
+        Image.fromarray(image).save(bio, format='PNG')
+        return _BASE64_URL_PREFIX + base64.b64encode(bio.getvalue()).decode()
+
+
+@click.command(context_settings={**GLOBAL_CONTEXT_SETTINGS},
+               help='Per-frame latency of page screenshot decoding and system screen capture.')
+@click.option('--width', 'width', type=int, default=1280, help='Width of page screenshot.', show_default=True)
+@click.option('--height', 'height', type=int, default=4000, help='Height of page screenshot.', show_default=True)
+@click.option('--repeat', '-n', 'repeat', type=int, default=20, help='Repeat times.', show_default=True)
+def cli(width: int, height: int, repeat: int):
+    url = _page_png_url(width, height)
+    click.echo(f'Page screenshot {width}x{height}, {len(url)} bytes of data url:')
+    click.echo(format_result('  decode via temp file (before)',
+                             measure(lambda: _base64_url_to_image_tempfile(url), repeat)))
+    click.echo(format_result('  decode in memory (after)',
+                             measure(lambda: _base64_url_to_image(url), repeat)))
+
+    click.echo('System screen capture:')
+    if shutil.which('scrot'):
+        click.echo(format_result('  scrot via temp file (before)', measure(_capture_screen_scrot, repeat)))
+    try:
+        click.echo(format_result('  ImageGrab (before, no scrot)',
+                                 measure(lambda: np.asarray(ImageGrab.grab()), repeat)))
+    except OSError as err:
+        click.echo(f'  ImageGrab unavailable - {err}')
+
+    try:
+        with X11Grabber(use_shm=False) as grabber:
+            click.echo(format_result('  in-process XGetImage (after)', measure(grabber.grab, repeat)))
+        with X11Grabber() as grabber:
+            if grabber.use_shm:
+                click.echo(format_result('  in-process XShmGetImage (after)', measure(grabber.grab, repeat)))
+            else:
+                click.echo('  MIT-SHM extension unavailable.')
+    except OSError as err:
+        click.echo(f'  X11 capture unavailable - {err}')
+
+
+if __name__ == '__main__':
+    cli()
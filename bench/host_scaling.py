@@ -0,0 +1,105 @@
+import os
+import time
+from tempfile import TemporaryDirectory
+
+import click
+import numpy as np
+
+from br.page.host import RecordingHost
+from br.utils import get_browser_driver
+from .page_capture import _TEST_PAGE
+
+GLOBAL_CONTEXT_SETTINGS = dict(
+    help_option_names=['-h', '--help']
+)
+
+# mostly idle page, a form with a blinking caret and a slow counter
+_IDLE_PAGE = """<!DOCTYPE html>
+<html>
+<head><style>
+body { font: 16px sans-serif; margin: 24px; }
+input { width: 320px; }
+</style></head>
+<body>
+<h1>Static form</h1>
+<p>Counter <span id="counter">0</span></p>
+<input id="name" placeholder="name" autofocus>
+<script>
+let count = 0;
+setInterval(() => { document.getElementById('counter').textContent = ++count; }, 1000);
+</script>
+</body>
+</html>
+"""
+
+
+def _run_sessions(page_files, sessions: int, duration: float, interval: float, backend: str, record_dir: str,
+                  poll_workers, encode_workers) -> dict:
+    drivers = []
+    try:
+        for i in range(sessions):
+            driver = get_browser_driver(headless=True, window_size=(1280, 720))
+            driver.get(f'file://{page_files[i % len(page_files)]}')
+            drivers.append(driver)
+
+        host = RecordingHost(poll_workers=poll_workers, encode_workers=encode_workers)
+        for i, driver in enumerate(drivers):
+            host.add(driver, os.path.join(record_dir, f'{sessions}_{i}.brc'), event_interval=interval,
+                     capture_backend=backend, streaming=True)
+        with host:
+            time.sleep(duration)
+            stats = host.stats()
+    finally:
+        for driver in drivers:
+            driver.quit()
+
+    per_session = list(stats['sessions'].values())
+    return {
+        'cpu_cores': stats['cpu_cores'],
+        'frames_per_second': stats['frames_per_second'],
+        'session_frames_per_second': float(np.mean([item['frames_per_second'] for item in per_session])),
+        'session_ticks_per_second': float(np.mean([item['ticks_per_second'] for item in per_session])),
+        'lateness_p95': max(item['lateness'].get('p95', 0.0) for item in per_session),
+        'dropped': sum(item['dropped'] for item in per_session),
+        'poll_utilization': stats['poll_utilization'],
+    }
+
+
+@click.command(context_settings={**GLOBAL_CONTEXT_SETTINGS},
+               help='Sessions per core of RecordingHost, with local headless Chrome on static pages.')
+@click.option('--sessions', '-n', 'session_counts', type=int, multiple=True, default=[1, 2, 4, 8, 16],
+              help='Numbers of concurrent sessions to measure.', show_default=True)
+@click.option('--duration', '-d', 'duration', type=float, default=20.0, help='Seconds for each measure.',
+              show_default=True)
+@click.option('--interval', '-i', 'interval', type=float, default=0.2, help='Polling interval in seconds.',
+              show_default=True)
+@click.option('--backend', '-b', 'backend', type=click.Choice(['html2canvas', 'screenshot', 'screencast']),
+              default='screenshot', help='Page capture backend.', show_default=True)
+@click.option('--poll-workers', 'poll_workers', type=int, default=None,
+              help='Polling threads of the host, twice the cores when not given.')
+@click.option('--encode-workers', 'encode_workers', type=int, default=None,
+              help='Encoding threads of the host, the cores when not given.')
+def cli(session_counts, duration: float, interval: float, backend: str, poll_workers, encode_workers):
+    cores = os.cpu_count() or 1
+    click.echo(f'{cores} cores, {backend} backend, polling every {interval}s, {duration}s for each measure.')
+    with TemporaryDirectory() as td:
+        page_files = []
+        for name, source in (('scrolling.html', _TEST_PAGE), ('idle.html', _IDLE_PAGE)):
+            page_files.append(os.path.join(td, name))
+            with open(page_files[-1], 'w') as f:
+                f.write(source)
+
+        for sessions in session_counts:
+            result = _run_sessions(page_files, sessions, duration, interval, backend, td, poll_workers, encode_workers)
+            # sessions the recorder could hold per core at this load, the browsers are not counted
+            per_core = sessions / result['cpu_cores'] if result['cpu_cores'] > 0 else float('inf')
+            click.echo(f'{sessions:>3} sessions: recorder {result["cpu_cores"]:.2f} cores '
+                       f'({per_core:.1f} sessions/core), {result["frames_per_second"]:.1f} frames/s, '
+                       f'{result["session_frames_per_second"]:.2f} frames/s and '
+                       f'{result["session_ticks_per_second"]:.2f} ticks/s per session, '
+                       f'p95 lateness {result["lateness_p95"] * 1000.0:.0f} ms, {result["dropped"]} dropped, '
+                       f'polling {result["poll_utilization"] * 100.0:.0f}% busy')
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,104 @@
+import os
+import time
+from tempfile import TemporaryDirectory
+
+import click
+
+from br.page import add_monitor, drain_all, get_capture_backend
+from br.page.monitor import add_html2canvas
+from br.utils import get_browser_driver
+
+GLOBAL_CONTEXT_SETTINGS = dict(
+    help_option_names=['-h', '--help']
+)
+
+_TEST_PAGE = """<!DOCTYPE html>
+<html>
+<head><style>
+.row { height: 120px; margin: 8px; padding: 8px; border: 1px solid #888; font: 16px sans-serif; }
+#clock { position: fixed; top: 0; right: 0; background: #ff0; padding: 8px; }
+</style></head>
+<body>
+<div id="clock"></div>
+<div id="rows"></div>
+<script>
+const rows = document.getElementById('rows');
+for (let i = 0; i < 60; i++) {
+    const div = document.createElement('div');
+    div.className = 'row';
+    div.textContent = 'Row ' + i + ' ' + 'lorem ipsum dolor sit amet '.repeat(8);
+    rows.appendChild(div);
+}
+setInterval(() => {
+    document.getElementById('clock').textContent = new Date().toISOString();
+    window.scrollBy(0, 20);
+}, 50);
+</script>
+</body>
+</html>
+"""
+
+
+def _main_thread_seconds(driver) -> float:
+    metrics = driver.execute_cdp_cmd('Performance.getMetrics', {})['metrics']
+    return {item['name']: item['value'] for item in metrics}['TaskDuration']
+
+
+def _run_backend(driver, url: str, backend_name: str, duration: float, interval: float):
+    driver.get(url)
+    backend = get_capture_backend(backend_name, **({'interval': interval} if backend_name == 'screenshot' else {}))
+    add_monitor(driver)
+    if backend.uses_html2canvas:
+        add_html2canvas(driver, int(interval * 1000))
+    backend.start(driver)
+
+    frames, decode_seconds = 0, 0.0
+    task_start, start_time = _main_thread_seconds(driver), time.time()
+    while time.time() - start_time < duration:
+        state = drain_all(driver)
+        for raw, _ in backend.poll(driver, state):
+            decode_start = time.perf_counter()
+            backend.compose(backend.to_lab(raw))
+            decode_seconds += time.perf_counter() - decode_start
+            frames += 1
+        time.sleep(interval)
+    elapsed = time.time() - start_time
+    task_seconds = _main_thread_seconds(driver) - task_start
+    backend.stop(driver)
+
+    return {
+        'frames_per_second': frames / elapsed,
+        'page_main_thread': task_seconds / elapsed,
+        'decode_ms_per_frame': decode_seconds * 1000.0 / frames if frames else float('nan'),
+    }
+
+
+@click.command(context_settings={**GLOBAL_CONTEXT_SETTINGS},
+               help='Page main thread load and frame throughput of the page capture backends.')
+@click.option('--backend', '-b', 'backends', type=click.Choice(['html2canvas', 'screenshot', 'screencast']),
+              multiple=True, default=['html2canvas', 'screenshot', 'screencast'], help='Backends to compare.',
+              show_default=True)
+@click.option('--duration', '-d', 'duration', type=float, default=10.0, help='Seconds for each backend.',
+              show_default=True)
+@click.option('--interval', '-i', 'interval', type=float, default=0.2, help='Polling interval in seconds.',
+              show_default=True)
+def cli(backends, duration: float, interval: float):
+    with TemporaryDirectory() as td:
+        page_file = os.path.join(td, 'page.html')
+        with open(page_file, 'w') as f:
+            f.write(_TEST_PAGE)
+
+        driver = get_browser_driver()
+        try:
+            driver.execute_cdp_cmd('Performance.enable', {})
+            for backend_name in backends:
+                result = _run_backend(driver, f'file://{page_file}', backend_name, duration, interval)
+                click.echo(f'{backend_name:<12}: {result["frames_per_second"]:.2f} frames/s, '
+                           f'page main thread busy {result["page_main_thread"] * 100.0:.1f}%, '
+                           f'decode {result["decode_ms_per_frame"]:.2f} ms/frame')
+        finally:
+            driver.quit()
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,156 @@
+import json
+import os
+import platform
+import sys
+from itertools import cycle
+from tempfile import TemporaryDirectory
+from typing import Dict, Callable
+
+import click
+import numpy as np
+from PIL import Image
+
+from br.load import BrowserRecord, build_pyramid
+from br.page.vision import VisionRecorder
+from br.storage import json_to_container
+from .base import measure, format_result
+from .synthetic import SyntheticSession
+
+GLOBAL_CONTEXT_SETTINGS = dict(
+    help_option_names=['-h', '--help']
+)
+
+BASELINE_VERSION = 1
+
+
+def _environment() -> dict:
+    return {
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def _cases(session: SyntheticSession, json_file: str, container_file: str, pyramid_file: str, repeat: int,
+           seed: int) -> Dict[str, Callable[[], object]]:
+    rng = np.random.default_rng(seed)
+    frames = [Image.fromarray(session.page_frame(i)) for i in range(min(len(session.frame_times()), 10))]
+
+    recorder = VisionRecorder()
+    times = cycle(range(1 << 30))
+    frame_cycle = cycle(frames)
+
+    filled_recorder = VisionRecorder()
+    for i, frame in enumerate(frames):
+        filled_recorder.append(frame, float(i))
+
+    record = BrowserRecord.load_from_json(json_file)
+    start, end = record.start_time, record.end_time
+    random_times = cycle(rng.uniform(start, end, repeat * 4).tolist())
+    sequential_times = cycle(np.linspace(start, end, repeat * 4).tolist())
+    batch_times = rng.uniform(start, end, 1000)
+
+    page_vision = record.page_vision
+    full_page = page_vision.full_page
+
+    pyramid_vision = BrowserRecord.load_from_container(pyramid_file).page_vision
+
+    def _cold_vision():
+        full_page.cache.clear()
+        return full_page.vision(next(random_times))
+
+    return {
+        'recorder.append': lambda: recorder.append(next(frame_cycle), float(next(times))),
+        'recorder.to_json': filled_recorder.to_json,
+        'load_from_json': lambda: BrowserRecord.load_from_json(json_file).page_vision,
+        'load_from_container': lambda: BrowserRecord.load_from_container(container_file).page_vision,
+        'page_vision.vision.random': lambda: full_page.vision(next(random_times)),
+        'page_vision.vision.random_cold': _cold_vision,
+        'page_vision.vision.sequential': lambda: full_page.vision(next(sequential_times)),
+        'visible.vision.random': lambda: page_vision.vision(next(random_times)),
+        'visible.thumbnail.random': lambda: page_vision.vision(next(random_times), scale=16),
+        'visible.thumbnail.pyramid.random': lambda: pyramid_vision.vision(next(random_times), scale=16),
+        'cursor.position': lambda: record.cursor.position(next(random_times)),
+        'cursor.positions_1000': lambda: record.cursor.positions(batch_times),
+    }
+
+
+def compare_results(results: Dict[str, dict], baseline: dict) -> Dict[str, float]:
+    # ratio of mean latency against baseline for the common cases
+    return {
+        name: result['mean_ms'] / baseline['results'][name]['mean_ms']
+        for name, result in results.items()
+        if name in baseline['results'] and baseline['results'][name]['mean_ms'] > 0
+    }
+
+
+@click.command(context_settings={**GLOBAL_CONTEXT_SETTINGS},
+               help='Benchmark recording and loading on a synthetic session, and save or compare baselines.')
+@click.option('--width', 'width', type=int, default=640, help='Width of viewport.', show_default=True)
+@click.option('--height', 'height', type=int, default=480, help='Height of viewport.', show_default=True)
+@click.option('--page-height', 'page_height', type=int, default=2000, help='Height of page.', show_default=True)
+@click.option('--duration', '-d', 'duration', type=float, default=10.0, help='Seconds of session.',
+              show_default=True)
+@click.option('--fps', 'fps', type=float, default=5.0, help='Frames per second.', show_default=True)
+@click.option('--repeat', '-n', 'repeat', type=int, default=20, help='Repeat times.', show_default=True)
+@click.option('--seed', 'seed', type=int, default=0, help='Random seed.', show_default=True)
+@click.option('--case', '-c', 'cases', type=str, multiple=True, help='Only run these cases.')
+@click.option('--output', '-o', 'output', type=click.Path(dir_okay=False), default=None,
+              help='Save results as baseline json.')
+@click.option('--compare', '-C', 'compare', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='Baseline json to compare with, exit with 1 when any case is slower than tolerance.')
+@click.option('--tolerance', 'tolerance', type=float, default=0.2, help='Allowed slowdown ratio.',
+              show_default=True)
+def cli(width: int, height: int, page_height: int, duration: float, fps: float, repeat: int, seed: int,
+        cases, output, compare, tolerance: float):
+    params = dict(width=width, height=height, page_height=page_height, duration=duration, fps=fps,
+                  repeat=repeat, seed=seed)
+    session = SyntheticSession(width, height, page_height, duration, fps, seed=seed, start_time=0.0)
+    results = {}
+    with TemporaryDirectory() as td:
+        json_file, container_file = os.path.join(td, 'session.json'), os.path.join(td, 'session.brc')
+        pyramid_file = os.path.join(td, 'session_pyramid.brc')
+        session.save(json_file)
+        json_to_container(json_file, container_file)
+        build_pyramid(container_file, pyramid_file)
+
+        for name, func in _cases(session, json_file, container_file, pyramid_file, repeat, seed).items():
+            if cases and name not in cases:
+                continue
+            results[name] = measure(func, repeat)
+            click.echo(format_result(name, results[name]))
+
+    if output:
+        output_dir = os.path.dirname(output)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump({
+                'version': BASELINE_VERSION,
+                'params': params,
+                'environment': _environment(),
+                'results': results,
+            }, f, indent=4, sort_keys=True)
+        click.echo(f'Baseline saved to {output!r}.')
+
+    if compare:
+        with open(compare, 'r') as f:
+            baseline = json.load(f)
+        if baseline['params'] != params:
+            click.echo(f'Warning: parameters differ from baseline - {baseline["params"]!r}.', err=True)
+
+        regressions = []
+        for name, ratio in compare_results(results, baseline).items():
+            flag = ''
+            if ratio > 1.0 + tolerance:
+                flag = '  REGRESSION'
+                regressions.append(name)
+            click.echo(f'{name:<40} {ratio:6.2f}x of baseline{flag}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,175 @@
+import json
+import os
+import time
+import uuid
+from typing import Optional
+
+import click
+import numpy as np
+
+from br.page.vision import VisionRecorder, _image_to_lab
+from br.storage import json_to_container
+
+GLOBAL_CONTEXT_SETTINGS = dict(
+    help_option_names=['-h', '--help']
+)
+
+
+def _page_image(rng: np.random.Generator, width: int, height: int) -> np.ndarray:
+    # white page with lines of dark "text" blocks and a few coloured images, like an article
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    y = 20
+    while y < height - 40:
+        if rng.random() < 0.08:  # picture
+            h, w = int(rng.integers(120, 300)), int(rng.integers(width // 4, width // 2))
+            x = int(rng.integers(20, max(21, width - w - 20)))
+            h = min(h, height - y - 20)
+            image[y:y + h, x:x + w] = rng.integers(0, 255, 3, dtype=np.uint8)
+            image[y:y + h, x:x + w] //= rng.integers(1, 3, (h, w, 1), dtype=np.uint8)
+            y += h + 20
+        else:  # line of words
+            x = 20
+            while x < width - 60:
+                w = min(int(rng.integers(20, 80)), width - 20 - x)
+                image[y:y + 14, x:x + w] = rng.integers(0, 90, (14, w, 3), dtype=np.uint8)
+                x += w + 8
+            y += 24
+    return image
+
+
+def _rgb_to_lab(color) -> tuple:
+    return tuple(_image_to_lab(np.array([[color]], dtype=np.uint8))[0, 0].tolist())
+
+
+_LAB_RED, _LAB_BLACK, _LAB_GREY = _rgb_to_lab((220, 40, 40)), _rgb_to_lab((0, 0, 0)), _rgb_to_lab((200, 200, 200))
+
+
+class SyntheticSession:
+    # browser session without a browser, a page which scrolls with the recorded scroll events,
+    # a cursor wandering around, a blinking element on the page and the viewport as the system screen
+    def __init__(self, width: int = 1280, height: int = 720, page_height: int = 4000, duration: float = 30.0,
+                 fps: float = 5.0, event_rate: float = 60.0, seed: int = 0, start_time: Optional[float] = None):
+        self.width = width
+        self.height = height
+        self.page_height = max(page_height, height)
+        self.duration = duration
+        self.fps = fps
+        self.event_rate = event_rate
+        self.start_time = time.time() if start_time is None else start_time
+        self.rng = np.random.default_rng(seed)
+        self.page = _page_image(self.rng, width, self.page_height)
+        self.page_lab = _image_to_lab(self.page)
+
+    @property
+    def end_time(self) -> float:
+        return self.start_time + self.duration
+
+    def _scroll_track(self, times: np.ndarray) -> np.ndarray:
+        # reading pace with pauses, never beyond the end of page
+        speed = np.where(self.rng.random(len(times)) < 0.3, 0.0, self.rng.uniform(0, 400, len(times)))
+        steps = speed * np.diff(times, prepend=times[0])
+        return np.minimum(np.cumsum(steps), self.page_height - self.height).astype(np.int64)
+
+    def _cursor_track(self, times: np.ndarray) -> np.ndarray:
+        steps = self.rng.normal(0, 8, (len(times), 2))
+        xy = np.cumsum(steps, axis=0) + [self.width / 2, self.height / 2]
+        # reflect into the viewport
+        size = np.array([self.width, self.height], dtype=np.float64)
+        xy = np.abs(np.mod(xy, 2 * size) - size)
+        return np.clip(size - xy, 0, size - 1).round().astype(np.int64)
+
+    def _event(self, event: str, time_: float, **kwargs) -> dict:
+        return {'event': event, 'time': float(time_), 'uuid': str(uuid.UUID(int=int(self.rng.integers(2 ** 63)))),
+                **kwargs}
+
+    def events(self) -> list:
+        count = int(self.duration * self.event_rate)
+        times = np.sort(self.rng.uniform(self.start_time, self.end_time, count))
+        scrolls = self._scroll_track(times)
+        cursors = self._cursor_track(times)
+
+        retval = [self._event('resize', self.start_time, view_width=self.width, view_height=self.height),
+                  self._event('scroll', self.start_time, scroll_x=0, scroll_y=0)]
+        last_scroll = 0
+        for time_, scroll_y, (x, y) in zip(times, scrolls.tolist(), cursors.tolist()):
+            retval.append(self._event('mousemove', time_, x=x, y=y))
+            if scroll_y != last_scroll:
+                retval.append(self._event('scroll', time_, scroll_x=0, scroll_y=scroll_y))
+                last_scroll = scroll_y
+        return retval
+
+    def frame_times(self) -> np.ndarray:
+        return self.start_time + np.arange(0, self.duration, 1.0 / self.fps)
+
+    def page_frame(self, index: int, lab: bool = False) -> np.ndarray:
+        # the page with a blinking element and a counter which changes on every frame, in rgb or lab
+        page = (self.page_lab if lab else self.page).copy()
+        red, black, grey = ((220, 40, 40), (0, 0, 0), (200, 200, 200)) if not lab else \
+            (_LAB_RED, _LAB_BLACK, _LAB_GREY)
+        if index % 2:
+            page[40:80, self.width - 140:self.width - 20] = red
+        digits = np.unpackbits(np.array([index % 256], dtype=np.uint8))
+        for i, bit in enumerate(digits):
+            page[10:20, 20 + i * 12:30 + i * 12] = black if bit else grey
+        return page
+
+    def system_frame(self, page_frame: np.ndarray, scroll_y: int) -> np.ndarray:
+        return page_frame[scroll_y:scroll_y + self.height]
+
+    def to_json(self) -> dict:
+        events = self.events()
+        scroll_times = np.array([e['time'] for e in events if e['event'] == 'scroll'])
+        scroll_ys = np.array([e['scroll_y'] for e in events if e['event'] == 'scroll'])
+
+        page_vision, system_vision = VisionRecorder(), VisionRecorder()
+        for i, time_ in enumerate(self.frame_times()):
+            frame = self.page_frame(i, lab=True)
+            scroll_y = int(scroll_ys[max(np.searchsorted(scroll_times, time_, side='right') - 1, 0)])
+            page_vision.append_lab(frame, float(time_))
+            system_vision.append_lab(np.ascontiguousarray(self.system_frame(frame, scroll_y)), float(time_))
+
+        return {
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'events': events,
+            'page_vision': page_vision.to_json(),
+            'system_vision': system_vision.to_json(),
+        }
+
+    def save(self, file: str, container: bool = False):
+        save_dir = os.path.dirname(file)
+        if save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+
+        json_file = file + '.json.tmp' if container else file
+        with open(json_file, 'w') as f:
+            json.dump(self.to_json(), f)
+        if container:
+            try:
+                json_to_container(json_file, file)
+            finally:
+                os.remove(json_file)
+
+
+@click.command(context_settings={**GLOBAL_CONTEXT_SETTINGS},
+               help='Generate a synthetic browser record without browser.')
+@click.option('--output', '-o', 'output', type=click.Path(dir_okay=False), required=True,
+              help='Record file to create, a .brc file is saved as container.')
+@click.option('--width', 'width', type=int, default=1280, help='Width of viewport.', show_default=True)
+@click.option('--height', 'height', type=int, default=720, help='Height of viewport.', show_default=True)
+@click.option('--page-height', 'page_height', type=int, default=4000, help='Height of page.', show_default=True)
+@click.option('--duration', '-d', 'duration', type=float, default=30.0, help='Seconds of session.',
+              show_default=True)
+@click.option('--fps', 'fps', type=float, default=5.0, help='Frames per second.', show_default=True)
+@click.option('--event-rate', 'event_rate', type=float, default=60.0, help='Mouse events per second.',
+              show_default=True)
+@click.option('--seed', 'seed', type=int, default=0, help='Random seed.', show_default=True)
+def cli(output: str, width: int, height: int, page_height: int, duration: float, fps: float, event_rate: float,
+        seed: int):
+    session = SyntheticSession(width, height, page_height, duration, fps, event_rate, seed)
+    session.save(output, container=output.endswith('.brc'))
+    click.echo(f'Synthetic record saved to {output!r}, {os.path.getsize(output)} bytes.')
+
+
+if __name__ == '__main__':
+    cli()
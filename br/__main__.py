@@ -0,0 +1,186 @@
+from contextlib import ExitStack
+from typing import Optional
+
+import click
+
+from .load import BrowserRecord, build_pyramid, Catalog
+from .load.compact import compact_record, seek_stats, format_seek_stats
+from .storage import json_to_container, container_to_json, recover_container
+
+GLOBAL_CONTEXT_SETTINGS = dict(
+    help_option_names=['-h', '--help']
+)
+
+
+@click.group(context_settings={**GLOBAL_CONTEXT_SETTINGS})
+def cli():
+    pass  # pragma: no cover
+
+
+@cli.command('convert', help='Convert a json record to the binary container format, or back.',
+             context_settings={**GLOBAL_CONTEXT_SETTINGS})
+@click.option('--input', '-i', 'input_file', type=click.Path(dir_okay=False, exists=True), required=True,
+              help='Record file to convert.')
+@click.option('--output', '-o', 'output_file', type=click.Path(dir_okay=False), required=True,
+              help='Output record file.')
+@click.option('--to-json', 'to_json', is_flag=True, default=False,
+              help='Convert a binary container back to json.', show_default=True)
+@click.option('--event-block-size', 'event_block_size', type=int, default=4096,
+              help='Number of events per compressed event block.', show_default=True)
+def convert(input_file: str, output_file: str, to_json: bool, event_block_size: int):
+    if to_json:
+        container_to_json(input_file, output_file)
+    else:
+        json_to_container(input_file, output_file, event_block_size=event_block_size)
+
+
+@cli.command('recover', help='Rebuild the index of a container which was not finalized.',
+             context_settings={**GLOBAL_CONTEXT_SETTINGS})
+@click.option('--input', '-i', 'input_file', type=click.Path(dir_okay=False, exists=True), required=True,
+              help='Record container to recover, will be modified in place.')
+def recover(input_file: str):
+    count = recover_container(input_file)
+    click.echo(f'{count} chunk(s) recovered.')
+
+
+@cli.command('compact', help='Rewrite a record into a container with re-planned keyframes.',
+             context_settings={**GLOBAL_CONTEXT_SETTINGS})
+@click.option('--input', '-i', 'input_file', type=click.Path(dir_okay=False, exists=True), required=True,
+              help='Record file (json or container) to compact.')
+@click.option('--output', '-o', 'output_file', type=click.Path(dir_okay=False), required=True,
+              help='Output record container.')
+@click.option('--target', '-t', 'target', type=click.Choice(['seek', 'size']), default='seek',
+              help='Bounded worst-case seek cost, or the smallest file.', show_default=True)
+@click.option('--max-diffs', 'max_diff_frames', type=int, default=10,
+              help='Max diff frames after a keyframe, for seek target.', show_default=True)
+@click.option('--min-deflation', 'min_deflation', type=float, default=0.1,
+              help='Diffs which deflate less than this are stored as keyframes.', show_default=True)
+@click.option('--level', '-l', 'level', type=click.IntRange(0, 9), default=9,
+              help='Zlib compression level of payloads.', show_default=True)
+@click.option('--merge-pixels', 'merge_pixels', type=int, default=0,
+              help='Merge frames changing less pixels than this into the next diff, 0 means never.',
+              show_default=True)
+@click.option('--samples', 'samples', type=int, default=30,
+              help='Random seeks to measure before and after.', show_default=True)
+def compact(input_file: str, output_file: str, target: str, max_diff_frames: int, min_deflation: float,
+            level: int, merge_pixels: int, samples: int):
+    click.echo(format_seek_stats(seek_stats(input_file, samples), 'before'))
+    result = compact_record(input_file, output_file, target=target, max_diff_frames=max_diff_frames,
+                            min_deflation=min_deflation, level=level, merge_pixels=merge_pixels)
+    for key, item in result.items():
+        click.echo(f'{key}: {item["frames"]} frames written, '
+                   f'{item["skipped"]} identical dropped, {item["merged"]} merged')
+    click.echo(format_seek_stats(seek_stats(output_file, samples), 'after'))
+
+
+def _is_json_output(file: str) -> bool:
+    return file.lower().endswith('.json')
+
+
+@cli.command('clip', help='Extract a time range of a record, without decoding most of the frames.',
+             context_settings={**GLOBAL_CONTEXT_SETTINGS})
+@click.option('--input', '-i', 'input_file', type=click.Path(dir_okay=False, exists=True), required=True,
+              help='Record file (json or container) to clip.')
+@click.option('--output', '-o', 'output_file', type=click.Path(dir_okay=False), required=True,
+              help='Output record, saved as json when ends with .json, otherwise as container.')
+@click.option('--start', '-s', 'start', type=float, default=0.0,
+              help='Start of range, in seconds after the start of record.', show_default=True)
+@click.option('--end', '-e', 'end', type=float, default=None,
+              help='End of range, in seconds after the start of record. Until the end when not given.')
+def clip(input_file: str, output_file: str, start: float, end: Optional[float]):
+    with BrowserRecord.load(input_file, lazy=True) as record:
+        end = record.end_time if end is None else record.start_time + end
+        clipped = record.clip(record.start_time + start, end)
+        clipped.save(output_file, container=not _is_json_output(output_file))
+    click.echo(f'{clipped.end_time - clipped.start_time:.3f}s clipped to {output_file!r}.')
+
+
+@cli.command('trim', help='Drop time ranges of a record, without decoding most of the frames.',
+             context_settings={**GLOBAL_CONTEXT_SETTINGS})
+@click.option('--input', '-i', 'input_file', type=click.Path(dir_okay=False, exists=True), required=True,
+              help='Record file (json or container) to trim.')
+@click.option('--output', '-o', 'output_file', type=click.Path(dir_okay=False), required=True,
+              help='Output record, saved as json when ends with .json, otherwise as container.')
+@click.option('--drop', '-d', 'drops', type=(float, float), multiple=True, required=True,
+              help='Range to drop, start and end in seconds after the start of record.')
+@click.option('--keep-times', 'keep_times', is_flag=True, default=False,
+              help='Keep the original times instead of closing the gaps.', show_default=True)
+def trim(input_file: str, output_file: str, drops, keep_times: bool):
+    with BrowserRecord.load(input_file, lazy=True) as record:
+        segments = [(record.start_time + start, record.start_time + end) for start, end in drops]
+        trimmed = record.trim(segments, close_gaps=not keep_times)
+        trimmed.save(output_file, container=not _is_json_output(output_file))
+    click.echo(f'{trimmed.end_time - trimmed.start_time:.3f}s saved to {output_file!r}.')
+
+
+@cli.command('concat', help='Concatenate records one after another.',
+             context_settings={**GLOBAL_CONTEXT_SETTINGS})
+@click.option('--input', '-i', 'input_files', type=click.Path(dir_okay=False, exists=True), multiple=True,
+              required=True, help='Record files (json or container) in order.')
+@click.option('--output', '-o', 'output_file', type=click.Path(dir_okay=False), required=True,
+              help='Output record, saved as json when ends with .json, otherwise as container.')
+@click.option('--gap', '-g', 'gap', type=float, default=0.0,
+              help='Seconds between records.', show_default=True)
+@click.option('--keep-times', 'keep_times', is_flag=True, default=False,
+              help='Keep the original times, records should not overlap.', show_default=True)
+def concat(input_files, output_file: str, gap: float, keep_times: bool):
+    with ExitStack() as stack:
+        records = [stack.enter_context(BrowserRecord.load(file, lazy=True)) for file in input_files]
+        result = BrowserRecord.concat(records, gap=None if keep_times else gap)
+        result.save(output_file, container=not _is_json_output(output_file))
+    click.echo(f'{len(records)} records concatenated to {output_file!r}.')
+
+
+@cli.command('pyramid', help='Add downsampled frame tracks to a record, for fast thumbnails.',
+             context_settings={**GLOBAL_CONTEXT_SETTINGS})
+@click.option('--input', '-i', 'input_file', type=click.Path(dir_okay=False, exists=True), required=True,
+              help='Record file (json or container) to index.')
+@click.option('--output', '-o', 'output_file', type=click.Path(dir_okay=False), required=True,
+              help='Output record, saved as json when ends with .json, otherwise as container.')
+@click.option('--scale', '-s', 'scales', type=int, multiple=True, default=[4, 16],
+              help='Downsampling factors, powers of 2.', show_default=True)
+def pyramid(input_file: str, output_file: str, scales):
+    result = build_pyramid(input_file, output_file, scales, container=not _is_json_output(output_file))
+    for key, levels in result.items():
+        click.echo(f'{key}: ' + ', '.join(f'1/{scale} {count} frames' for scale, count in levels.items()))
+
+
+@cli.command('catalog', help='Add records to a sqlite catalog, unchanged records are skipped.',
+             context_settings={**GLOBAL_CONTEXT_SETTINGS})
+@click.option('--db', '-d', 'db_file', type=click.Path(dir_okay=False), required=True,
+              help='Catalog database file.')
+@click.option('--input', '-i', 'paths', type=click.Path(exists=True), multiple=True, required=True,
+              help='Record files, or directories to search for .json and .brc records.')
+@click.option('--workers', '-j', 'workers', type=int, default=None,
+              help='Worker processes for parsing records, all the cpus when not given.')
+@click.option('--columns', 'columns', is_flag=True, default=False,
+              help='Also catalog the high-frequency events of compact mode.', show_default=True)
+@click.option('--prune', 'prune', is_flag=True, default=False,
+              help='Remove records which no longer exist.', show_default=True)
+def catalog(db_file: str, paths, workers: Optional[int], columns: bool, prune: bool):
+    with Catalog(db_file) as c:
+        result = c.ingest(paths, workers=workers, columns=columns, prune=prune)
+        click.echo(f'{result["added"]} added, {result["skipped"]} unchanged, {result["removed"]} removed, '
+                   f'{len(result["failed"])} failed, {len(c)} records in catalog.')
+        for file, error in result['failed'].items():
+            click.echo(f'Failed - {file!r}: {error}', err=True)
+
+
+@cli.command('search', help='Search events across the records of a catalog.',
+             context_settings={**GLOBAL_CONTEXT_SETTINGS})
+@click.option('--db', '-d', 'db_file', type=click.Path(dir_okay=False, exists=True), required=True,
+              help='Catalog database file.')
+@click.option('--type', '-t', 'types', type=str, multiple=True,
+              help='Event types, all the types when not given.')
+@click.option('--url', '-u', 'url', type=str, default=None,
+              help='Only events on pages whose url matches this sql LIKE pattern, e.g. %example.com%.')
+@click.option('--limit', '-n', 'limit', type=int, default=100,
+              help='Max number of hits.', show_default=True)
+def search(db_file: str, types, url: Optional[str], limit: int):
+    with Catalog(db_file) as c:
+        for hit in c.events(types or None, url=url, limit=limit):
+            click.echo(f'{hit.record}\t{hit.time:.3f}\t{hit.type}')
+
+
+if __name__ == '__main__':
+    cli()
@@ -1 +1,6 @@
 from .dispatch import BrowserRecord
+from .compact import compact_record, seek_stats
+from .edit import write_record
+from .pyramid import build_pyramid
+from .catalog import Catalog, Hit, record_files
+from .vision import apply_diff, lab_to_image
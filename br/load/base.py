@@ -1,26 +1,38 @@
-from bisect import bisect_right
-from typing import List, Tuple, Any, Union
+from functools import cached_property
+from typing import List, Tuple, Any, Union, Optional
 
+import numpy as np
 from hbutils.string import plural_word
 
 
 class _TimeBasedSequence:
     def __init__(self, items: List[Tuple[Any, float]]):
-        self.items = [(obj, time_) for _, (obj, time_) in sorted(enumerate(items), key=lambda x: (x[1][1], x[0]))]
-        self.times = [time_ for _, time_ in self.items]
+        times = np.array([time_ for _, time_ in items], dtype=np.float64)
+        order = np.argsort(times, kind='stable')
+        self.times = times[order]
+        self.items = [items[i] for i in order]
 
     @property
     def start_time(self) -> float:
-        return self.times[0]
+        return float(self.times[0])
 
     @property
     def end_time(self) -> float:
-        return self.times[-1]
+        return float(self.times[-1])
 
-    def _get_index_before_time(self, time_: float) -> int:
-        i = bisect_right(self.times, time_)
+    def __len__(self):
+        return len(self.times)
+
+    def _get_index_before_time(self, time_: float) -> Optional[int]:
+        i = int(np.searchsorted(self.times, time_, side='right'))
         return i - 1 if i else None
 
+    def _get_indices_before_times(self, times: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # batched version of _get_index_before_time, returns (indices, mask of times with a state)
+        indices = np.searchsorted(self.times, np.asarray(times, dtype=np.float64), side='right') - 1
+        mask = indices >= 0
+        return np.maximum(indices, 0), mask
+
     def _get_state_on_time(self, time_: float):
         i = self._get_index_before_time(time_)
         if i is not None:
@@ -35,6 +47,64 @@ class _TimeBasedSequence:
                f'{plural_word(len(self.times), "item")}>'
 
 
+class _ArrayTimeSequence(_TimeBasedSequence):
+    # time sequence of fixed-width numeric states, stored as columnar arrays
+    _WIDTH: int = 2
+
+    def __init__(self, items: List[Tuple[Tuple[float, ...], float]]):
+        self._init_arrays(
+            np.array([time_ for _, time_ in items], dtype=np.float64),
+            np.array([obj for obj, _ in items]),
+        )
+
+    def _init_arrays(self, times: np.ndarray, values: np.ndarray):
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values)
+        if values.size == 0:
+            values = values.astype(np.float64)
+        values = values.reshape((len(times), self._WIDTH))
+
+        order = np.argsort(times, kind='stable')
+        self.times = times[order]
+        self.values = values[order]
+
+    @classmethod
+    def from_arrays(cls, times: np.ndarray, values: np.ndarray):
+        obj = cls.__new__(cls)
+        _ArrayTimeSequence._init_arrays(obj, times, values)
+        return obj
+
+    @cached_property
+    def items(self) -> List[Tuple[Tuple[float, ...], float]]:
+        return list(zip(map(tuple, self.values.tolist()), self.times.tolist()))
+
+    def _get_state_on_time(self, time_: float):
+        i = self._get_index_before_time(time_)
+        if i is not None:
+            return tuple(self.values[i].tolist())
+        else:
+            return None
+
+    def _get_states_on_times(self, times: np.ndarray, interpolate: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        # returns (states of shape (N, width), mask), states without a previous sample are filled with nan
+        times = np.asarray(times, dtype=np.float64)
+        if len(self.times) == 0:
+            return np.full((len(times), self._WIDTH), np.nan), np.zeros(len(times), dtype=bool)
+
+        indices, mask = self._get_indices_before_times(times)
+        states = self.values[indices].astype(np.float64)
+        if interpolate and len(self.times) > 1:
+            next_indices = np.minimum(indices + 1, len(self.times) - 1)
+            t0, t1 = self.times[indices], self.times[next_indices]
+            span = t1 - t0
+            ratio = np.divide(times - t0, span, out=np.zeros_like(span), where=span > 0)
+            ratio = np.clip(ratio, 0.0, 1.0)[:, None]
+            states = states + (self.values[next_indices] - states) * ratio
+
+        states[~mask] = np.nan
+        return states, mask
+
+
 class _SequenceCombine:
     def __init__(self, *seqs: Union[_TimeBasedSequence, '_SequenceCombine']):
         self._seqs = seqs
@@ -0,0 +1,59 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional, Hashable
+
+import numpy as np
+
+
+class FrameCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: 'OrderedDict[Hashable, np.ndarray]' = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        with self._lock:
+            arr = self._items.get(key)
+            if arr is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return arr
+
+    def __contains__(self, key: Hashable):
+        return key in self._items
+
+    def put(self, key: Hashable, arr: np.ndarray):
+        if arr.nbytes > self.max_bytes:
+            return
+
+        arr.flags.writeable = False  # cached frames are shared, never modify them in place
+        with self._lock:
+            if key in self._items:
+                self._bytes -= self._items.pop(key).nbytes
+            self._items[key] = arr
+            self._bytes += arr.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {len(self._items)} frames, ' \
+               f'{self._bytes} / {self.max_bytes} bytes, hits: {self.hits}, misses: {self.misses}>'
@@ -0,0 +1,329 @@
+import json
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Iterable, Tuple, NamedTuple, Dict, Any, Union
+
+import numpy as np
+from PIL import Image
+from hbutils.encoding import base64_decode
+
+from .dispatch import BrowserRecord
+from .vision import _b64_to_array, apply_diff, lab_to_image, _frame_shape
+from ..page.vision import VisionItemType
+from ..storage import StreamType, is_container_file
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    format TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    start_time REAL,
+    end_time REAL,
+    duration REAL,
+    event_count INTEGER,
+    page_frames INTEGER,
+    system_frames INTEGER,
+    view_width INTEGER,
+    view_height INTEGER,
+    page_width INTEGER,
+    page_height INTEGER,
+    screen_width INTEGER,
+    screen_height INTEGER
+);
+CREATE TABLE IF NOT EXISTS urls (
+    record_id INTEGER NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+    url TEXT,
+    start_time REAL NOT NULL,
+    end_time REAL
+);
+CREATE INDEX IF NOT EXISTS urls_url ON urls(url);
+CREATE INDEX IF NOT EXISTS urls_record ON urls(record_id, start_time);
+CREATE TABLE IF NOT EXISTS events (
+    record_id INTEGER NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+    time REAL NOT NULL,
+    type TEXT NOT NULL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS events_type_time ON events(type, time);
+CREATE INDEX IF NOT EXISTS events_record_time ON events(record_id, time);
+CREATE TABLE IF NOT EXISTS frames (
+    record_id INTEGER NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+    stream INTEGER NOT NULL,
+    time REAL NOT NULL,
+    type INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS frames_record_stream_time ON frames(record_id, stream, time);
+'''
+
+_STREAMS = {
+    'page_vision': StreamType.PAGE_VISION,
+    'system_vision': StreamType.SYSTEM_VISION,
+}
+
+
+class Hit(NamedTuple):
+    # a matching moment, record is the path of the record file
+    record: str
+    time: float
+    type: Optional[str] = None
+    data: Optional[dict] = None
+
+
+def _scan_record(file: str, columns: bool = False) -> Dict[str, Any]:
+    # everything the catalog keeps of one record, runs in the worker processes
+    stat = os.stat(file)
+    with BrowserRecord.load(file, lazy=True) as record:
+        index = record.stream_index
+        frames = list(zip(index['stream'].tolist(), index['timestamp'].tolist(), index['type'].tolist(),
+                          index['offset'].tolist(), index['length'].tolist()))
+
+        events = [(item['time'], item['event'],
+                   json.dumps({key: value for key, value in item.items() if key not in ('time', 'event')}))
+                  for item in record.events]
+        if columns:  # high-frequency samples of compact mode
+            for event, event_columns in record.event_columns.items():
+                names = [name for name in event_columns if name != 'time']
+                for i, time_ in enumerate(event_columns['time'].tolist()):
+                    events.append((time_, event, json.dumps({name: float(event_columns[name][i]) for name in names})))
+
+        resize_times, sizes = record.event_arrays('resize', 'view_width', 'view_height')
+        size = sizes[int(np.argmin(resize_times))] if len(resize_times) else None
+        shapes = {}
+        for key, vision_key in (('page', 'page_vision'), ('screen', 'system_vision')):
+            items = record.data[vision_key]
+            shapes[key] = _frame_shape(items[0]['data']) if items else None
+
+        return {
+            'path': file,
+            'format': 'container' if is_container_file(file) else 'json',
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'start_time': record.start_time,
+            'end_time': record.end_time,
+            'duration': None if record.start_time is None or record.end_time is None
+            else record.end_time - record.start_time,
+            'event_count': record.event_count,
+            'page_frames': int((index['stream'] == StreamType.PAGE_VISION).sum()),
+            'system_frames': int((index['stream'] == StreamType.SYSTEM_VISION).sum()),
+            'view_width': None if size is None else int(size[0]),
+            'view_height': None if size is None else int(size[1]),
+            'page_width': shapes['page'][2] if shapes['page'] else None,
+            'page_height': shapes['page'][1] if shapes['page'] else None,
+            'screen_width': shapes['screen'][2] if shapes['screen'] else None,
+            'screen_height': shapes['screen'][1] if shapes['screen'] else None,
+            'urls': [(segment.url, segment.start_time, segment.end_time) for segment in record.navigation],
+            'events': events,
+            'frames': frames,
+        }
+
+
+def _scan_record_safe(file: str, columns: bool) -> Tuple[str, Optional[Dict[str, Any]], Optional[str]]:
+    try:
+        return file, _scan_record(file, columns), None
+    except Exception as err:
+        return file, None, f'{type(err).__name__}: {err}'
+
+
+def record_files(paths: Iterable[str]) -> List[str]:
+    # record files in the paths, directories are searched recursively
+    retval = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                retval.extend(os.path.join(root, file) for file in sorted(files)
+                              if file.lower().endswith(('.json', '.brc')))
+        else:
+            retval.append(path)
+    return sorted(set(os.path.abspath(file) for file in retval))
+
+
+class Catalog:
+    # sqlite index of many records, for queries across sessions without opening each record
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        db_dir = os.path.dirname(db_file)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_file)
+        self._conn.execute('PRAGMA foreign_keys = ON')
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.executescript(_SCHEMA)
+
+    def _is_current(self, file: str) -> bool:
+        row = self._conn.execute('SELECT size, mtime FROM records WHERE path = ?', (file,)).fetchone()
+        if row is None:
+            return False
+        stat = os.stat(file)
+        return row[0] == stat.st_size and row[1] == stat.st_mtime
+
+    def _insert(self, item: Dict[str, Any]):
+        with self._conn:
+            self._conn.execute('DELETE FROM records WHERE path = ?', (item['path'],))
+            keys = [key for key in item if key not in ('urls', 'events', 'frames')]
+            cursor = self._conn.execute(
+                f'INSERT INTO records ({", ".join(keys)}) VALUES ({", ".join("?" * len(keys))})',
+                [item[key] for key in keys],
+            )
+            record_id = cursor.lastrowid
+            self._conn.executemany('INSERT INTO urls VALUES (?, ?, ?, ?)',
+                                   ((record_id, *row) for row in item['urls']))
+            self._conn.executemany('INSERT INTO events VALUES (?, ?, ?, ?)',
+                                   ((record_id, *row) for row in item['events']))
+            self._conn.executemany('INSERT INTO frames VALUES (?, ?, ?, ?, ?, ?)',
+                                   ((record_id, *row) for row in item['frames']))
+
+    def ingest(self, paths: Iterable[str], workers: Optional[int] = None, columns: bool = False,
+               prune: bool = False) -> Dict[str, Any]:
+        # records are parsed in worker processes, and written here in one transaction each.
+        # unchanged records (same size and mtime) are skipped, and with prune, records which
+        # no longer exist are removed
+        files = record_files(paths)
+        pending = [file for file in files if not self._is_current(file)]
+        result = {'added': 0, 'skipped': len(files) - len(pending), 'failed': {}, 'removed': 0}
+
+        if pending:
+            if workers == 1:
+                scanned = (_scan_record_safe(file, columns) for file in pending)
+                self._insert_all(scanned, result)
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    self._insert_all(executor.map(_scan_record_safe, pending, [columns] * len(pending)), result)
+
+        if prune:
+            with self._conn:
+                for (path,) in self._conn.execute('SELECT path FROM records').fetchall():
+                    if not os.path.exists(path):
+                        self._conn.execute('DELETE FROM records WHERE path = ?', (path,))
+                        result['removed'] += 1
+        return result
+
+    def _insert_all(self, scanned, result: Dict[str, Any]):
+        for file, item, error in scanned:
+            if item is None:
+                result['failed'][file] = error
+            else:
+                self._insert(item)
+                result['added'] += 1
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def query(self, sql: str, params: Union[tuple, dict] = ()) -> List[tuple]:
+        # raw sql over the records, urls, events and frames tables
+        return self._conn.execute(sql, params).fetchall()
+
+    def records(self, url: Optional[str] = None, min_duration: Optional[float] = None,
+                max_duration: Optional[float] = None) -> List[dict]:
+        # url is a LIKE pattern, e.g. '%example.com%'
+        conditions, params = [], []
+        if url is not None:
+            conditions.append('id IN (SELECT record_id FROM urls WHERE url LIKE ?)')
+            params.append(url)
+        if min_duration is not None:
+            conditions.append('duration >= ?')
+            params.append(min_duration)
+        if max_duration is not None:
+            conditions.append('duration <= ?')
+            params.append(max_duration)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        cursor = self._conn.execute(f'SELECT * FROM records {where} ORDER BY path', params)
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def events(self, types: Optional[Iterable[str]] = None, start: Optional[float] = None,
+               end: Optional[float] = None, url: Optional[str] = None, record: Optional[str] = None,
+               limit: Optional[int] = None) -> List[Hit]:
+        # events of the types in [start, end], on pages whose url matches the LIKE pattern url
+        conditions, params = [], []
+        if types is not None:
+            types = [types] if isinstance(types, str) else list(types)
+            conditions.append(f'e.type IN ({", ".join("?" * len(types))})')
+            params.extend(types)
+        if start is not None:
+            conditions.append('e.time >= ?')
+            params.append(start)
+        if end is not None:
+            conditions.append('e.time <= ?')
+            params.append(end)
+        if record is not None:
+            conditions.append('r.path = ?')
+            params.append(os.path.abspath(record))
+        if url is not None:
+            conditions.append('EXISTS (SELECT 1 FROM urls u WHERE u.record_id = e.record_id AND u.url LIKE ? '
+                              'AND u.start_time <= e.time AND (u.end_time IS NULL OR e.time < u.end_time))')
+            params.append(url)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        sql = f'SELECT r.path, e.time, e.type, e.data FROM events e JOIN records r ON r.id = e.record_id ' \
+              f'{where} ORDER BY r.path, e.time'
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+        return [Hit(path, time_, type_, json.loads(data) if data else None)
+                for path, time_, type_, data in self._conn.execute(sql, params)]
+
+    def open(self, hit: Union[Hit, str]) -> BrowserRecord:
+        # lazily loaded record, nothing but the index is read until a frame is needed
+        return BrowserRecord.load(hit.record if isinstance(hit, Hit) else hit, lazy=True)
+
+    def _read_payload(self, f, format_: str, offset: int, length: int) -> bytes:
+        f.seek(offset)
+        data = f.read(length)
+        if format_ == 'container':
+            return data
+        if b'\\' in data:  # json escapes, the same as JsonRecordReader
+            data = json.loads(b'"' + data + b'"').encode()
+        return base64_decode(data.decode())
+
+    def frame_array(self, hit: Union[Hit, str], time_: Optional[float] = None,
+                    stream: str = 'page_vision') -> Optional[np.ndarray]:
+        # LAB array (3, H, W) on screen at the time, only its keyframe and diffs are read from the file,
+        # with the offsets in the catalog
+        path = os.path.abspath(hit.record if isinstance(hit, Hit) else hit)
+        time_ = hit.time if time_ is None else time_
+        row = self._conn.execute('SELECT id, format FROM records WHERE path = ?', (path,)).fetchone()
+        if row is None:
+            raise KeyError(f'Record not in catalog - {path!r}.')
+        record_id, format_ = row
+        stream_id = int(_STREAMS[stream])
+
+        # frames are inserted in file order, so rowid keeps the order of frames with the same timestamp
+        keyframe = self._conn.execute(
+            'SELECT rowid, time FROM frames WHERE record_id = ? AND stream = ? AND time <= ? AND type = ? '
+            'ORDER BY time DESC, rowid DESC LIMIT 1',
+            (record_id, stream_id, time_, int(VisionItemType.NEW_FRAME)),
+        ).fetchone()
+        if keyframe is None:
+            return None
+        rows = self._conn.execute(
+            'SELECT type, offset, length FROM frames WHERE record_id = ? AND stream = ? AND time >= ? AND time <= ? '
+            'AND rowid >= ? ORDER BY rowid',
+            (record_id, stream_id, keyframe[1], time_, keyframe[0]),
+        ).fetchall()
+
+        image_arr = None
+        with open(path, 'rb') as f:
+            for type_, offset, length in rows:
+                payload = self._read_payload(f, format_, offset, length)
+                if type_ == VisionItemType.NEW_FRAME:
+                    image_arr = _b64_to_array(payload)
+                elif image_arr is not None:
+                    apply_diff(image_arr, VisionItemType(type_), _b64_to_array(payload))
+        return image_arr
+
+    def frame(self, hit: Union[Hit, str], time_: Optional[float] = None,
+              stream: str = 'page_vision') -> Optional[Image.Image]:
+        image_arr = self.frame_array(hit, time_, stream)
+        return None if image_arr is None else lab_to_image(image_arr)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
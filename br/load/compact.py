@@ -0,0 +1,164 @@
+import os
+import time
+from typing import Optional, Dict, List
+
+import numpy as np
+
+from .dispatch import BrowserRecord
+from .vision import VisionTracker, _b64_to_array, apply_diff, _payload
+from ..page.vision import VisionRecorder, VisionItem, VisionItemType, _numpy_to_bytes
+from ..storage import RecordWriter, StreamType, pyramid_stream
+
+_VISION_STREAMS = [
+    ('page_vision', StreamType.PAGE_VISION),
+    ('system_vision', StreamType.SYSTEM_VISION),
+]
+
+# frames between keyframes when the target is the smallest file,
+# new frames are still inserted when a diff does not deflate enough
+_SIZE_MAX_DIFF_FRAMES = 1 << 30
+
+
+class _SmallestDiffRecorder(VisionRecorder):
+    # sparse scattered changes are smaller per pixel, dense ones as tiles, compared after compression
+    def __init__(self, level: int = 9, **kwargs):
+        VisionRecorder.__init__(self, **kwargs)
+        self.level = level
+
+    def _encode_diff(self, lab: np.ndarray, changed: np.ndarray):
+        tile_data = self._tile_diff(lab, changed)
+        pixel_data = self._pixel_diff(lab, changed)
+        if len(_numpy_to_bytes(pixel_data, self.level)) < len(_numpy_to_bytes(tile_data, self.level)):
+            return VisionItemType.DIFF_FRAME, pixel_data
+        return VisionItemType.TILE_DIFF_FRAME, tile_data
+
+
+def _iter_lab_frames(items: List[dict]):
+    # reconstructs every frame in order, yields (timestamp, HWC LAB array, is the last item)
+    image_arr = None
+    for i, item in enumerate(items):
+        type_ = VisionItemType.loads(item['type'])
+        if type_ == VisionItemType.NEW_FRAME:
+            image_arr = _b64_to_array(item['data'])
+        elif image_arr is None:  # diffs before the first keyframe have no frame to apply to
+            continue
+        else:
+            apply_diff(image_arr, type_, _b64_to_array(item['data']))
+        yield item['timestamp'], image_arr.transpose((1, 2, 0)).copy(), i == len(items) - 1
+
+
+def _compact_vision(items: List[dict], sink, max_diff_frames: int, min_deflation: float,
+                    merge_pixels: int, level: int, smallest_diff: bool) -> Dict[str, int]:
+    # re-plans the keyframes of one stream. Diffs are taken against the reconstructed frames with a zero
+    # threshold, so the reconstruction stays exact except for the frames merged by merge_pixels
+    kwargs = dict(max_diff_frames=max_diff_frames, min_deflation=min_deflation,
+                  pixel_diff_threshold=0.0, sink=sink, skip_identical=True)
+    recorder = _SmallestDiffRecorder(level, **kwargs) if smallest_diff else VisionRecorder(**kwargs)
+    merged = 0
+    for timestamp, lab, last in _iter_lab_frames(items):
+        if merge_pixels and recorder._last_lab is not None and not last and \
+                recorder._last_lab.shape == lab.shape and \
+                int(recorder._changed_pixels(recorder._last_lab, lab).sum()) < merge_pixels:
+            merged += 1  # tiny change, carried by the diff of a later frame
+            continue
+        recorder.append_lab(lab, timestamp)
+
+    return {'frames': len(recorder), 'skipped': recorder.skipped, 'merged': merged}
+
+
+def compact_record(input_file: str, output_file: str, target: str = 'seek', max_diff_frames: int = 10,
+                   min_deflation: float = 0.1, level: int = 9, merge_pixels: int = 0,
+                   event_block_size: int = 4096) -> Dict[str, Dict[str, int]]:
+    # rewrites a json record or container into a container with re-planned keyframes.
+    # target 'seek' bounds the diffs applied by a random seek to max_diff_frames, while 'size' only inserts
+    # keyframes where diffs do not pay off, and stores each diff in the smaller of pixel and tile encodings
+    if target == 'size':
+        max_diff_frames = _SIZE_MAX_DIFF_FRAMES
+    elif target != 'seek':
+        raise ValueError(f'Unknown compaction target - {target!r}.')
+
+    save_dir = os.path.dirname(output_file)
+    if save_dir:
+        os.makedirs(save_dir, exist_ok=True)
+
+    retval = {}
+    with BrowserRecord.load(input_file, lazy=True) as record, RecordWriter(output_file) as writer:
+        data = record.data
+        events = data['events']
+        for i in range(0, len(events), event_block_size):
+            writer.write_events(events[i:i + event_block_size])
+        if data.get('event_columns'):
+            writer.write_event_columns(data['event_columns'])
+
+        for key, stream in _VISION_STREAMS:
+            def _sink(item: VisionItem, stream_=stream):
+                writer.write_vision(stream_, item.type, item.timestamp, _numpy_to_bytes(item.data, level))
+
+            retval[key] = _compact_vision(data[key], _sink, max_diff_frames, min_deflation, merge_pixels, level,
+                                          smallest_diff=target == 'size')
+            # pyramid levels already have their own keyframes, they are copied as they are
+            for scale, items in ((data.get('pyramid') or {}).get(key) or {}).items():
+                for item in items:
+                    writer.write_vision(pyramid_stream(stream, int(scale)), VisionItemType.loads(item['type']),
+                                        item['timestamp'], _payload(item['data']))
+
+        writer.close({'start_time': data['start_time'], 'end_time': data['end_time']})
+
+    return retval
+
+
+def _chain_lengths(tracker: VisionTracker) -> np.ndarray:
+    # diffs to apply after the keyframe, for each frame
+    retval, chain = [], 0
+    for i in range(len(tracker)):
+        type_, _ = tracker._item(i)
+        chain = 0 if type_ == VisionItemType.NEW_FRAME else chain + 1
+        retval.append(chain)
+    return np.array(retval, dtype=np.int64)
+
+
+def seek_stats(file: str, samples: int = 30, seed: int = 0, region=None) -> Dict[str, dict]:
+    # size, keyframes and cold random seek latency of each vision stream
+    retval = {'file': {'bytes': os.path.getsize(file)}}
+    rng = np.random.default_rng(seed)
+    with BrowserRecord.load(file, lazy=True) as record:
+        for key, _ in _VISION_STREAMS:
+            tracker = VisionTracker(record.data[key])
+            if not len(tracker):
+                retval[key] = {'frames': 0}
+                continue
+
+            chains = _chain_lengths(tracker)
+            latencies = []
+            for time_ in rng.uniform(tracker.start_time, tracker.end_time, samples):
+                tracker.cache.clear()
+                start = time.perf_counter()
+                tracker.vision_array(float(time_), region)
+                latencies.append((time.perf_counter() - start) * 1000.0)
+
+            latencies = np.array(latencies)
+            retval[key] = {
+                'frames': len(tracker),
+                'keyframes': int((chains == 0).sum()),
+                'max_chain': int(chains.max()),
+                'mean_chain': float(chains.mean()),
+                'seek_mean_ms': float(latencies.mean()),
+                'seek_p95_ms': float(np.percentile(latencies, 95)),
+                'seek_max_ms': float(latencies.max()),
+            }
+
+    return retval
+
+
+def format_seek_stats(stats: Dict[str, dict], name: Optional[str] = None) -> str:
+    lines = [f'{name or "record"}: {stats["file"]["bytes"]} bytes']
+    for key, _ in _VISION_STREAMS:
+        item = stats[key]
+        if not item['frames']:
+            lines.append(f'  {key}: no frames')
+            continue
+        lines.append(f'  {key}: {item["frames"]} frames, {item["keyframes"]} keyframes, '
+                     f'chain max {item["max_chain"]} / mean {item["mean_chain"]:.1f}, '
+                     f'seek mean {item["seek_mean_ms"]:.1f} ms / p95 {item["seek_p95_ms"]:.1f} ms '
+                     f'/ max {item["seek_max_ms"]:.1f} ms')
+    return os.linesep.join(lines)
@@ -1,33 +1,126 @@
 import json
+from functools import cached_property
+from typing import Mapping, Dict, List, Optional, Iterable, Tuple
 
+import numpy as np
+
+from .edit import clip_data, concat_data, write_record, _keep_ranges
 from .events import CursorTracker, ViewAreaTracker, ScrollTracker, ResizeTracker
+from .index import EventIndex, EventView, NavigationSegment
 from .vision import VisionTracker, VisibleTracker
+from ..page.vision import VisionItemType
+from ..storage import RecordReader, JsonRecordReader, StreamType, is_container_file, pyramid_streams
+
+
+class _ContainerData(Mapping):
+    _KEYS = ('start_time', 'end_time', 'events', 'event_columns', 'page_vision', 'system_vision', 'pyramid')
+    _VISION_STREAMS = {
+        'page_vision': StreamType.PAGE_VISION,
+        'system_vision': StreamType.SYSTEM_VISION,
+    }
+
+    def __init__(self, reader: RecordReader, lazy: bool = True):
+        self._reader = reader
+        self._lazy = lazy
+        self._values = {}
+
+    @property
+    def metadata(self) -> dict:
+        return self._reader.metadata
+
+    def _vision_items(self, stream: int) -> List[dict]:
+        return [
+            {
+                'type': VisionItemType(entry['type']),
+                'timestamp': float(entry['timestamp']),
+                'data': self._reader.payload_ref(entry) if self._lazy
+                else self._reader.payload(entry['offset'], entry['length']),
+            }
+            for entry in self._reader.entries(stream)
+        ]
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            if key in ('start_time', 'end_time'):
+                self._values[key] = self._reader.metadata[key]
+            elif key == 'events':
+                self._values[key] = self._reader.read_events()
+            elif key == 'event_columns':
+                self._values[key] = self._reader.read_event_columns()
+            elif key in self._VISION_STREAMS:
+                self._values[key] = self._vision_items(self._VISION_STREAMS[key])
+            elif key == 'pyramid':
+                self._values[key] = {
+                    name: {str(scale): self._vision_items(level_stream)
+                           for scale, level_stream in pyramid_streams(self._reader.index, stream).items()}
+                    for name, stream in self._VISION_STREAMS.items()
+                }
+            else:
+                raise KeyError(key)
+        return self._values[key]
+
+    def __iter__(self):
+        yield from self._KEYS
+
+    def __len__(self):
+        return len(self._KEYS)
 
 
 class BrowserRecord:
-    def __init__(self, data):
+    def __init__(self, data: Mapping, reader: Optional[RecordReader] = None):
+        # trackers are built on first access, so reading cheap facts does not pay for the full load
         self.data = data
-        self._events = self.data['events']
-
-        view_area = ViewAreaTracker(
-            ScrollTracker([
-                ((item['scroll_x'], item['scroll_y']), item['time'])
-                for item in self._events if item['event'] == 'scroll'
-            ]), ResizeTracker([
-                ((item['view_width'], item['view_height']), item['time'])
-                for item in self._events if item['event'] == 'resize'
-            ])
+        self._reader = reader
+
+    @cached_property
+    def _events(self) -> list:
+        return self.data['events']
+
+    @cached_property
+    def event_index(self) -> EventIndex:
+        # events grouped by type with sorted times, for queries by time range and type
+        return EventIndex(self._events, self._event_columns, self.start_time, self.end_time)
+
+    @cached_property
+    def _event_columns(self) -> Dict[str, Dict[str, np.ndarray]]:
+        # high-frequency events recorded in compact mode
+        return {
+            event: {name: np.asarray(column, dtype=np.float64) for name, column in event_columns.items()}
+            for event, event_columns in (self.data.get('event_columns') or {}).items()
+        }
+
+    @property
+    def stream_index(self) -> Optional[np.ndarray]:
+        # (timestamp, stream, type, offset, length) of each chunk in the file, only for lazily loaded records
+        return None if self._reader is None else self._reader.index
+
+    def event_arrays(self, event: str, *keys: str) -> Tuple[np.ndarray, np.ndarray]:
+        # (times, values of keys) of event, including the columns of compact mode, not sorted
+        return self.event_index.arrays(event, *keys)
+
+    @cached_property
+    def view_area(self) -> ViewAreaTracker:
+        return ViewAreaTracker(
+            ScrollTracker.from_arrays(*self.event_arrays('scroll', 'scroll_x', 'scroll_y')),
+            ResizeTracker.from_arrays(*self.event_arrays('resize', 'view_width', 'view_height')),
         )
 
-        self.cursor = CursorTracker([
-            ((item['x'], item['y']), item['time'])
-            for item in self._events if item['event'] == 'mousemove'
-        ])
+    @cached_property
+    def cursor(self) -> CursorTracker:
+        return CursorTracker.from_arrays(*self.event_arrays('mousemove', 'x', 'y'))
+
+    def _pyramid(self, key: str) -> Dict[int, list]:
+        # downsampled tracks of the vision stream, {scale: items}
+        return {int(scale): items for scale, items in ((self.data.get('pyramid') or {}).get(key) or {}).items()}
 
-        full_page = VisionTracker(self.data['page_vision'])
-        self.page_vision = VisibleTracker(full_page, view_area)
+    @cached_property
+    def page_vision(self) -> VisibleTracker:
+        full_page = VisionTracker(self.data['page_vision'], pyramid=self._pyramid('page_vision'))
+        return VisibleTracker(full_page, self.view_area)
 
-        self.sys_vision = VisionTracker(self.data['system_vision'])
+    @cached_property
+    def sys_vision(self) -> VisionTracker:
+        return VisionTracker(self.data['system_vision'], pyramid=self._pyramid('system_vision'))
 
     @property
     def start_time(self) -> float:
@@ -38,10 +131,97 @@ class BrowserRecord:
         return self.data['end_time']
 
     @property
-    def events(self):
-        return list(self._events)
+    def events(self) -> EventView:
+        # all the events in time order, a read-only view without copying
+        return self.event_index.between()
+
+    def events_between(self, start: Optional[float] = None, end: Optional[float] = None,
+                       types: Optional[Iterable[str]] = None) -> EventView:
+        # events in [start, end], of the given types when types is given
+        return self.event_index.between(start, end, types)
+
+    @property
+    def navigation(self) -> List[NavigationSegment]:
+        # (url, start_time, end_time) of each page, split by url_change events
+        return self.event_index.navigation
+
+    @property
+    def event_columns(self) -> Dict[str, Dict[str, np.ndarray]]:
+        return self._event_columns
+
+    @property
+    def event_counts(self) -> Dict[str, int]:
+        if isinstance(self.data, _ContainerData):
+            return dict(self.data.metadata['event_counts'])
+        else:
+            return self.event_index.counts
+
+    @property
+    def event_count(self) -> int:
+        return sum(self.event_counts.values())
+
+    def clip(self, start: float, end: float) -> 'BrowserRecord':
+        # [start, end] of this record, encoded frames are shared, so keep this record open until the clip is saved
+        return BrowserRecord(clip_data(self.data, start, end))
+
+    def trim(self, segments: Iterable[Tuple[float, float]], close_gaps: bool = True) -> 'BrowserRecord':
+        # drops the (start, end) segments, later parts are moved earlier to close the gaps by default
+        parts, dropped = [], 0.0
+        last_end = self.start_time
+        for start, end in _keep_ranges(self.start_time, self.end_time, segments):
+            if close_gaps:
+                dropped += start - last_end
+            parts.append(clip_data(self.data, start, end, -dropped))
+            last_end = end
+        return BrowserRecord(concat_data(parts))
+
+    @classmethod
+    def concat(cls, records: Iterable['BrowserRecord'], gap: Optional[float] = 0.0) -> 'BrowserRecord':
+        # each record starts gap seconds after the end of the previous one, or at its own time when gap is None
+        parts, last_end = [], None
+        for record in records:
+            if gap is None or last_end is None:
+                offset = 0.0
+            else:
+                offset = last_end + gap - record.start_time
+            parts.append(clip_data(record.data, record.start_time, record.end_time, offset))
+            last_end = record.end_time + offset
+        return cls(concat_data(parts))
+
+    def save(self, file, container: bool = True):
+        write_record(self.data, file, container=container)
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @classmethod
+    def load_from_json(cls, file, lazy: bool = False):
+        if lazy:  # the file is scanned into an offset index, without decoding the frames
+            reader = JsonRecordReader(file)
+            return cls(_ContainerData(reader, lazy=True), reader=reader)
+        else:
+            with open(file, 'r') as f:
+                return cls(json.load(f))
+
+    @classmethod
+    def load_from_container(cls, file, lazy: bool = False):
+        if lazy:  # the reader is kept open, frames are only read and decoded when needed
+            reader = RecordReader(file)
+            return cls(_ContainerData(reader, lazy=True), reader=reader)
+        else:
+            with RecordReader(file) as reader:
+                return cls(dict(_ContainerData(reader, lazy=False)))
 
     @classmethod
-    def load_from_json(cls, file):
-        with open(file, 'r') as f:
-            return cls(json.load(f))
+    def load(cls, file, lazy: bool = False):
+        if is_container_file(file):
+            return cls.load_from_container(file, lazy=lazy)
+        else:
+            return cls.load_from_json(file, lazy=lazy)
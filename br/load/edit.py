@@ -0,0 +1,209 @@
+import bisect
+import json
+import os
+from typing import Mapping, List, Dict, Tuple, Iterable
+
+import numpy as np
+from hbutils.encoding import base64_encode
+
+from .vision import VisionTracker, _payload
+from ..page.vision import VisionItemType, _numpy_to_bytes
+from ..storage import RecordWriter, StreamType, pyramid_stream
+
+_VISION_STREAMS = [
+    ('page_vision', StreamType.PAGE_VISION),
+    ('system_vision', StreamType.SYSTEM_VISION),
+]
+
+# events whose last value before a cut is carried to the start of the clip
+_STATE_EVENTS = {
+    'resize': ('view_width', 'view_height'),
+    'scroll': ('scroll_x', 'scroll_y'),
+    'mousemove': ('x', 'y'),
+}
+
+
+def _clip_vision(items: List[dict], start: float, end: float, offset: float = 0.0) -> List[dict]:
+    # items in (start, end] are copied with their encoded payloads, and the frame on screen at start
+    # becomes a new frame, which is reconstructed from its keyframe only when it is a diff
+    timestamps = [item['timestamp'] for item in items]
+    first = bisect.bisect_right(timestamps, start)
+    last = bisect.bisect_right(timestamps, end)
+
+    retval = []
+    if first > 0:
+        index = first - 1
+        type_ = VisionItemType.loads(items[index]['type'])
+        if type_ == VisionItemType.NEW_FRAME:
+            data = items[index]['data']
+        else:
+            data = _numpy_to_bytes(np.ascontiguousarray(VisionTracker(items[:first])._frame(index)))
+        retval.append({'type': VisionItemType.NEW_FRAME, 'timestamp': start + offset, 'data': data})
+
+    for item in items[first:last]:
+        retval.append({'type': VisionItemType.loads(item['type']),
+                       'timestamp': item['timestamp'] + offset, 'data': item['data']})
+    return retval
+
+
+def _state_events(events: List[dict], columns: Mapping[str, Mapping[str, np.ndarray]], index: int,
+                  start: float, offset: float) -> List[dict]:
+    # last state events before the cut, moved to the start of the clip
+    latest: Dict[str, dict] = {}
+    for i in range(index - 1, -1, -1):
+        item = events[i]
+        if item['event'] in _STATE_EVENTS and item['event'] not in latest:
+            latest[item['event']] = item
+            if len(latest) == len(_STATE_EVENTS):
+                break
+
+    for event, keys in _STATE_EVENTS.items():
+        if event in columns:
+            times = np.asarray(columns[event]['time'])
+            i = int(np.searchsorted(times, start, side='left')) - 1
+            if i >= 0 and (event not in latest or times[i] > latest[event]['time']):
+                latest[event] = {'event': event, 'time': float(times[i]),
+                                 **{key: float(columns[event][key][i]) for key in keys}}
+
+    return sorted([{**item, 'time': start + offset} for item in latest.values()], key=lambda x: x['event'])
+
+
+def clip_data(data: Mapping, start: float, end: float, offset: float = 0.0) -> dict:
+    # record data of [start, end], with times moved by offset
+    start, end = max(start, data['start_time']), min(end, data['end_time'])
+    if start > end:
+        raise ValueError(f'Empty time range - [{start!r}, {end!r}].')
+
+    events = data['events']
+    times = [item['time'] for item in events]
+    first, last = bisect.bisect_left(times, start), bisect.bisect_right(times, end)
+    columns = data.get('event_columns') or {}
+
+    clipped_columns = {}
+    for event, event_columns in columns.items():
+        event_times = np.asarray(event_columns['time'])
+        mask = (event_times >= start) & (event_times <= end)
+        if mask.any():
+            clipped_columns[event] = {name: np.asarray(column, dtype=np.float64)[mask] for name, column in
+                                      event_columns.items()}
+            clipped_columns[event]['time'] = clipped_columns[event]['time'] + offset
+
+    return {
+        'start_time': start + offset,
+        'end_time': end + offset,
+        'events': [
+            *_state_events(events, columns, first, start, offset),
+            *({**item, 'time': item['time'] + offset} for item in events[first:last]),
+        ],
+        'event_columns': clipped_columns,
+        **{key: _clip_vision(data[key], start, end, offset) for key, _ in _VISION_STREAMS},
+        'pyramid': {
+            key: {scale: _clip_vision(items, start, end, offset) for scale, items in levels.items()}
+            for key, levels in (data.get('pyramid') or {}).items()
+        },
+    }
+
+
+def _common_levels(items: List[Mapping]) -> Dict[str, set]:
+    # pyramid levels which all the records have, others would be stale during the records without them
+    retval = {}
+    for key, _ in _VISION_STREAMS:
+        levels = [set(((data.get('pyramid') or {}).get(key) or {}).keys()) for data in items]
+        retval[key] = set.intersection(*levels) if levels else set()
+    return retval
+
+
+def concat_data(items: Iterable[Mapping]) -> dict:
+    # joins record data in order, times should not overlap
+    items = list(items)
+    levels = _common_levels(items)
+    retval = {'start_time': None, 'end_time': None, 'events': [], 'event_columns': {},
+              **{key: [] for key, _ in _VISION_STREAMS},
+              'pyramid': {key: {scale: [] for scale in sorted(levels[key])} for key, _ in _VISION_STREAMS}}
+    for data in items:
+        if retval['end_time'] is not None and data['start_time'] < retval['end_time']:
+            raise ValueError(f'Records overlap in time, {data["start_time"]!r} is before {retval["end_time"]!r}.')
+        if retval['start_time'] is None:
+            retval['start_time'] = data['start_time']
+        retval['end_time'] = data['end_time']
+
+        retval['events'].extend(data['events'])
+        for event, event_columns in (data.get('event_columns') or {}).items():
+            columns = retval['event_columns'].setdefault(event, {})
+            for name, column in event_columns.items():
+                columns[name] = np.concatenate([columns.get(name, np.zeros(0)), np.asarray(column, dtype=np.float64)])
+        for key, _ in _VISION_STREAMS:
+            retval[key].extend(data[key])
+            for scale, level_items in retval['pyramid'][key].items():
+                level_items.extend(data['pyramid'][key][scale])
+
+    if retval['start_time'] is None:
+        raise ValueError('No records to concatenate.')
+    return retval
+
+
+def _keep_ranges(start: float, end: float, segments: Iterable[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    # parts of [start, end] outside the dropped segments
+    retval, current = [], start
+    for seg_start, seg_end in sorted(segments):
+        if seg_start > current:
+            retval.append((current, min(seg_start, end)))
+        current = max(current, seg_end)
+        if current >= end:
+            break
+    if current < end:
+        retval.append((current, end))
+    return [(s, e) for s, e in retval if s < e]
+
+
+def _vision_to_json(items: List[dict]) -> List[dict]:
+    return [
+        {
+            'type': VisionItemType.loads(item['type']).name.lower(),
+            'timestamp': item['timestamp'],
+            'data': base64_encode(_payload(item['data'])),
+        }
+        for item in items
+    ]
+
+
+def write_record(data: Mapping, file: str, container: bool = True, event_block_size: int = 4096):
+    # payloads are written as they are, without decoding
+    if container:
+        with RecordWriter(file) as writer:
+            events = data['events']
+            for i in range(0, len(events), event_block_size):
+                writer.write_events(events[i:i + event_block_size])
+            if data.get('event_columns'):
+                writer.write_event_columns(data['event_columns'])
+
+            for key, stream in _VISION_STREAMS:
+                for item in data[key]:
+                    writer.write_vision(stream, VisionItemType.loads(item['type']), item['timestamp'],
+                                        _payload(item['data']))
+                for scale, items in ((data.get('pyramid') or {}).get(key) or {}).items():
+                    for item in items:
+                        writer.write_vision(pyramid_stream(stream, int(scale)), VisionItemType.loads(item['type']),
+                                            item['timestamp'], _payload(item['data']))
+
+            writer.close({'start_time': data['start_time'], 'end_time': data['end_time']})
+
+    else:
+        retval = {'start_time': data['start_time'], 'end_time': data['end_time'], 'events': list(data['events'])}
+        if data.get('event_columns'):
+            retval['event_columns'] = {
+                event: {name: np.asarray(column).tolist() for name, column in event_columns.items()}
+                for event, event_columns in data['event_columns'].items()
+            }
+        for key, _ in _VISION_STREAMS:
+            retval[key] = _vision_to_json(data[key])
+            for scale, items in ((data.get('pyramid') or {}).get(key) or {}).items():
+                if items:
+                    retval.setdefault('pyramid', {}).setdefault(key, {})[str(scale)] = _vision_to_json(items)
+
+        save_dir = os.path.dirname(file)
+        if save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+        with open(file, 'w') as f:
+            json.dump(retval, f, indent=4)
+
@@ -1,15 +1,20 @@
 from typing import Tuple, List, Optional
 
-from .base import _TimeBasedSequence, _SequenceCombine
+import numpy as np
 
+from .base import _ArrayTimeSequence, _SequenceCombine
 
-class CursorTracker(_TimeBasedSequence):
+
+class CursorTracker(_ArrayTimeSequence):
     def __init__(self, positions: List[Tuple[Tuple[float, float], float]]):
-        _TimeBasedSequence.__init__(self, positions)
+        _ArrayTimeSequence.__init__(self, positions)
 
     def position(self, time: float) -> Optional[Tuple[float, float]]:
         return self._get_state_on_time(time)
 
+    def positions(self, times: np.ndarray, interpolate: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        return self._get_states_on_times(times, interpolate)
+
 
 class RelCursorTracker(_SequenceCombine):
     def __init__(self, cursor: CursorTracker, view_area: 'ViewAreaTracker'):
@@ -19,34 +24,49 @@ class RelCursorTracker(_SequenceCombine):
 
     def position(self, time: float) -> Optional[Tuple[float, float]]:
         _index = self.cursor._get_index_before_time(time)
-        print(_index)
         if _index is not None:
-            (x, y), _cursor_time = self.cursor.items[_index]
-            print(x, y, _cursor_time)
+            x, y = self.cursor.values[_index].tolist()
+            _cursor_time = float(self.cursor.times[_index])
             area = self.view_area.area(_cursor_time)
             if area is not None:
                 x0, y0, _, _ = area
-                print(x0, y0)
                 return x - x0, y - y0
 
         return None
 
+    def positions(self, times: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        indices, mask = self.cursor._get_indices_before_times(times)
+        if len(self.cursor.times) == 0:
+            return np.full((len(indices), 2), np.nan), mask
+
+        areas, area_mask = self.view_area.areas(self.cursor.times[indices])
+        mask = mask & area_mask
+        positions = self.cursor.values[indices].astype(np.float64) - areas[:, :2]
+        positions[~mask] = np.nan
+        return positions, mask
+
 
-class ScrollTracker(_TimeBasedSequence):
+class ScrollTracker(_ArrayTimeSequence):
     def __init__(self, positions: List[Tuple[Tuple[float, float], float]]):
-        _TimeBasedSequence.__init__(self, positions)
+        _ArrayTimeSequence.__init__(self, positions)
 
     def position(self, time: float) -> Optional[Tuple[float, float]]:
         return self._get_state_on_time(time)
 
+    def positions(self, times: np.ndarray, interpolate: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        return self._get_states_on_times(times, interpolate)
 
-class ResizeTracker(_TimeBasedSequence):
+
+class ResizeTracker(_ArrayTimeSequence):
     def __init__(self, sizes: List[Tuple[Tuple[float, float], float]]):
-        _TimeBasedSequence.__init__(self, sizes)
+        _ArrayTimeSequence.__init__(self, sizes)
 
     def size(self, time: float) -> Optional[Tuple[float, float]]:
         return self._get_state_on_time(time)
 
+    def sizes(self, times: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return self._get_states_on_times(times)
+
 
 class ViewAreaTracker(_SequenceCombine):
     def __init__(self, scroll: ScrollTracker, resize: ResizeTracker):
@@ -62,3 +82,10 @@ class ViewAreaTracker(_SequenceCombine):
             return x, y, width, height
         else:
             return None
+
+    def areas(self, times: np.ndarray, interpolate: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        positions, position_mask = self.scroll.positions(times, interpolate)
+        sizes, size_mask = self.resize.sizes(times)
+        areas, mask = np.concatenate([positions, sizes], axis=1), position_mask & size_mask
+        areas[~mask] = np.nan  # same as area, no partial areas
+        return areas, mask
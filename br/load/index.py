@@ -0,0 +1,177 @@
+from functools import cached_property
+from typing import List, Dict, Optional, Iterable, Union, Sequence, NamedTuple, Mapping
+
+import numpy as np
+from hbutils.string import plural_word
+
+
+class EventView(Sequence):
+    # read-only sequence of events in time order, the items are the event dicts of the record, not copies
+    def __init__(self, events: List[dict], times: np.ndarray, positions: Union[range, np.ndarray]):
+        self._events = events
+        self._positions = positions
+        self.times = times
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return EventView(self._events, self.times[item], self._positions[item])
+        return self._events[int(self._positions[item])]
+
+    def __iter__(self):
+        events = self._events
+        for position in self._positions:
+            yield events[position]
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {plural_word(len(self), "event")}>'
+
+
+class NavigationSegment(NamedTuple):
+    url: Optional[str]
+    start_time: float
+    end_time: float
+
+
+class EventIndex:
+    # events grouped by type with sorted time arrays, so that a query is a binary search plus its results
+    def __init__(self, events: List[dict], event_columns: Optional[Mapping[str, Mapping[str, np.ndarray]]] = None,
+                 start_time: Optional[float] = None, end_time: Optional[float] = None):
+        times = np.array([item['time'] for item in events], dtype=np.float64)
+        if len(times) and np.any(times[1:] < times[:-1]):
+            order = np.argsort(times, kind='stable')
+            events, times = [events[i] for i in order], times[order]
+        self._events = events
+        self.times = times
+
+        positions: Dict[str, List[int]] = {}
+        for i, item in enumerate(events):
+            positions.setdefault(item['event'], []).append(i)
+        self._positions = {event: np.array(items, dtype=np.int64) for event, items in positions.items()}
+        self._times = {event: times[items] for event, items in self._positions.items()}
+
+        # high-frequency events recorded as columns, sorted once
+        self._columns: Dict[str, Dict[str, np.ndarray]] = {}
+        for event, columns in (event_columns or {}).items():
+            order = np.argsort(np.asarray(columns['time'], dtype=np.float64), kind='stable')
+            self._columns[event] = {name: np.asarray(column, dtype=np.float64)[order]
+                                    for name, column in columns.items()}
+
+        self.start_time = start_time if start_time is not None else (float(times[0]) if len(times) else None)
+        self.end_time = end_time if end_time is not None else (float(times[-1]) if len(times) else None)
+
+    @property
+    def types(self) -> List[str]:
+        return sorted({*self._positions, *self._columns})
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        counts = {event: len(positions) for event, positions in self._positions.items()}
+        for event, columns in self._columns.items():
+            counts[event] = counts.get(event, 0) + len(columns['time'])
+        return counts
+
+    def count(self, event: str, start: Optional[float] = None, end: Optional[float] = None) -> int:
+        retval = 0
+        if event in self._times:
+            lo, hi = self._range(self._times[event], start, end)
+            retval += hi - lo
+        if event in self._columns:
+            lo, hi = self._range(self._columns[event]['time'], start, end)
+            retval += hi - lo
+        return retval
+
+    @staticmethod
+    def _range(times: np.ndarray, start: Optional[float], end: Optional[float]):
+        # positions of [start, end] in sorted times
+        lo = 0 if start is None else int(np.searchsorted(times, start, side='left'))
+        hi = len(times) if end is None else int(np.searchsorted(times, end, side='right'))
+        return lo, max(lo, hi)
+
+    def of_type(self, event: str) -> EventView:
+        return self.between(None, None, [event])
+
+    def between(self, start: Optional[float] = None, end: Optional[float] = None,
+                types: Optional[Iterable[str]] = None) -> EventView:
+        # events in [start, end]. Without types, only the event dicts, the columns of compact mode are in
+        # columns_between. With types, rows of the column-backed ones are included as new event dicts
+        if types is None:
+            lo, hi = self._range(self.times, start, end)
+            return EventView(self._events, self.times[lo:hi], range(lo, hi))
+
+        types = list(dict.fromkeys([types] if isinstance(types, str) else types))
+        ranges = [(event, *self._range(self._times[event], start, end)) for event in types if event in self._positions]
+        column_types = [event for event in types if event in self._columns]
+        if len(ranges) == 1 and not column_types:
+            event, lo, hi = ranges[0]
+            return EventView(self._events, self._times[event][lo:hi], self._positions[event][lo:hi])
+
+        positions = np.sort(np.concatenate([
+            self._positions[event][lo:hi] for event, lo, hi in ranges
+        ] or [np.zeros(0, dtype=np.int64)]))
+        if not column_types:
+            return EventView(self._events, self.times[positions], positions)
+
+        events, times = [self._events[i] for i in positions], [self.times[positions]]
+        for event in column_types:
+            columns = self.columns_between(event, start, end)
+            names = list(columns)
+            for row in zip(*(columns[name].tolist() for name in names)):
+                events.append({'event': event, **dict(zip(names, row))})
+            times.append(columns['time'])
+        times = np.concatenate(times)
+        order = np.argsort(times, kind='stable')
+        return EventView(events, times[order], order)
+
+    def arrays(self, event: str, *keys: str):
+        # (times, values of keys) of event, from both the event dicts and the columns, not sorted
+        positions = self._positions.get(event, [])
+        times = self._times.get(event, np.zeros(0))
+        values = np.array([[self._events[i][key] for key in keys] for i in positions]).reshape((-1, len(keys)))
+        if event in self._columns:
+            columns = self._columns[event]
+            times = np.concatenate([times, columns['time']])
+            values = np.concatenate([values, np.stack([columns[key] for key in keys], axis=1)])
+        return times, values
+
+    def columns_between(self, event: str, start: Optional[float] = None, end: Optional[float] = None) \
+            -> Dict[str, np.ndarray]:
+        # views of the sorted columns of event in [start, end]
+        if event not in self._columns:
+            return {}
+        columns = self._columns[event]
+        lo, hi = self._range(columns['time'], start, end)
+        return {name: column[lo:hi] for name, column in columns.items()}
+
+    @cached_property
+    def navigation(self) -> List[NavigationSegment]:
+        # pages between url_change events, the last one lasts until the end of record
+        changes = self.of_type('url_change')
+        segments = []
+        if len(changes):
+            first = changes[0]
+            if first.get('last_url') is not None and self.start_time is not None and \
+                    self.start_time < changes.times[0]:
+                segments.append(NavigationSegment(first['last_url'], self.start_time, float(changes.times[0])))
+        for i, item in enumerate(changes):
+            end = float(changes.times[i + 1]) if i + 1 < len(changes) else self.end_time
+            segments.append(NavigationSegment(item.get('new_url'), float(changes.times[i]), end))
+        return segments
+
+    @cached_property
+    def _segment_starts(self) -> np.ndarray:
+        return np.array([segment.start_time for segment in self.navigation], dtype=np.float64)
+
+    def segment(self, time_: float) -> Optional[NavigationSegment]:
+        # navigation segment at time
+        i = int(np.searchsorted(self._segment_starts, time_, side='right')) - 1
+        return self.navigation[i] if i >= 0 else None
+
+    def __len__(self):
+        return len(self._events)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {plural_word(len(self), "event")}, ' \
+               f'{plural_word(len(self.types), "type")}>'
@@ -0,0 +1,61 @@
+import os
+from typing import Sequence, Dict
+
+import numpy as np
+from PIL import Image
+
+from .dispatch import BrowserRecord
+from .edit import write_record
+from .vision import _b64_to_array, apply_diff
+from ..page.vision import VisionRecorder, VisionItemType, PYRAMID_MAX_DIFF_FRAMES, _pyramid_levels
+
+_VISION_KEYS = ('page_vision', 'system_vision')
+
+
+def _reduce_chw(image_arr: np.ndarray, factor: int) -> np.ndarray:
+    # channel by channel, so the full frame is never transposed, returns (H, W, 3)
+    return np.stack([np.asarray(Image.fromarray(channel).reduce(factor)) for channel in image_arr], axis=2)
+
+
+def _pyramid_items(items, scales: Sequence[int], max_diff_frames: int) -> Dict[str, list]:
+    # replays the frames once, each diff is applied exactly once
+    recorders = {scale: VisionRecorder(max_diff_frames=max_diff_frames, scale=scale) for scale in scales}
+    image_arr = None
+    for item in items:
+        type_ = VisionItemType.loads(item['type'])
+        if type_ == VisionItemType.NEW_FRAME:
+            image_arr = _b64_to_array(item['data'])
+        elif image_arr is None:  # diffs before the first keyframe have no frame to apply to
+            continue
+        else:
+            apply_diff(image_arr, type_, _b64_to_array(item['data']))
+
+        first = scales[0]
+        lab = _reduce_chw(image_arr, first)
+        recorders[first].append_lab(lab, item['timestamp'])
+        for scale, level_lab in _pyramid_levels(lab, [scale // first for scale in scales[1:]]):
+            recorders[scale * first].append_lab(level_lab, item['timestamp'])
+
+    return {
+        str(scale): [{'type': item.type, 'timestamp': item.timestamp, 'data': item.to_bytes()}
+                     for item in recorder._records]
+        for scale, recorder in recorders.items()
+    }
+
+
+def build_pyramid(input_file: str, output_file: str, scales: Sequence[int] = (4, 16),
+                  max_diff_frames: int = PYRAMID_MAX_DIFF_FRAMES, container: bool = True) -> Dict[str, dict]:
+    # adds downsampled tracks to an existing record, the other payloads are copied as they are
+    scales = sorted(set(scales))
+    for scale in scales:
+        if scale < 2 or scale & (scale - 1):
+            raise ValueError(f'Pyramid scale should be a power of 2, but {scale!r} found.')
+    if os.path.abspath(input_file) == os.path.abspath(output_file):
+        raise ValueError(f'Output file should not be the input file - {output_file!r}.')
+
+    with BrowserRecord.load(input_file, lazy=True) as record:
+        data = record.data
+        pyramid = {key: _pyramid_items(data[key], scales, max_diff_frames) for key in _VISION_KEYS}
+        write_record({**data, 'pyramid': pyramid}, output_file, container=container)
+
+    return {key: {scale: len(items) for scale, items in levels.items()} for key, levels in pyramid.items()}
@@ -1,53 +1,333 @@
 import io
 import zlib
+from functools import lru_cache
+from typing import Union, Optional, Iterator, Tuple, Mapping, Dict
 
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageCms
 from hbutils.encoding import base64_decode
 
 from .base import _TimeBasedSequence, _SequenceCombine
+from .cache import FrameCache
 from .events import ViewAreaTracker
-from ..page.vision import VisionItemType
+from ..page.vision import VisionItemType, _unpack_tile_diff
+from ..storage import PayloadRef
 
 
-def _b64_to_array(b64_text: str):
-    b64_binary = zlib.decompress(base64_decode(b64_text))
-    with io.BytesIO(b64_binary) as bio:
+# (x, y, width, height), the same as ViewAreaTracker.area
+Region = Tuple[int, int, int, int]
+
+
+def _payload(b64_text: Union[str, bytes, PayloadRef]) -> bytes:
+    # compressed payload, raw payloads from record containers are not base64-encoded
+    if isinstance(b64_text, PayloadRef):  # lazy reference into a record container
+        b64_text = b64_text.read()
+    return base64_decode(b64_text) if isinstance(b64_text, str) else b64_text
+
+
+def _b64_to_array(b64_text: Union[str, bytes, PayloadRef]):
+    with io.BytesIO(zlib.decompress(_payload(b64_text))) as bio:
         return np.load(bio, allow_pickle=True)
 
 
+_DECOMPRESS_CHUNK = 1 << 20
+
+
+def _read_frame_header(head: bytes) -> Optional[Tuple[Tuple[int, ...], np.dtype, int]]:
+    # (shape, dtype, offset of data) from the beginning of a decompressed (C, H, W) frame,
+    # None when the layout is not a plain C-ordered array
+    with io.BytesIO(head) as bio:
+        version = np.lib.format.read_magic(bio)
+        if version not in ((1, 0), (2, 0)):
+            return None
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) \
+            else np.lib.format.read_array_header_2_0
+        shape, fortran_order, dtype = read_header(bio)
+        offset = bio.tell()
+    if fortran_order or len(shape) != 3 or dtype.hasobject:
+        return None
+    return shape, dtype, offset
+
+
+def _frame_shape(b64_text: Union[str, bytes, PayloadRef]) -> Tuple[int, ...]:
+    # (C, H, W) of a new frame, only its header is decompressed
+    header = _read_frame_header(zlib.decompressobj().decompress(_payload(b64_text), 1 << 12))
+    return header[0] if header is not None else _b64_to_array(b64_text).shape
+
+
+def _b64_to_frame_region(b64_text: Union[str, bytes, PayloadRef], x0: int, y0: int, x1: int, y1: int) \
+        -> np.ndarray:
+    # rows y0:y1 and columns x0:x1 of a (C, H, W) frame. The payload is decompressed as a stream,
+    # only the needed rows are kept, and decompression stops after the last needed row
+    decompressor = zlib.decompressobj()
+    data = _payload(b64_text)
+    head = decompressor.decompress(data, 1 << 16)
+    header = _read_frame_header(head)
+    if header is None:
+        return _b64_to_array(b64_text)[:, y0:y1, x0:x1]
+    shape, dtype, offset = header
+
+    channels, height, width = shape
+    y1, x1 = min(y1, height), min(x1, width)
+    rows = max(y1 - y0, 0)
+    row_bytes = width * dtype.itemsize
+    retval = np.empty((channels, rows, width), dtype=dtype)
+    if not rows:
+        return retval[:, :, x0:x1]
+
+    out = retval.reshape(-1).view(np.uint8)
+    # byte ranges of the needed rows in each channel, and where they go in the output
+    spans = [(c * height * row_bytes + y0 * row_bytes, c * rows * row_bytes) for c in range(channels)]
+    span_length = rows * row_bytes
+    end = spans[-1][0] + span_length
+
+    buffer, position = head[offset:], 0
+    unconsumed = decompressor.unconsumed_tail
+    while True:
+        for src, dst in spans:
+            lo, hi = max(src, position), min(src + span_length, position + len(buffer))
+            if lo < hi:
+                out[dst + lo - src:dst + hi - src] = np.frombuffer(buffer, dtype=np.uint8, count=hi - lo,
+                                                                   offset=lo - position)
+        position += len(buffer)
+        if position >= end or (not unconsumed and decompressor.eof):
+            break
+        buffer = decompressor.decompress(unconsumed, _DECOMPRESS_CHUNK)
+        unconsumed = decompressor.unconsumed_tail
+        if not buffer and not unconsumed:
+            break
+
+    return retval[:, :, x0:x1]
+
+
+def _apply_pixel_diff(image_arr: np.ndarray, diff_arr: np.ndarray, x0: int = 0, y0: int = 0):
+    # image_arr may be a region of the frame with its top left corner at (x0, y0)
+    xs, ys, values = diff_arr[0].astype(np.int64) - y0, diff_arr[1].astype(np.int64) - x0, diff_arr[2]
+    if x0 or y0 or diff_arr.shape[1] and (xs.max() >= image_arr.shape[1] or ys.max() >= image_arr.shape[2]):
+        inside = (xs >= 0) & (xs < image_arr.shape[1]) & (ys >= 0) & (ys < image_arr.shape[2])
+        xs, ys, values = xs[inside], ys[inside], values[inside]
+    image_arr[0, xs, ys] = ((values >> 16) & 0xff).astype(np.uint8)
+    image_arr[1, xs, ys] = ((values >> 8) & 0xff).astype(np.uint8)
+    image_arr[2, xs, ys] = ((values >> 0) & 0xff).astype(np.uint8)
+
+
+def _apply_tile_diff(image_arr: np.ndarray, diff_arr: np.ndarray, x0: int = 0, y0: int = 0):
+    tile_size, tile_mask, blocks = _unpack_tile_diff(diff_arr)
+    _, height, width = image_arr.shape
+    rows, cols = np.nonzero(tile_mask)
+    ys, xs = rows * tile_size - y0, cols * tile_size - x0
+    # only the dirty tiles overlapping the region
+    selected = np.nonzero((ys < height) & (ys + tile_size > 0) & (xs < width) & (xs + tile_size > 0))[0]
+    for i in selected.tolist():
+        ty, tx = int(ys[i]), int(xs[i])
+        ty0, tx0 = max(ty, 0), max(tx, 0)
+        ty1, tx1 = min(ty + tile_size, height), min(tx + tile_size, width)
+        image_arr[:, ty0:ty1, tx0:tx1] = blocks[i, :, ty0 - ty:ty1 - ty, tx0 - tx:tx1 - tx]
+
+
+def apply_diff(image_arr: np.ndarray, type_: VisionItemType, diff_arr: np.ndarray, x0: int = 0, y0: int = 0):
+    if type_ == VisionItemType.TILE_DIFF_FRAME:
+        _apply_tile_diff(image_arr, diff_arr, x0, y0)
+    elif type_ == VisionItemType.DIFF_FRAME:
+        _apply_pixel_diff(image_arr, diff_arr, x0, y0)
+    else:
+        raise ValueError(f'Not a diff frame - {type_!r}.')
+
+
+@lru_cache()
+def _lab_to_rgb_transform() -> ImageCms.ImageCmsTransform:
+    # the same transform as Image.convert, which builds it again on each call (about 20ms)
+    return ImageCms.buildTransform(ImageCms.createProfile('LAB'), ImageCms.createProfile('sRGB'), 'LAB', 'RGB')
+
+
+def lab_to_image(image_arr: np.ndarray) -> Image.Image:
+    return _lab_to_rgb_transform().apply(Image.fromarray(image_arr.transpose((1, 2, 0)), mode='LAB'))
+
+
+def _region_bounds(region: Optional[Region]) -> Optional[Tuple[int, int, int, int]]:
+    # (x0, y0, x1, y1) inside the page, the right and bottom sides are clipped when decoding
+    if region is None:
+        return None
+    x, y, width, height = (int(round(v)) for v in region)
+    return max(x, 0), max(y, 0), max(x + width, 0), max(y + height, 0)
+
+
+def _scale_region(region: Region, scale: int) -> Region:
+    x, y, width, height = (int(round(v)) for v in region)
+    return x // scale, y // scale, -(-width // scale), -(-height // scale)
+
+
 class VisionTracker(_TimeBasedSequence):
-    def __init__(self, data):
+    def __init__(self, data, max_cache_bytes: int = 256 * 1024 ** 2, pyramid: Optional[Mapping[int, list]] = None):
         _TimeBasedSequence.__init__(self, [
             ((VisionItemType.loads(item['type']), item['data']), item['timestamp']) for item in data
         ])
+        self.cache = FrameCache(max_cache_bytes)
+        # downsampled tracks of the same frames, {scale: items}
+        self.pyramid: Dict[int, VisionTracker] = {
+            int(scale): VisionTracker(items, max_cache_bytes // 4)
+            for scale, items in sorted((pyramid or {}).items(), key=lambda x: int(x[0])) if items
+        }
+
+    def _level(self, scale: float) -> Tuple[int, 'VisionTracker']:
+        # the most downsampled track which is still not smaller than the result
+        level, tracker = 1, self
+        for level_scale, level_tracker in self.pyramid.items():
+            if level_scale <= scale:
+                level, tracker = level_scale, level_tracker
+        return level, tracker
+
+    def _item(self, index: int):
+        (type_, b64_text), _ = self.items[index]
+        return type_, b64_text
+
+    def iter_items(self, start: int = 0, end: Optional[int] = None, frames: bool = True) \
+            -> Iterator[Tuple[VisionItemType, Optional[np.ndarray], float]]:
+        # (type, array, timestamp) of the items in [start, end), decompressed but not applied to a frame.
+        # new frames are LAB arrays of shape (3, H, W), diffs are in their encodings, see apply_diff.
+        # with frames=False, new frames are None, so only the diffs are decompressed
+        for index in range(start, len(self) if end is None else end):
+            (type_, b64_text), timestamp = self.items[index]
+            if type_ == VisionItemType.NEW_FRAME and not frames:
+                yield type_, None, timestamp
+            else:
+                yield type_, _b64_to_array(b64_text), timestamp
+
+    def _cached(self, index: int, bounds: Optional[Tuple[int, int, int, int]]) -> Optional[np.ndarray]:
+        # the region can also be cropped from the cached full frame
+        if bounds is None:
+            return self.cache.get(index)
+        cached = self.cache.get((index, bounds))
+        if cached is None:
+            full = self.cache.get(index)
+            if full is not None:
+                x0, y0, x1, y1 = bounds
+                cached = full[:, y0:y1, x0:x1]
+        return cached
+
+    def _frame(self, index: int, region: Optional[Region] = None) -> np.ndarray:
+        # reconstructed frames (or regions of them) are cached, the result is read-only.
+        # for a region, only its rows are decoded and only the diffs overlapping it are applied
+        bounds = _region_bounds(region)
+        key = index if bounds is None else (index, bounds)
+        cached = self._cached(index, bounds)
+        if cached is not None:
+            return cached
+
+        start_index = index
+        base = None
+        while start_index > 0:
+            type_, _ = self._item(start_index)
+            if type_ == VisionItemType.NEW_FRAME:
+                break
+            if start_index != index:
+                base = self._cached(start_index, bounds)
+                if base is not None:
+                    break
+            start_index -= 1
+
+        if base is not None:
+            image_arr = base.copy()
+        else:
+            type_, b64_text = self._item(start_index)
+            assert type_ == VisionItemType.NEW_FRAME
+            if bounds is None:
+                image_arr = _b64_to_array(b64_text)
+            else:
+                image_arr = _b64_to_frame_region(b64_text, *bounds)
+
+        x0, y0 = bounds[:2] if bounds is not None else (0, 0)
+        for i in range(start_index + 1, index + 1):
+            type_, b64_text = self._item(i)
+            apply_diff(image_arr, type_, _b64_to_array(b64_text), x0, y0)
+
+        self.cache.put(key, image_arr)
+        return image_arr
 
-    def vision(self, time: float):
+    def vision_array(self, time: float, region: Optional[Region] = None) -> Optional[np.ndarray]:
+        # LAB array of shape (3, H, W), region (x, y, width, height) is clipped to the page
         index = self._get_index_before_time(time)
         if index is None:
             return None
+        return self._frame(index, region)
 
-        new_index = index
-        while new_index > 0:
-            (type_, _), _ = self.items[new_index]
-            if type_ == VisionItemType.NEW_FRAME:
-                break
-            new_index -= 1
+    def vision(self, time: float, region: Optional[Region] = None, scale: float = 1):
+        # with scale, e.g. 16 for 1/16 of the size, the image is served from the nearest pyramid level,
+        # region is still in full resolution coordinates
+        if scale > 1:
+            return self._scaled_vision(time, region, scale)
+
+        image_arr = self.vision_array(time, region)
+        if image_arr is None:
+            return None
+        image = lab_to_image(image_arr)  # colour conversion only on the region
+
+        if region is not None:  # same as Image.crop, the area outside the page is black
+            x, y, width, height = (int(round(v)) for v in region)
+            if image.size != (width, height):
+                x0, y0, _, _ = _region_bounds(region)
+                canvas = Image.new('RGB', (width, height))
+                canvas.paste(image, (x0 - x, y0 - y))
+                image = canvas
+        return image
+
+    def _scaled_vision(self, time: float, region: Optional[Region], scale: float):
+        level, tracker = self._level(scale)
+        image = tracker.vision(time, None if region is None else _scale_region(region, level))
+        if image is None:
+            return None
 
-        (type_, b64_text), _ = self.items[new_index]
-        assert type_ == VisionItemType.NEW_FRAME
-        image_arr = _b64_to_array(b64_text)
+        if region is not None:
+            _, _, width, height = (int(round(v)) for v in region)
+        else:
+            width, height = image.width * level, image.height * level
+        size = (max(int(np.ceil(width / scale)), 1), max(int(np.ceil(height / scale)), 1))
+        if image.size != size:
+            image = image.resize(size, Image.BOX)
+        return image
 
-        for i in range(new_index + 1, index + 1):
-            (type_, b64_text), _ = self.items[i]
-            assert type_ == VisionItemType.DIFF_FRAME
-            diff_arr = _b64_to_array(b64_text)
-            xs, ys = diff_arr[0], diff_arr[1]
-            image_arr[0, xs, ys] = ((diff_arr[2] >> 16) & 0xff).astype(np.uint8)
-            image_arr[1, xs, ys] = ((diff_arr[2] >> 8) & 0xff).astype(np.uint8)
-            image_arr[2, xs, ys] = ((diff_arr[2] >> 0) & 0xff).astype(np.uint8)
+    def iter_frames(self, start: Optional[float] = None, end: Optional[float] = None, fps: float = 10.0,
+                    region: Optional[Region] = None) -> Iterator[Tuple[float, Optional[np.ndarray]]]:
+        # sequential playback, keeps the running image so that each diff frame is applied exactly once,
+        # yields (time, LAB array of shape (3, H, W)) without the conversion to RGB
+        if not fps > 0:
+            raise ValueError(f'Fps should be positive, but {fps!r} found.')
+        return self._iter_frames(start, end, fps, region)
 
-        return Image.fromarray(image_arr.transpose((1, 2, 0)), mode='LAB').convert('RGB')
+    def _iter_frames(self, start: Optional[float], end: Optional[float], fps: float, region: Optional[Region]):
+        start = self.start_time if start is None else start
+        end = self.end_time if end is None else end
+        bounds = _region_bounds(region)
+        x0, y0 = bounds[:2] if bounds is not None else (0, 0)
+
+        image_arr, current = None, None
+        for i in range(int(np.floor((end - start) * fps + 1e-9)) + 1):
+            time_ = start + i / fps
+            index = self._get_index_before_time(time_)
+            if index is None:
+                yield time_, None
+                continue
+
+            if current is None or index < current:
+                image_arr, current = self._frame(index, region).copy(), index
+            elif index > current:
+                first = current + 1
+                for j in range(index, current, -1):  # skip whole gops when jumping over a new frame
+                    type_, _ = self._item(j)
+                    if type_ == VisionItemType.NEW_FRAME:
+                        first = j
+                        break
+
+                for j in range(first, index + 1):
+                    type_, b64_text = self._item(j)
+                    if type_ == VisionItemType.NEW_FRAME:
+                        image_arr = _b64_to_array(b64_text) if bounds is None \
+                            else _b64_to_frame_region(b64_text, *bounds)
+                    else:
+                        apply_diff(image_arr, type_, _b64_to_array(b64_text), x0, y0)
+                current = index
+
+            yield time_, image_arr.copy()
 
 
 class VisibleTracker(_SequenceCombine):
@@ -56,9 +336,18 @@ class VisibleTracker(_SequenceCombine):
         self._view_area = view_area
         _SequenceCombine.__init__(self, self._vision, self._view_area)
 
-    def vision(self, time: float):
-        full_image = self._vision.vision(time)
+    @property
+    def full_page(self) -> VisionTracker:
+        # frames of the full page, in page coordinates
+        return self._vision
+
+    def vision(self, time: float, region: Optional[Region] = None, scale: float = 1):
+        # only the viewport (or the region relative to it) is reconstructed and converted
         area = self._view_area.area(time)
-        if full_image and area:
-            x, y, width, height = area
-            return full_image.crop((x, y, x + width, y + height))
+        if area is None:
+            return None
+        x, y, width, height = area
+        if region is not None:
+            rx, ry, width, height = region
+            x, y = x + rx, y + ry
+        return self._vision.vision(time, region=(x, y, width, height), scale=scale)
@@ -1 +1,4 @@
-from .monitor import add_monitor, read_event_records, WebDriverMonitor
+from .backend import CaptureBackend, Html2CanvasBackend, ScreenshotBackend, ScreencastBackend, \
+    get_capture_backend
+from .host import RecordingHost
+from .monitor import add_monitor, read_event_records, drain_all, is_headless, WebDriverMonitor
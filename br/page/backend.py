@@ -0,0 +1,218 @@
+import io
+import json
+import logging
+import time
+from typing import List, Tuple, Any, Optional, Callable
+
+import numpy as np
+from PIL import Image
+from hbutils.encoding import base64_decode
+from selenium.common import WebDriverException
+from selenium.webdriver.remote.webdriver import WebDriver
+
+from .vision import _base64_url_to_lab, _image_to_lab
+
+
+def _base64_to_lab(data: str) -> np.ndarray:
+    # raw base64 of png or jpeg, as returned by the devtools protocol
+    with io.BytesIO(base64_decode(data)) as bio:
+        image = Image.open(bio)
+        image.load()
+        return _image_to_lab(image)
+
+
+class CaptureBackend:
+    # source of page frames, polled by the monitor in its event loop.
+    # to_lab runs in the encode pool, compose runs in submission order before diffing.
+    name: str = 'none'
+    uses_html2canvas: bool = False
+    interval: Optional[float] = None  # seconds between captures, None when the browser decides
+
+    def start(self, driver: WebDriver):
+        pass
+
+    def poll(self, driver: WebDriver, state: dict, ready: bool = True) -> List[Tuple[Any, float]]:
+        # returns (raw frame, timestamp) pairs, ready is False when the encode queue is full
+        raise NotImplementedError  # pragma: no cover
+
+    def stop(self, driver: WebDriver):
+        pass
+
+    @property
+    def to_lab(self) -> Callable[[Any], np.ndarray]:
+        raise NotImplementedError  # pragma: no cover
+
+    def compose(self, lab: Any) -> np.ndarray:
+        return lab
+
+
+class Html2CanvasBackend(CaptureBackend):
+    # full page rendered by html2canvas inside the page, shipped as png data urls by drainAll
+    name = 'html2canvas'
+    uses_html2canvas = True
+
+    def __init__(self, interval: float = 0.2):
+        # only used to reschedule html2canvas in page, see drain_all
+        self.interval = interval
+
+    def poll(self, driver: WebDriver, state: dict, ready: bool = True) -> List[Tuple[Any, float]]:
+        return [(item['raw'], item['time']) for item in state['screenshots']]
+
+    @property
+    def to_lab(self):
+        return _base64_url_to_lab
+
+
+class ScreenshotBackend(CaptureBackend):
+    # full page captured by the browser with Page.captureScreenshot, nothing runs in the page thread
+    name = 'screenshot'
+
+    def __init__(self, interval: float = 0.2, format: str = 'png', quality: int = 80):
+        self.interval = interval
+        self.format = format
+        self.quality = quality
+        self._last_time = None
+
+    def poll(self, driver: WebDriver, state: dict, ready: bool = True) -> List[Tuple[Any, float]]:
+        if not ready or (self._last_time is not None and time.time() - self._last_time < self.interval):
+            return []
+
+        metrics = driver.execute_cdp_cmd('Page.getLayoutMetrics', {})
+        content = metrics.get('cssContentSize') or metrics['contentSize']
+        params = {
+            'format': self.format,
+            'captureBeyondViewport': True,
+            'clip': {'x': 0, 'y': 0, 'width': content['width'], 'height': content['height'], 'scale': 1},
+        }
+        if self.format == 'jpeg':
+            params['quality'] = self.quality
+
+        timestamp = time.time()
+        result = driver.execute_cdp_cmd('Page.captureScreenshot', params)
+        self._last_time = timestamp
+        return [(result['data'], timestamp)]
+
+    @property
+    def to_lab(self):
+        return _base64_to_lab
+
+
+class ScreencastBackend(CaptureBackend):
+    # viewport frames pushed by the browser with Page.startScreencast, read from the performance log.
+    # the browser sends no more frames until the last one is acked, so acks are held back while the
+    # encode queue is full. Viewport frames are placed into a page canvas at their scroll offset,
+    # so the recorded frames have the same page coordinates as the html2canvas ones.
+    name = 'screencast'
+
+    def __init__(self, format: str = 'jpeg', quality: int = 80, every_nth_frame: int = 1,
+                 max_width: Optional[int] = None, max_height: Optional[int] = None):
+        self.format = format
+        self.quality = quality
+        self.every_nth_frame = every_nth_frame
+        self.max_width = max_width
+        self.max_height = max_height
+
+        self._pending_acks: List[int] = []
+        self._last_timestamp: Optional[float] = None
+        self._canvas: Optional[np.ndarray] = None
+
+    def start(self, driver: WebDriver):
+        try:
+            driver.get_log('performance')  # drop the old entries
+        except WebDriverException as err:
+            raise RuntimeError('Performance log is required by screencast backend, '
+                               'please enable goog:loggingPrefs {"performance": "ALL"} on the driver.') from err
+
+        params = {'format': self.format, 'everyNthFrame': self.every_nth_frame}
+        if self.format == 'jpeg':
+            params['quality'] = self.quality
+        if self.max_width:
+            params['maxWidth'] = self.max_width
+        if self.max_height:
+            params['maxHeight'] = self.max_height
+        driver.execute_cdp_cmd('Page.startScreencast', params)
+
+    def _ack(self, driver: WebDriver):
+        acks, self._pending_acks = self._pending_acks, []
+        for session_id in acks:
+            driver.execute_cdp_cmd('Page.screencastFrameAck', {'sessionId': session_id})
+
+    def poll(self, driver: WebDriver, state: dict, ready: bool = True) -> List[Tuple[Any, float]]:
+        frames = []
+        for entry in driver.get_log('performance'):
+            message = json.loads(entry['message'])['message']
+            if message.get('method') != 'Page.screencastFrame':
+                continue
+
+            params = message['params']
+            metadata = params['metadata']
+            timestamp = metadata.get('timestamp') or entry['timestamp'] / 1000.0
+            if self._last_timestamp is not None:
+                timestamp = max(timestamp, self._last_timestamp)
+            self._last_timestamp = timestamp
+            self._pending_acks.append(params['sessionId'])
+            frames.append(((params['data'], metadata), timestamp))
+
+        if ready:
+            self._ack(driver)
+        return frames
+
+    def stop(self, driver: WebDriver):
+        try:
+            self._ack(driver)
+            driver.execute_cdp_cmd('Page.stopScreencast', {})
+        except WebDriverException:
+            logging.warning('Unable to stop screencast, the browser may be closed.')
+
+    @property
+    def to_lab(self):
+        return self._frame_to_lab
+
+    @staticmethod
+    def _frame_to_lab(frame) -> Tuple[np.ndarray, Tuple[int, int]]:
+        data, metadata = frame
+        with io.BytesIO(base64_decode(data)) as bio:
+            image = Image.open(bio)
+            image.load()
+
+        # frames are in device pixels, while the page coordinates are css pixels
+        size = (int(round(metadata['deviceWidth'])), int(round(metadata['deviceHeight'])))
+        if image.size != size:
+            image = image.resize(size, Image.BILINEAR)
+        offset = (int(round(metadata.get('scrollOffsetX', 0))), int(round(metadata.get('scrollOffsetY', 0))))
+        return _image_to_lab(image), offset
+
+    def compose(self, lab) -> np.ndarray:
+        view, (x, y) = lab
+        height, width, _ = view.shape
+        if self._canvas is None:
+            canvas = np.zeros((y + height, x + width, 3), dtype=np.uint8)
+        elif self._canvas.shape[0] < y + height or self._canvas.shape[1] < x + width:
+            # the canvas grows when the viewport reaches a part of the page not seen before
+            ch, cw, _ = self._canvas.shape
+            canvas = np.zeros((max(ch, y + height), max(cw, x + width), 3), dtype=np.uint8)
+            canvas[:ch, :cw] = self._canvas
+        else:  # always a new array, the recorder keeps a reference to the previous one
+            canvas = self._canvas.copy()
+
+        canvas[y:y + height, x:x + width] = view
+        self._canvas = canvas
+        return canvas
+
+
+_BACKENDS = {
+    'html2canvas': Html2CanvasBackend,
+    'screenshot': ScreenshotBackend,
+    'screencast': ScreencastBackend,
+}
+
+
+def get_capture_backend(backend, **kwargs) -> CaptureBackend:
+    if isinstance(backend, CaptureBackend):
+        return backend
+    elif isinstance(backend, str):
+        if backend not in _BACKENDS:
+            raise ValueError(f'Unknown capture backend - {backend!r}.')
+        return _BACKENDS[backend](**kwargs)
+    else:
+        raise TypeError(f'Unknown capture backend - {backend!r}.')
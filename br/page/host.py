@@ -0,0 +1,331 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, Executor, Future
+from threading import Condition, Event, Lock, Thread
+from typing import Optional, Dict, List, Callable
+
+from selenium.webdriver.remote.webdriver import WebDriver
+
+from .monitor import WebDriverMonitor
+from ..utils import capture_screen_array, close_x11_grabber
+
+
+class _Session:
+    # a monitor with its place in the polling schedule
+    def __init__(self, name: str, monitor: WebDriverMonitor):
+        self.name = name
+        self.monitor = monitor
+        self.ticks = 0
+        self.busy = 0.0  # seconds spent in polling ticks
+        self.end_time: Optional[float] = None
+        self.error: Optional[str] = None
+        self.finished = Event()
+
+
+class _CountingExecutor(Executor):
+    # the shared encode pool, with the number of submitted tasks which are not done yet
+    def __init__(self, executor: Executor):
+        self._executor = executor
+        self._lock = Lock()
+        self.pending = 0
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        with self._lock:
+            self.pending += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, _):
+        with self._lock:
+            self.pending -= 1
+
+    def shutdown(self, wait: bool = True, **kwargs):
+        self._executor.shutdown(wait, **kwargs)
+
+
+class RecordingHost:
+    # records many browsers from one process. Instead of the threads and encoders of each monitor,
+    # the polling ticks of all the sessions run on poll_workers threads in deadline order, and the
+    # frames of all the sessions are encoded by one pool sized to the cores
+    def __init__(self, poll_workers: Optional[int] = None, encode_workers: Optional[int] = None,
+                 system_capture: bool = False, system_view_interval: float = 1.0,
+                 metrics_interval: float = 5.0, metrics_callback: Optional[Callable[[dict], None]] = None,
+                 metrics_file: Optional[str] = None):
+        cores = os.cpu_count() or 1
+        # polling mostly waits for the webdriver round trip, encoding is cpu bound
+        self.poll_workers = poll_workers or min(32, cores * 2)
+        self.encode_workers = encode_workers or cores
+        self._executor = _CountingExecutor(
+            ThreadPoolExecutor(max_workers=self.encode_workers, thread_name_prefix='host-encode'))
+        # sessions are finished (encoders drained and records saved) off the polling workers
+        self._finisher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='host-finish')
+
+        # one screen capture is shared by all the sessions which record system_vision,
+        # a session only does when the host does and its browser is not headless
+        self.system_capture = system_capture
+        self.system_view_interval = system_view_interval
+
+        self.metrics_interval = metrics_interval
+        self.metrics_callback = metrics_callback
+        self.metrics_file = metrics_file
+
+        self._sessions: Dict[str, _Session] = {}
+        self._heap: List[tuple] = []  # (due time, sequence, session), earliest deadline first
+        self._seq = itertools.count()
+        self._cond = Condition()
+        self._lock = Lock()
+        self._started = False
+        self._closed = False
+        self._stop_signal = Event()
+        self._start_time: Optional[float] = None
+        self._start_cpu: Optional[float] = None
+
+        self._workers = [Thread(target=self._poll_loop, name=f'host-poll-{i}', daemon=True)
+                         for i in range(self.poll_workers)]
+        self._t_system = Thread(target=self._system_loop, name='host-system', daemon=True)
+        self._t_metrics = Thread(target=self._metrics_report, name='host-metrics', daemon=True)
+
+    def add(self, driver: WebDriver, save_as: str, name: Optional[str] = None, **kwargs) -> WebDriverMonitor:
+        # kwargs are passed to WebDriverMonitor, frames are dropped instead of blocking the shared workers
+        name = name if name is not None else f'session-{len(self._sessions)}'
+        if name in self._sessions:
+            raise KeyError(f'Session already exists - {name!r}.')
+        kwargs.setdefault('overflow_policy', 'degrade')
+        kwargs.setdefault('system_capture', None if self.system_capture else False)
+        kwargs.setdefault('system_view_interval', self.system_view_interval)
+        monitor = WebDriverMonitor(driver, save_as, encode_executor=self._executor, **kwargs)
+        session = _Session(name, monitor)
+        with self._lock:
+            self._sessions[name] = session
+            if self._started:
+                self._open(session)
+        return monitor
+
+    @property
+    def sessions(self) -> Dict[str, WebDriverMonitor]:
+        return {name: session.monitor for name, session in self._sessions.items()}
+
+    def _open(self, session: _Session):
+        monitor = session.monitor
+        monitor._open()
+        monitor._start_time = time.time()
+        self._schedule(session, monitor._start_time)
+
+    def _schedule(self, session: _Session, due: float):
+        with self._cond:
+            heapq.heappush(self._heap, (due, next(self._seq), session))
+            self._cond.notify()
+
+    def _poll_loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._heap:
+                        if self._closed:
+                            return
+                        self._cond.wait()
+                        continue
+                    due, _, session = self._heap[0]
+                    wait = due - time.time()
+                    if wait <= 0:
+                        heapq.heappop(self._heap)
+                        break
+                    self._cond.wait(wait)
+            self._tick(session, due)
+
+    def _tick(self, session: _Session, due: float):
+        # a session is either in the heap or in one tick, so its ticks never run concurrently
+        monitor = session.monitor
+        if not monitor._stop_signal.is_set():
+            monitor.metrics.observe('host.lateness', max(time.time() - due, 0.0))
+            start = time.perf_counter()
+            try:
+                alive = monitor._poll_page()
+            except Exception as err:
+                logging.exception(f'Session {session.name!r} failed, stopping it.')
+                session.error = f'{type(err).__name__}: {err}'
+                alive = False
+            session.busy += time.perf_counter() - start
+            session.ticks += 1
+
+            if alive and not monitor._stop_signal.is_set():
+                next_due, now = due + monitor._poll_interval(), time.time()
+                if next_due < now:  # late sessions go behind the ones already waiting, instead of catching up
+                    monitor.metrics.count('page.overruns')
+                    monitor.metrics.observe('page.overrun', now - next_due)
+                    next_due = now
+                self._schedule(session, next_due)
+                return
+
+        monitor._stop_signal.set()
+        session.end_time = time.time()
+        self._finisher.submit(self._finish, session)
+
+    def _finish(self, session: _Session):
+        monitor = session.monitor
+        monitor._end_time = session.end_time
+        try:
+            monitor._close_capture()
+            monitor._save_result()
+            if monitor.metrics_callback is not None or monitor.metrics_file is not None:
+                monitor._report_metrics()
+        except Exception as err:
+            logging.exception(f'Failed to save session {session.name!r}.')
+            session.error = f'{type(err).__name__}: {err}'
+        finally:
+            session.finished.set()
+
+    def _system_loop(self):
+        # each session is due at the interval of its own scheduler, so adaptive sessions capture faster
+        # while active, and the screen is captured once for all the sessions which are due
+        due: Dict[WebDriverMonitor, float] = {}
+        try:
+            while not self._stop_signal.is_set():
+                monitors = [session.monitor for session in list(self._sessions.values())
+                            if session.monitor.system_capture and not session.monitor._stop_signal.is_set()]
+                due = {monitor: due[monitor] for monitor in monitors if monitor in due}
+                now = time.time()
+                ready = [monitor for monitor in monitors if due.get(monitor, now) <= now]
+                if ready:
+                    image, timestamp = capture_screen_array()
+                    for monitor in ready:
+                        due[monitor] = timestamp + monitor._submit_system_frame(image, timestamp)
+
+                _duration = min(due.values(), default=now + self.system_view_interval) - time.time()
+                if _duration > 0:
+                    self._stop_signal.wait(_duration)
+        finally:  # the display connection and shm segment of this thread
+            close_x11_grabber()
+
+    def _stop_session(self, session: _Session):
+        session.monitor._stop_signal.set()
+        with self._cond:  # finished by the next worker instead of waiting for its due time
+            self._heap = [(0.0 if item[2] is session else item[0], *item[1:]) for item in self._heap]
+            heapq.heapify(self._heap)
+            self._cond.notify_all()
+
+    def remove(self, name: str, wait: bool = True):
+        # stops one session, its record is saved while the others go on
+        session = self._sessions[name]
+        if self._started:
+            self._stop_session(session)
+            if wait:
+                session.finished.wait()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                raise RuntimeError('Recording host is already started.')
+            self._started = True
+            self._start_time, self._start_cpu = time.time(), time.process_time()
+            for session in self._sessions.values():
+                self._open(session)
+            for worker in self._workers:
+                worker.start()
+            if self.system_capture:
+                self._t_system.start()
+            if self.metrics_callback is not None or self.metrics_file is not None:
+                self._t_metrics.start()
+
+    def stop(self):
+        with self._lock:
+            if not self._started or self._closed:
+                return
+            for session in self._sessions.values():
+                self._stop_session(session)
+            for session in self._sessions.values():
+                session.finished.wait()
+
+            self._stop_signal.set()
+            with self._cond:
+                self._closed = True
+                self._cond.notify_all()
+            for worker in self._workers:
+                worker.join()
+            if self._t_system.is_alive():
+                self._t_system.join()
+            if self._t_metrics.is_alive():
+                self._t_metrics.join()
+            self._finisher.shutdown()
+            self._executor.shutdown()
+            self._report_metrics()
+
+    def _session_stats(self, session: _Session) -> dict:
+        monitor = session.monitor
+        if monitor._start_time is None:
+            return {'started': False}
+        elapsed = max((session.end_time or time.time()) - monitor._start_time, 1e-9)
+        counters = monitor.metrics.snapshot()['counters']
+        pipelines = {
+            'page_vision': monitor._page_vision_pipeline.stats(),
+            'system_vision': monitor._system_vision_pipeline.stats(),
+        }
+        return {
+            'started': True,
+            'finished': session.finished.is_set(),
+            'error': session.error,
+            'elapsed': elapsed,
+            'ticks': session.ticks,
+            'ticks_per_second': session.ticks / elapsed,
+            'events_per_second': counters.get('page.events', 0) / elapsed,
+            'frames_per_second': sum(item['encoded'] for item in pipelines.values()) / elapsed,
+            'dropped': monitor.dropped_frames,
+            'overruns': counters.get('page.overruns', 0),
+            'poll_busy': session.busy / elapsed,  # share of one polling worker
+            'lateness': monitor.metrics.histogram('host.lateness'),
+            'tick_latency': monitor.tick_latency,
+            'bytes_written': monitor.bytes_written,
+            'pipelines': pipelines,
+        }
+
+    def stats(self) -> dict:
+        # per-session throughput, and how busy the shared workers are
+        sessions = {name: self._session_stats(session) for name, session in self._sessions.items()}
+        retval = {
+            'time': time.time(),
+            'sessions': sessions,
+            'active': sum(1 for session in self._sessions.values()
+                          if self._started and not session.finished.is_set()),
+            'poll_workers': self.poll_workers,
+            'encode_workers': self.encode_workers,
+            'encode_pending': self._executor.pending,  # queued or running frames of all the sessions
+        }
+        if self._start_time is not None:
+            elapsed = max(time.time() - self._start_time, 1e-9)
+            retval['uptime'] = elapsed
+            # cpu cores used by this process, the browsers are not included
+            retval['cpu_cores'] = (time.process_time() - self._start_cpu) / elapsed
+            retval['poll_utilization'] = sum(session.busy for session in self._sessions.values()) / \
+                (elapsed * self.poll_workers)
+            retval['frames_per_second'] = sum(item.get('frames_per_second', 0.0) for item in sessions.values())
+        return retval
+
+    def _report_metrics(self):
+        if self.metrics_callback is None and self.metrics_file is None:
+            return
+        snapshot = self.stats()
+        if self.metrics_callback is not None:
+            self.metrics_callback(snapshot)
+        if self.metrics_file is not None:
+            with open(self.metrics_file, 'a') as f:
+                f.write(json.dumps(snapshot) + '\n')
+
+    def _metrics_report(self):
+        while not self._stop_signal.wait(self.metrics_interval):
+            self._report_metrics()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -8216,13 +8216,15 @@ if (typeof document.get_screenshot === 'undefined') {
         return uuid;
     }
 
-    function deepcopy(v) {
-        return JSON.parse(JSON.stringify(v))
-    }
-
     let _screenshot_records = []
+    let _screenshot_interval_ms = ${interval_ms};
+    let _rendering = false;
 
     function takeScreenshot() {
+        if (!document.body || _rendering) {  // injected before the document is parsed, or still rendering
+            return;
+        }
+        _rendering = true;
         html2canvas(document.body).then(function (canvas) {
             let imgData = canvas.toDataURL('image/png');
             _screenshot_records.push({
@@ -8230,20 +8232,32 @@ if (typeof document.get_screenshot === 'undefined') {
                 uuid: generateUUID(),
                 raw: imgData,
             })
+        }).finally(function () {
+            _rendering = false;
         });
     }
 
     document.takeScreenshot = takeScreenshot;
+    document.get_screenshot = takeScreenshot;
 
-    document.loadScreenshotRecords = function () {
-        let retval = deepcopy(_screenshot_records);
-        _screenshot_records.splice(0, retval.length);  // use retval.length to resolve the thread problem
+    document.drainScreenshotRecords = function () {
+        let retval = _screenshot_records;
+        _screenshot_records = [];
         return retval;
     }
+    document.loadScreenshotRecords = document.drainScreenshotRecords;
 
-    setInterval(function () {
+    // the interval can be changed by the adaptive scheduler of the monitor
+    document.setScreenshotInterval = function (interval_ms) {
+        _screenshot_interval_ms = interval_ms;
+    }
+
+    function screenshotLoop() {
         takeScreenshot();
-    }, ${interval_ms})
+        setTimeout(screenshotLoop, _screenshot_interval_ms);
+    }
+
+    setTimeout(screenshotLoop, _screenshot_interval_ms);
 
     console.log('html2canvas loaded!');
 }
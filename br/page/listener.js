@@ -20,16 +20,45 @@ function generateUUID() {
     return uuid;
 }
 
+function ColumnBuffer(names) {
+    // growable typed arrays, one column for each field
+    this.names = names;
+    this.size = 0;
+    this.columns = {};
+    for (let name of names) {
+        this.columns[name] = new Float64Array(64);
+    }
+}
+
+ColumnBuffer.prototype.push = function (values) {
+    if (this.size >= this.columns[this.names[0]].length) {
+        for (let name of this.names) {
+            let column = new Float64Array(this.columns[name].length * 2);
+            column.set(this.columns[name]);
+            this.columns[name] = column;
+        }
+    }
+    for (let i = 0; i < this.names.length; i++) {
+        this.columns[this.names[i]][this.size] = values[i];
+    }
+    this.size += 1;
+}
 
-function deepcopy(v) {
-    return JSON.parse(JSON.stringify(v))
+ColumnBuffer.prototype.drain = function () {
+    let retval = {};
+    for (let name of this.names) {
+        retval[name] = Array.from(this.columns[name].subarray(0, this.size));
+    }
+    this.size = 0;
+    return retval;
 }
 
-function addMonitor() {
+function addMonitor(options) {
     if (document.isMonitored) {
         return false;
     }
 
+    options = options || {};
     let arr = []
 
     function appendRecord(record) {
@@ -39,6 +68,50 @@ function addMonitor() {
         arr.push(full_record)
     }
 
+    // in compact mode, high-frequency events are coalesced to at most one sample per animation frame
+    // (and per sample_ms), and shipped as columns instead of one object for each event
+    let compact = !!options.compact;
+    let sampleInterval = (options.sample_ms || 0) / 1000.0;
+    let columnBuffers = {
+        mousemove: new ColumnBuffer(['time', 'x', 'y']),
+        drag: new ColumnBuffer(['time', 'x', 'y']),
+        scroll: new ColumnBuffer(['time', 'scroll_x', 'scroll_y']),
+    };
+    let pendingSamples = {};
+    let lastSampleTimes = {};
+    let frameRequested = false;
+
+    function flushSamples() {
+        frameRequested = false;
+        for (let type in pendingSamples) {
+            let values = pendingSamples[type];
+            if (lastSampleTimes[type] === undefined || values[0] - lastSampleTimes[type] >= sampleInterval) {
+                columnBuffers[type].push(values);
+                lastSampleTimes[type] = values[0];
+                delete pendingSamples[type];
+            }
+        }
+        if (Object.keys(pendingSamples).length > 0) {
+            requestFrame();
+        }
+    }
+
+    function requestFrame() {
+        if (!frameRequested) {
+            frameRequested = true;
+            window.requestAnimationFrame(flushSamples);
+        }
+    }
+
+    function appendSample(type, record, values) {
+        if (compact) {
+            pendingSamples[type] = [getTimestamp()].concat(values);
+            requestFrame();
+        } else {
+            appendRecord(record);
+        }
+    }
+
     document.addEventListener('click', function (event) {
         appendRecord({
             event: 'click', x: event.clientX, y: event.clientY, text: event.target.innerText,
@@ -50,9 +123,9 @@ function addMonitor() {
         });
     });
     document.addEventListener('mousemove', function (event) {
-        appendRecord({
+        appendSample('mousemove', {
             event: 'mousemove', x: event.clientX, y: event.clientY,
-        });
+        }, [event.clientX, event.clientY]);
     });
     document.addEventListener('dragstart', function (event) {
         appendRecord({
@@ -60,9 +133,9 @@ function addMonitor() {
         })
     })
     document.addEventListener('drag', function (event) {
-        appendRecord({
+        appendSample('drag', {
             event: 'drag', x: event.clientX, y: event.clientY,
-        })
+        }, [event.clientX, event.clientY])
     })
     document.addEventListener('dragend', function (event) {
         appendRecord({
@@ -80,19 +153,25 @@ function addMonitor() {
         })
     })
 
+    // documentElement and body may not exist yet when injected before the document is parsed
+    function _elementProperty(name) {
+        return (document.documentElement && document.documentElement[name]) ||
+            (document.body && document.body[name]) || 0;
+    }
+
     function _recordScrollInfo() {
-        appendRecord({
-            event: 'scroll',
-            scroll_x: window.pageXOffset || document.documentElement.scrollLeft || document.body.scrollLeft,
-            scroll_y: window.pageYOffset || document.documentElement.scrollTop || document.body.scrollTop,
-        });
+        let scroll_x = window.pageXOffset || _elementProperty('scrollLeft');
+        let scroll_y = window.pageYOffset || _elementProperty('scrollTop');
+        appendSample('scroll', {
+            event: 'scroll', scroll_x: scroll_x, scroll_y: scroll_y,
+        }, [scroll_x, scroll_y]);
     }
 
     function _recordViewInfo() {
         appendRecord({
             event: 'resize',
-            view_height: window.innerHeight || document.documentElement.clientHeight || document.body.clientHeight,
-            view_width: window.innerWidth || document.documentElement.clientWidth || document.body.clientWidth,
+            view_height: window.innerHeight || _elementProperty('clientHeight'),
+            view_width: window.innerWidth || _elementProperty('clientWidth'),
         });
     }
 
@@ -106,15 +185,45 @@ function addMonitor() {
         _recordViewInfo()
     })
 
+    // buffers are swapped instead of copied, the drained array is never touched again in page
     document.loadRecords = function () {
-        let retval = deepcopy(arr);
-        arr.splice(0, arr.length);
+        let retval = arr;
+        arr = [];
         return retval;
     }
+    document.loadColumns = function () {
+        // samples still waiting for an animation frame (e.g. in background tabs) are shipped as well
+        for (let type in pendingSamples) {
+            columnBuffers[type].push(pendingSamples[type]);
+            lastSampleTimes[type] = pendingSamples[type][0];
+        }
+        pendingSamples = {};
+
+        let retval = {};
+        for (let type in columnBuffers) {
+            if (columnBuffers[type].size > 0) {
+                retval[type] = columnBuffers[type].drain();
+            }
+        }
+        return retval;
+    }
+    document.drainAll = function (options) {
+        if (options && options.screenshot_interval_ms && document.setScreenshotInterval) {
+            document.setScreenshotInterval(options.screenshot_interval_ms);
+        }
+        return {
+            url: window.location.href,
+            monitored: true,
+            events: document.loadRecords(),
+            columns: document.loadColumns(),
+            screenshots: document.drainScreenshotRecords ? document.drainScreenshotRecords() : [],
+        };
+    }
     document.isMonitored = true;
 
     console.log('Monitor added.')
     return true;
 }
 
-addMonitor();
+// options can be passed as the first argument of execute_script
+addMonitor(typeof arguments !== 'undefined' ? arguments[0] : undefined);
@@ -0,0 +1,135 @@
+import bisect
+import math
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, List, Optional
+
+# seconds, from 10us to about 168s in powers of 2
+LATENCY_BUCKETS = [1e-5 * 2 ** i for i in range(25)]
+# ratios in [-1, 1], e.g. deflation of diff frames
+RATIO_BUCKETS = [i / 20.0 for i in range(-20, 21)]
+
+
+class Histogram:
+    # fixed buckets, so observing is a bisect and a few additions
+    def __init__(self, buckets: Optional[List[float]] = None):
+        self.buckets = list(buckets or LATENCY_BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        # upper bound of the bucket containing the q-th percentile, clipped to the observed range
+        if not self.count:
+            return math.nan
+        target, cumulative = q / 100.0 * self.count, 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target and count:
+                bound = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(max(bound, self.min), self.max)
+        return self.max  # pragma: no cover
+
+    def snapshot(self) -> dict:
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
+
+
+class Metrics:
+    # counters, gauges and histograms of the recording pipeline, cheap enough to stay on
+    def __init__(self):
+        self._lock = Lock()
+        self._counters: Dict[str, int] = {}
+        self._gauges: Dict[str, float] = {}
+        self._histograms: Dict[str, Histogram] = {}
+        self._start_time = time.time()
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def gauge(self, name: str, value: float):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float, buckets: Optional[List[float]] = None):
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram(buckets)
+            self._histograms[name].observe(value)
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def histogram(self, name: str) -> dict:
+        with self._lock:
+            if name not in self._histograms:
+                return {'count': 0}
+            return self._histograms[name].snapshot()
+
+    def scoped(self, prefix: str) -> 'ScopedMetrics':
+        return ScopedMetrics(self, prefix)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'time': time.time(),
+                'uptime': time.time() - self._start_time,
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'histograms': {name: hist.snapshot() for name, hist in self._histograms.items()},
+            }
+
+
+class ScopedMetrics:
+    # same interface as Metrics, with names prefixed by the stage, e.g. page_vision.diff
+    def __init__(self, metrics: Metrics, prefix: str):
+        self._metrics = metrics
+        self._prefix = prefix
+
+    def _name(self, name: str) -> str:
+        return f'{self._prefix}.{name}'
+
+    def count(self, name: str, value: int = 1):
+        self._metrics.count(self._name(name), value)
+
+    def gauge(self, name: str, value: float):
+        self._metrics.gauge(self._name(name), value)
+
+    def observe(self, name: str, value: float, buckets: Optional[List[float]] = None):
+        self._metrics.observe(self._name(name), value, buckets)
+
+    def timer(self, name: str):
+        return self._metrics.timer(self._name(name))
+
+    def histogram(self, name: str) -> dict:
+        return self._metrics.histogram(self._name(name))
+
+    def scoped(self, prefix: str) -> 'ScopedMetrics':
+        return ScopedMetrics(self._metrics, self._name(prefix))
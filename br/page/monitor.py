@@ -3,22 +3,40 @@ import os.path
 import pathlib
 import time
 import uuid
-from queue import Queue, Empty
+import weakref
+from concurrent.futures import ThreadPoolExecutor, Executor
+from functools import lru_cache
 from threading import Event, Thread, Lock
+from typing import Optional, Dict, Callable, Sequence
+
+import numpy as np
 
 from hbutils.string import env_template
-from selenium.common import NoSuchWindowException
+from selenium.common import NoSuchWindowException, WebDriverException
 from selenium.webdriver.remote.webdriver import WebDriver
 
-from .vision import VisionRecorder, _base64_url_to_image
-from ..utils import capture_screen
+from .backend import get_capture_backend
+from .metrics import Metrics
+from .pipeline import EncodePipeline
+from .scheduler import AdaptiveScheduler
+from .vision import VisionRecorder, VisionItem, _image_to_lab
+from ..storage import RecordWriter, StreamType, pyramid_stream
+from ..utils import capture_screen_array, close_x11_grabber
+
+
+@lru_cache()
+def _listener_js() -> str:
+    return pathlib.Path(os.path.normpath(os.path.join(__file__, '..', 'listener.js'))).read_text()
 
-_LISTENER_JS = pathlib.Path(os.path.normpath(os.path.join(__file__, '..', 'listener.js'))).read_text()
-_HTML2CANVAS_JS = pathlib.Path(os.path.normpath(os.path.join(__file__, '..', 'html2canvas.js'))).read_text()
 
+@lru_cache()
+def _html2canvas_js() -> str:
+    # about 480 KB, only loaded when a page is actually monitored
+    return pathlib.Path(os.path.normpath(os.path.join(__file__, '..', 'html2canvas.js'))).read_text()
 
-def add_monitor(driver: WebDriver):
-    driver.execute_script(_LISTENER_JS)
+
+def add_monitor(driver: WebDriver, compact: bool = False, sample_ms: int = 0):
+    driver.execute_script(_listener_js(), {'compact': compact, 'sample_ms': sample_ms})
 
 
 def read_event_records(driver: WebDriver):
@@ -26,124 +44,425 @@ def read_event_records(driver: WebDriver):
 
 
 def add_html2canvas(driver: WebDriver, interval_ms: int = 200):
-    driver.execute_script(env_template(_HTML2CANVAS_JS, {'interval_ms': interval_ms}, safe=True))
+    driver.execute_script(env_template(_html2canvas_js(), {'interval_ms': interval_ms}, safe=True))
+
+
+_REGISTERED_DRIVERS = weakref.WeakKeyDictionary()
+
+
+def _on_new_document_script(source: str, argument=None) -> str:
+    # only in top-level documents, and with the same `this` and `arguments` as execute_script
+    return f'if (window.top === window) {{\n' \
+           f'(function () {{\n{source}\n}}).call(window, {json.dumps(argument)});\n' \
+           f'}}'
+
+
+def register_on_new_document(driver: WebDriver, compact: bool = False, sample_ms: int = 0,
+                             interval_ms: int = 200, html2canvas: bool = True) -> bool:
+    # register listener and html2canvas with Page.addScriptToEvaluateOnNewDocument, so every new document is
+    # monitored from its beginning without re-injection. Only once per driver, False when cdp is not supported.
+    options = (compact, sample_ms, interval_ms, html2canvas)
+    try:
+        if _REGISTERED_DRIVERS.get(driver) == options:
+            return True
+    except TypeError:  # not weak-referencable
+        return False
+    if not hasattr(driver, 'execute_cdp_cmd'):
+        return False
+
+    sources = [_on_new_document_script(_listener_js(), {'compact': compact, 'sample_ms': sample_ms})]
+    if html2canvas:
+        sources.append(_on_new_document_script(env_template(_html2canvas_js(), {'interval_ms': interval_ms}, safe=True)))
+    try:
+        for source in sources:
+            driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': source})
+    except WebDriverException:
+        return False
+
+    _REGISTERED_DRIVERS[driver] = options
+    return True
 
 
 def read_screenshot_records(driver: WebDriver):
     return driver.execute_script('return document.loadScreenshotRecords();') or []
 
 
+_DRAIN_ALL_SCRIPT = 'return document.drainAll ? document.drainAll(arguments[0]) : ' \
+                    '{url: window.location.href, monitored: false, events: [], screenshots: []};'
+
+
+def drain_all(driver: WebDriver, options: Optional[dict] = None) -> dict:
+    # url, events and screenshots in one round trip,
+    # options (e.g. screenshot_interval_ms) are applied to the page before draining
+    return driver.execute_script(_DRAIN_ALL_SCRIPT, options)
+
+
+def is_headless(driver: WebDriver) -> bool:
+    # headless browsers are not on the screen, so capturing the screen records nothing of them
+    try:
+        user_agent = driver.execute_script('return navigator.userAgent;') or ''
+    except WebDriverException:
+        return False
+    return 'Headless' in user_agent
+
+
 class WebDriverMonitor:
     def __init__(self, driver: WebDriver, save_as: str, event_interval: float = 0.2,
-                 system_view_interval: float = 1.0):
+                 system_view_interval: float = 1.0, streaming: bool = False,
+                 max_buffered_events: int = 1000, flush_interval: float = 5.0,
+                 encode_workers: int = 2, max_pending_frames: int = 16, overflow_policy: str = 'block',
+                 compact_events: bool = False, event_sample_ms: int = 0, injection: str = 'auto',
+                 capture_backend='html2canvas', adaptive_capture: bool = False,
+                 min_capture_rate: float = 0.5, max_capture_rate: float = 10.0,
+                 metrics_interval: float = 5.0, metrics_callback: Optional[Callable[[dict], None]] = None,
+                 metrics_file: Optional[str] = None, pyramid_scales: Sequence[int] = (),
+                 system_capture: Optional[bool] = None, encode_executor: Optional[Executor] = None):
         self.driver = driver
         self.save_as = save_as
         self.event_interval = event_interval
         self.system_view_interval = system_view_interval
+        # screen capture for system_vision, None means only when the browser is not headless
+        self.system_capture = system_capture
+
+        # in streaming mode, events and frames are written to a record container as soon as they are produced
+        self.streaming = streaming
+        self.max_buffered_events = max_buffered_events
+        self.flush_interval = flush_interval
+        self._writer: Optional[RecordWriter] = None
+        self._bytes_written = 0
 
         self._start_signal = Event()
         self._stop_signal = Event()
         self._start_time = None
         self._end_time = None
         self._page_event_records = []
-
-        self._page_vision_queue = Queue()
-        self._page_vision = VisionRecorder()
-        self._system_vision = VisionRecorder()
+        self._last_driver_url = None
+        self._last_flush_time = None
+        # mousemove, drag and scroll events are coalesced in page and shipped as columns in compact mode
+        self.compact_events = compact_events
+        self.event_sample_ms = event_sample_ms
+        self._page_event_columns: Dict[str, Dict[str, list]] = {}
+
+        # 'cdp' registers the scripts once for all new documents, 'execute_script' injects them again
+        # after each navigation, and 'auto' uses cdp when the driver supports it
+        if injection not in ('auto', 'cdp', 'execute_script'):
+            raise ValueError(f'Unknown injection mode - {injection!r}.')
+        self.injection = injection
+
+        # counters and latency histograms of each stage, see stats(). When metrics_callback or metrics_file
+        # (json lines) is given, a snapshot is reported every metrics_interval seconds and once at the end
+        self.metrics = Metrics()
+        self.metrics_interval = metrics_interval
+        self.metrics_callback = metrics_callback
+        self.metrics_file = metrics_file
+
+        # page frames from html2canvas in page, or from the browser with screencast or screenshot of devtools
+        backend_kwargs = {'interval': event_interval} if capture_backend in ('html2canvas', 'screenshot') else {}
+        self.capture_backend = get_capture_backend(capture_backend, **backend_kwargs)
+
+        # in adaptive mode, capture rates are raised to max_capture_rate on input events,
+        # and back off towards min_capture_rate while the page is idle
+        self.adaptive_capture = adaptive_capture
+        if self.adaptive_capture:
+            self._page_scheduler = AdaptiveScheduler.from_rates(min_capture_rate, max_capture_rate)
+            self._system_scheduler = AdaptiveScheduler.from_rates(min_capture_rate, max_capture_rate)
+        else:
+            self._page_scheduler = AdaptiveScheduler(event_interval, event_interval)
+            self._system_scheduler = AdaptiveScheduler(system_view_interval, system_view_interval)
+
+        # png decoding, colour conversion and compression of frames are shared by a pool of workers,
+        # when frames come faster than they are encoded, overflow_policy (block, drop_oldest or degrade) is applied.
+        # the pool can also be shared by many monitors, see RecordingHost, then it is not shut down here
+        self._owns_executor = encode_executor is None
+        self._encode_executor = encode_executor if encode_executor is not None else \
+            ThreadPoolExecutor(max_workers=encode_workers, thread_name_prefix='encode')
+        # downsampled tracks for thumbnails, e.g. (4, 16) for 1/4 and 1/16
+        self.pyramid_scales = tuple(pyramid_scales)
+        self._page_vision = VisionRecorder(pyramid_scales=self.pyramid_scales)
+        self._page_vision_pipeline = EncodePipeline(
+            self._page_vision, self.capture_backend.to_lab, self._encode_executor,
+            max_pending=max_pending_frames, policy=overflow_policy,
+            sink=self._page_vision_sink if self.streaming else None, name='page-vision',
+            compose=self.capture_backend.compose, metrics=self.metrics.scoped('page_vision'),
+        )
+        self._system_vision = VisionRecorder(pyramid_scales=self.pyramid_scales)
+        self._system_vision_pipeline = EncodePipeline(
+            self._system_vision, _image_to_lab, self._encode_executor,
+            max_pending=max_pending_frames, policy=overflow_policy,
+            sink=self._system_vision_sink if self.streaming else None, name='system-vision',
+            metrics=self.metrics.scoped('system_vision'),
+        )
 
         self._t_page_event = Thread(target=self._page_event_monitor)
-        self._t_page_vision_maintain = Thread(target=self._page_vision_maintain)
         self._t_system_screenshot = Thread(target=self._system_screenshot)
         self._t_result_save = Thread(target=self._result_save)
+        self._t_metrics = Thread(target=self._metrics_report, daemon=True)
 
         self._lock = Lock()
 
-    def _page_vision_maintain(self):
-        while not self._stop_signal.is_set() or not self._page_vision_queue.empty():
-            try:
-                item = self._page_vision_queue.get(block=True, timeout=self.event_interval)
-            except Empty:
-                continue
+    def _vision_sink(self, stream: StreamType, item: VisionItem):
+        if item.scale != 1:
+            stream = pyramid_stream(stream, item.scale)
+        self._writer.write_vision(stream, item.type, item.timestamp, item.to_bytes())
+
+    def _page_vision_sink(self, item: VisionItem):
+        self._vision_sink(StreamType.PAGE_VISION, item)
+
+    def _system_vision_sink(self, item: VisionItem):
+        self._vision_sink(StreamType.SYSTEM_VISION, item)
+
+    def _append_page_event_columns(self, columns: Dict[str, Dict[str, list]]):
+        for event, event_columns in columns.items():
+            if event not in self._page_event_columns:
+                self._page_event_columns[event] = {name: [] for name in event_columns}
+            for name, column in event_columns.items():
+                self._page_event_columns[event][name].extend(column)
+
+    def _buffered_event_count(self) -> int:
+        return len(self._page_event_records) + \
+            sum(len(columns['time']) for columns in self._page_event_columns.values())
+
+    def _flush_page_events(self):
+        events, self._page_event_records = self._page_event_records, []
+        events = [item for _, item in sorted(enumerate(events), key=lambda x: (x[1]['time'], x[0]))]
+        self._writer.write_events(events)
+        columns, self._page_event_columns = self._page_event_columns, {}
+        self._writer.write_event_columns(columns)
+
+    def _register_scripts(self):
+        if self.injection == 'execute_script':
+            return
+        registered = register_on_new_document(self.driver, self.compact_events, self.event_sample_ms,
+                                              int(self.event_interval * 1000), self.capture_backend.uses_html2canvas)
+        if not registered and self.injection == 'cdp':
+            raise RuntimeError('Chrome DevTools Protocol is not supported by this driver.')
+
+    def _poll_page(self) -> bool:
+        # one polling tick, drains the page, submits its frames and flushes the events in streaming mode.
+        # False when the window is gone
+        try:
+            drain_options = None
+            if self.adaptive_capture:
+                self.capture_backend.interval = self._page_scheduler.interval
+                if self.capture_backend.uses_html2canvas:
+                    drain_options = {'screenshot_interval_ms': int(self._page_scheduler.interval * 1000)}
+
+            with self.metrics.timer('page.drain'):
+                state = drain_all(self.driver, drain_options)
+
+            if state['url'] != self._last_driver_url:
+                self._page_event_records.append({
+                    'event': 'url_change',
+                    'time': time.time(),
+                    'uuid': str(uuid.uuid4()),
+                    'last_url': self._last_driver_url,
+                    'new_url': state['url'],
+                })
+                self._last_driver_url = state['url']
+            if not state['monitored']:  # new document, scripts should be injected again
+                add_monitor(self.driver, self.compact_events, self.event_sample_ms)
+                if self.capture_backend.uses_html2canvas:
+                    add_html2canvas(self.driver, int(self.event_interval * 1000))
 
-            timestamp, raw_data = item['time'], item['raw']
-            self._page_vision.append(_base64_url_to_image(raw_data), timestamp)
+            columns = state.get('columns') or {}
+            activity = len(state['events']) + sum(len(item['time']) for item in columns.values())
+            self._page_scheduler.notify_activity(activity)
+            self._system_scheduler.notify_activity(activity)
+
+            self._page_event_records.extend(state['events'])
+            self._append_page_event_columns(columns)
+            self.metrics.count('page.events', activity)
+            with self.metrics.timer('page.poll'):
+                frames = self.capture_backend.poll(self.driver, state, not self._page_vision_pipeline.full())
+            self.metrics.count('page.frames', len(frames))
+            for raw, timestamp in frames:
+                self._page_scheduler.tick(timestamp)
+                self._page_vision_pipeline.submit(raw, timestamp)
+
+        except NoSuchWindowException:
+            self._stop_signal.set()
+            return False
+
+        if self.streaming and (self._buffered_event_count() >= self.max_buffered_events or
+                               time.time() - self._last_flush_time >= self.flush_interval):
+            with self.metrics.timer('page.flush'):
+                self._flush_page_events()
+            self._last_flush_time = time.time()
+        self.metrics.gauge('page.buffered_events', self._buffered_event_count())
+        return True
+
+    def _poll_interval(self) -> float:
+        # seconds until the next polling tick, shorter while the adaptive capture runs faster than event_interval
+        if self.adaptive_capture:
+            return min(self.event_interval, self._page_scheduler.interval)
+        return self.event_interval
 
     def _page_event_monitor(self):
         _last_time = time.time()
-        _last_driver_url = None
         while not self._stop_signal.is_set():
-            try:
-                if self.driver.current_url != _last_driver_url:
-                    self._page_event_records.append({
-                        'event': 'url_change',
-                        'time': time.time(),
-                        'uuid': str(uuid.uuid4()),
-                        'last_url': _last_driver_url,
-                        'new_url': self.driver.current_url,
-                    })
-                    _last_driver_url = self.driver.current_url
-                    add_monitor(self.driver)
-                    add_html2canvas(self.driver, int(self.event_interval * 1000))
-
-                self._page_event_records.extend(read_event_records(self.driver))
-                for item in read_screenshot_records(self.driver):
-                    self._page_vision_queue.put(item)
-
-            except NoSuchWindowException:
-                self._stop_signal.set()
+            if not self._poll_page():
                 break
 
-            _last_time += self.event_interval
+            _last_time += self._poll_interval()
             _duration = _last_time - time.time()
             if _duration > 0:
                 time.sleep(_duration)
+            else:  # how far the loop runs behind its schedule
+                self.metrics.count('page.overruns')
+                self.metrics.observe('page.overrun', -_duration)
+
+    def _submit_system_frame(self, image: np.ndarray, timestamp: float) -> float:
+        # returns the interval until the next screen capture
+        self._system_vision_pipeline.submit(image, timestamp)
+        return self._system_scheduler.tick(timestamp) * self._system_vision_pipeline.interval_scale
 
     def _system_screenshot(self):
         _last_time = time.time()
-        while not self._stop_signal.is_set():
-            image, timestamp = capture_screen()
-            self._system_vision.append(image, timestamp)
+        try:
+            while not self._stop_signal.is_set():
+                with self.metrics.timer('system.capture'):
+                    image, timestamp = capture_screen_array()
+
+                _last_time += self._submit_system_frame(image, timestamp)
+                _duration = _last_time - time.time()
+                if _duration > 0:
+                    time.sleep(_duration)
+                else:
+                    self.metrics.count('system.overruns')
+                    self.metrics.observe('system.overrun', -_duration)
+        finally:  # the display connection and shm segment of this thread
+            close_x11_grabber()
+
+    @property
+    def tick_latency(self) -> Dict[str, float]:
+        # round-trip seconds of the polling ticks
+        return self.metrics.histogram('page.drain')
+
+    @property
+    def bytes_written(self) -> int:
+        # streamed to the container so far, json records are only written (at once) when saved
+        if self._writer is not None:
+            return self._writer.bytes_written
+        return self._bytes_written
+
+    @property
+    def effective_capture_rate(self) -> Dict[str, float]:
+        # captured frames per second in the recent 10 seconds
+        return {
+            'page': self._page_scheduler.effective_rate,
+            'system': self._system_scheduler.effective_rate,
+        }
+
+    def stats(self) -> dict:
+        # snapshot of metrics, pipelines and capture rates
+        retval = self.metrics.snapshot()
+        retval['pipelines'] = {
+            'page_vision': self._page_vision_pipeline.stats(),
+            'system_vision': self._system_vision_pipeline.stats(),
+        }
+        retval['capture_rate'] = self.effective_capture_rate
+        retval['tick_latency'] = self.tick_latency
+        retval['bytes_written'] = self.bytes_written
+        return retval
+
+    def _report_metrics(self):
+        snapshot = self.stats()
+        if self.metrics_callback is not None:
+            self.metrics_callback(snapshot)
+        if self.metrics_file is not None:
+            with open(self.metrics_file, 'a') as f:
+                f.write(json.dumps(snapshot) + '\n')
+
+    def _metrics_report(self):
+        while not self._stop_signal.wait(self.metrics_interval):
+            self._report_metrics()
+        self._t_result_save.join()
+        self._report_metrics()
 
-            _last_time += self.system_view_interval
-            _duration = _last_time - time.time()
-            if _duration > 0:
-                time.sleep(_duration)
+    @property
+    def dropped_frames(self) -> int:
+        return self._page_vision_pipeline.dropped + self._system_vision_pipeline.dropped
 
     def _wait_for_watching_end(self):
         self._stop_signal.wait()
         self._end_time = time.time()
         self._t_page_event.join()
-        self._t_page_vision_maintain.join()
-        self._t_system_screenshot.join()
+        if self.system_capture:
+            self._t_system_screenshot.join()
+
+    def _close_capture(self):
+        # after the last polling tick, waits for the encoders
+        self.capture_backend.stop(self.driver)
+        self._page_vision_pipeline.close()
+        self._system_vision_pipeline.close()
 
     def _result_save(self):
         self._wait_for_watching_end()
+        self._close_capture()
+        self._save_result()
+
+    def _save_result(self):
+        if self.streaming:
+            self._flush_page_events()
+            self._writer.close({'start_time': self._start_time, 'end_time': self._end_time})
+            if self._owns_executor:
+                self._encode_executor.shutdown()
+            return
+
         events = [item for _, item in sorted(enumerate(self._page_event_records), key=lambda x: (x[1]['time'], x[0]))]
         save_dir = os.path.dirname(self.save_as)
         if save_dir:
             os.makedirs(save_dir, exist_ok=True)
+        data = {
+            'start_time': self._start_time,
+            'end_time': self._end_time,
+            'events': events,
+            'page_vision': self._page_vision.to_json(self._encode_executor),
+            'system_vision': self._system_vision.to_json(self._encode_executor),
+        }
+        if self._page_event_columns:
+            data['event_columns'] = self._page_event_columns
+        if self.pyramid_scales:
+            data['pyramid'] = {
+                'page_vision': self._page_vision.pyramid_to_json(self._encode_executor),
+                'system_vision': self._system_vision.pyramid_to_json(self._encode_executor),
+            }
         with open(self.save_as, 'w') as f:
-            json.dump({
-                'start_time': self._start_time,
-                'end_time': self._end_time,
-                'events': events,
-                'page_vision': self._page_vision.to_json(),
-                'system_vision': self._system_vision.to_json(),
-            }, f, indent=4)
+            json.dump(data, f, indent=4)
+        self._bytes_written = os.path.getsize(self.save_as)
+        if self._owns_executor:
+            self._encode_executor.shutdown()
 
     def _join(self):
         self._stop_signal.wait()
-        self._t_system_screenshot.join()
+        if self.system_capture:
+            self._t_system_screenshot.join()
         self._t_page_event.join()
-        self._t_page_vision_maintain.join()
         self._t_result_save.join()
+        if self._t_metrics.is_alive():
+            self._t_metrics.join()
+
+    def _open(self):
+        # everything but the threads, which are replaced by the shared workers of RecordingHost
+        if self.system_capture is None:
+            self.system_capture = not is_headless(self.driver)
+        self._register_scripts()
+        self.capture_backend.start(self.driver)
+        if self.streaming:
+            self._writer = RecordWriter(self.save_as, flush=True)
+        self._page_vision_pipeline.start()
+        self._system_vision_pipeline.start()
+        self._last_flush_time = time.time()
 
     def start(self):
         with self._lock:
-            self._t_system_screenshot.start()
-            self._t_page_vision_maintain.start()
+            self._open()
+            if self.system_capture:
+                self._t_system_screenshot.start()
             self._t_page_event.start()
             self._t_result_save.start()
+            if self.metrics_callback is not None or self.metrics_file is not None:
+                self._t_metrics.start()
             self._start_time = time.time()
 
     def stop(self):
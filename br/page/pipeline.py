@@ -0,0 +1,219 @@
+import logging
+import time
+from collections import deque
+from concurrent.futures import Executor, Future
+from enum import IntEnum
+from threading import Condition, Thread
+from typing import Callable, Any, Optional, Deque, Tuple
+
+import numpy as np
+
+from .metrics import Metrics, ScopedMetrics
+from .vision import VisionRecorder, VisionItem
+
+
+class OverflowPolicy(IntEnum):
+    BLOCK = 0x1  # wait until there is room in the queue
+    DROP_OLDEST = 0x2  # drop the oldest frame which is not diffed yet
+    DEGRADE = 0x3  # drop the incoming frame and ask the producer to capture less often
+
+    @classmethod
+    def loads(cls, obj):
+        if isinstance(obj, cls):
+            return obj
+        elif isinstance(obj, str):
+            return cls.__members__[obj.upper()]
+        else:
+            raise TypeError(f'Unknown overflow policy - {obj!r}.')
+
+
+class _OrderedStage:
+    # bounded fifo of futures, consumed in submission order by a dedicated thread
+    def __init__(self, name: str, max_size: int, consume: Callable[[Any, Any], None]):
+        self._items: Deque[Tuple[Future, Any]] = deque()
+        self._cond = Condition()
+        self._closed = False
+        self.max_size = max_size
+        self._consume = consume
+        self._thread = Thread(target=self._loop, name=name, daemon=True)
+
+    def __len__(self):
+        return len(self._items)
+
+    def full(self) -> bool:
+        return len(self._items) >= self.max_size
+
+    def start(self):
+        self._thread.start()
+
+    def put(self, future: Future, extra: Any, block: bool = True) -> bool:
+        with self._cond:
+            while block and self.full() and not self._closed:
+                self._cond.wait()
+            if self._closed or (not block and self.full()):
+                return False
+            self._items.append((future, extra))
+            self._cond.notify_all()
+            return True
+
+    def pop_oldest(self) -> Optional[Tuple[Future, Any]]:
+        with self._cond:
+            # the head may already be consumed, so only drop frames behind it
+            if len(self._items) >= 2:
+                item = self._items[1]
+                del self._items[1]
+                self._cond.notify_all()
+                return item
+            return None
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._items and not self._closed:
+                    self._cond.wait()
+                if not self._items:
+                    return
+                future, extra = self._items[0]
+
+            try:
+                self._consume(future, extra)
+            finally:
+                with self._cond:
+                    self._items.popleft()
+                    self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+class EncodePipeline:
+    def __init__(self, recorder: VisionRecorder, to_lab: Callable[[Any], np.ndarray], executor: Executor,
+                 max_pending: int = 16, policy='block', sink: Optional[Callable[[VisionItem], None]] = None,
+                 name: str = 'encode', max_interval_scale: float = 8.0,
+                 compose: Optional[Callable[[Any], np.ndarray]] = None, metrics: Optional[ScopedMetrics] = None):
+        # decoding and colour conversion (to_lab) and compression run in the executor,
+        # while composing and diffing stay ordered on the recorder
+        self.recorder = recorder
+        self.to_lab = to_lab
+        self.compose = compose
+        self.executor = executor
+        self.policy = OverflowPolicy.loads(policy)
+        self.sink = sink
+        self.max_interval_scale = max_interval_scale
+
+        # time of each stage, queue waiting, deflation of diff frames and written bytes
+        self.metrics = metrics if metrics is not None else Metrics().scoped(name)
+        if self.recorder.metrics is None:
+            self.recorder.metrics = self.metrics
+
+        self._frames = _OrderedStage(f'{name}-diff', max_pending, self._diff)
+        self._encoded = _OrderedStage(f'{name}-write', max_pending, self._write)
+        if self.sink is not None:
+            self.recorder.sink = self._compress
+
+        self.submitted = 0
+        self.encoded = 0
+        self.dropped = 0
+        self.errors = 0
+        self.interval_scale = 1.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._frames)
+
+    def full(self) -> bool:
+        return self._frames.full()
+
+    def start(self):
+        self._frames.start()
+        self._encoded.start()
+
+    def submit(self, raw: Any, timestamp: float) -> bool:
+        self.submitted += 1
+        if self._frames.full():
+            if self.policy == OverflowPolicy.DROP_OLDEST:
+                dropped = self._frames.pop_oldest()
+                if dropped is not None:
+                    dropped[0].cancel()
+                    self.dropped += 1
+                    self.metrics.count('dropped')
+            elif self.policy == OverflowPolicy.DEGRADE:
+                self.dropped += 1
+                self.metrics.count('dropped')
+                self.interval_scale = min(self.interval_scale * 2.0, self.max_interval_scale)
+                return False
+
+        future = self.executor.submit(self._to_lab, raw)
+        if not self._frames.put(future, (timestamp, time.perf_counter()), block=True):
+            future.cancel()
+            self.dropped += 1
+            return False
+        return True
+
+    def _to_lab(self, raw: Any) -> np.ndarray:
+        with self.metrics.timer('decode'):
+            return self.to_lab(raw)
+
+    def _diff(self, future: Future, extra: Tuple[float, float]):
+        timestamp, submit_time = extra
+        self.metrics.gauge('depth', len(self._frames))
+        if future.cancelled():
+            return
+        try:
+            lab = future.result()
+            # from submission until decoded and ready to diff
+            self.metrics.observe('queue_wait', time.perf_counter() - submit_time)
+            if self.compose is not None:
+                with self.metrics.timer('compose'):
+                    lab = self.compose(lab)
+            with self.metrics.timer('diff'):
+                self.recorder.append_lab(lab, timestamp)
+        except Exception:
+            self.errors += 1
+            self.metrics.count('errors')
+            logging.exception(f'Failed to encode frame at {timestamp!r}.')
+            return
+
+        self.encoded += 1
+        # the current frame is still in the queue while being diffed
+        if self.policy == OverflowPolicy.DEGRADE and self.interval_scale > 1.0 and \
+                len(self._frames) - 1 <= self._frames.max_size // 4:
+            self.interval_scale = max(self.interval_scale / 2.0, 1.0)
+
+    def _to_bytes(self, item: VisionItem) -> bytes:
+        with self.metrics.timer('compress'):
+            return item.to_bytes()
+
+    def _compress(self, item: VisionItem):
+        self._encoded.put(self.executor.submit(self._to_bytes, item), item, block=True)
+
+    def _write(self, future: Future, item: VisionItem):
+        try:
+            item.payload = future.result()
+            with self.metrics.timer('write'):
+                self.sink(item)
+            self.metrics.count('bytes', len(item.payload))
+        except Exception:
+            self.errors += 1
+            self.metrics.count('errors')
+            logging.exception(f'Failed to write frame at {item.timestamp!r}.')
+
+    def close(self):
+        # wait until all the submitted frames are diffed and written
+        self._frames.close()
+        self._encoded.close()
+
+    def stats(self) -> dict:
+        return {
+            'submitted': self.submitted,
+            'encoded': self.encoded,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'skipped': self.recorder.skipped,
+            'depth': self.depth,
+            'interval_scale': self.interval_scale,
+        }
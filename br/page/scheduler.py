@@ -0,0 +1,58 @@
+import time
+from collections import deque
+from threading import Lock
+from typing import Optional, Deque
+
+
+class AdaptiveScheduler:
+    # capture interval which jumps to min_interval on input activity,
+    # and backs off towards max_interval while the page is idle
+    def __init__(self, min_interval: float = 0.1, max_interval: float = 2.0, backoff: float = 1.5,
+                 window: float = 10.0):
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError(f'Invalid capture interval range - [{min_interval!r}, {max_interval!r}].')
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.window = window
+
+        self._interval = min_interval
+        self._active = False
+        self._captures: Deque[float] = deque()
+        self._lock = Lock()
+
+    @classmethod
+    def from_rates(cls, min_rate: float, max_rate: float, **kwargs) -> 'AdaptiveScheduler':
+        # rates in captures per second
+        return cls(min_interval=1.0 / max_rate, max_interval=1.0 / min_rate, **kwargs)
+
+    @property
+    def interval(self) -> float:
+        return self._interval
+
+    def notify_activity(self, count: int = 1):
+        if count > 0:
+            with self._lock:
+                self._active = True
+                self._interval = self.min_interval
+
+    def tick(self, now: Optional[float] = None) -> float:
+        # called on each capture, returns the interval until the next one
+        now = time.time() if now is None else now
+        with self._lock:
+            if not self._active:
+                self._interval = min(self._interval * self.backoff, self.max_interval)
+            self._active = False
+
+            self._captures.append(now)
+            while self._captures and self._captures[0] < now - self.window:
+                self._captures.popleft()
+            return self._interval
+
+    @property
+    def effective_rate(self) -> float:
+        # captures per second in the recent window
+        with self._lock:
+            if len(self._captures) < 2:
+                return 0.0
+            return (len(self._captures) - 1) / max(self._captures[-1] - self._captures[0], 1e-9)
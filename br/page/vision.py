@@ -1,20 +1,22 @@
 import io
-import os
 import zlib
-from dataclasses import dataclass
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
 from enum import IntEnum
-from typing import List, Optional
+from typing import List, Optional, Callable, Union, Sequence, Dict, Iterable, Iterator, Tuple
 
 import numpy as np
 from PIL import Image
 from hbutils.encoding import base64_encode, base64_decode
 from hbutils.string import truncate
-from hbutils.system import TemporaryDirectory
+
+from .metrics import RATIO_BUCKETS
 
 
 class VisionItemType(IntEnum):
     NEW_FRAME = 0x1
-    DIFF_FRAME = 0x2
+    DIFF_FRAME = 0x2  # legacy encoding, (x, y, packed lab) for each changed pixel
+    TILE_DIFF_FRAME = 0x3
 
     @classmethod
     def loads(cls, obj):
@@ -22,14 +24,38 @@ class VisionItemType(IntEnum):
             return obj
         elif isinstance(obj, str):
             return cls.__members__[obj.upper()]
+        elif isinstance(obj, int):
+            return cls(obj)
         else:
             raise TypeError(f'Unknown vision type - {obj!r}.')
 
 
-def _numpy_to_base64(arr: np.ndarray):
+def _numpy_to_bytes(arr: np.ndarray, level: int = -1) -> bytes:
     with io.BytesIO() as bio:
         np.save(bio, arr, allow_pickle=True)
-        return base64_encode(zlib.compress(bio.getvalue()))
+        return zlib.compress(bio.getvalue(), level)
+
+
+def _numpy_to_base64(arr: np.ndarray):
+    return base64_encode(_numpy_to_bytes(arr))
+
+
+def _pack_tile_diff(tile_size: int, tile_mask: np.ndarray, blocks: np.ndarray) -> np.ndarray:
+    # layout: uint32 (tile_size, rows, cols), packed bitmap of dirty tiles, dirty blocks of shape (3, T, T)
+    rows, cols = tile_mask.shape
+    return np.concatenate([
+        np.array([tile_size, rows, cols], dtype='<u4').view(np.uint8),
+        np.packbits(tile_mask.ravel()),
+        blocks.astype(np.uint8).ravel(),
+    ])
+
+
+def _unpack_tile_diff(data: np.ndarray):
+    tile_size, rows, cols = (int(v) for v in data[:12].view('<u4'))
+    bitmap_size = (rows * cols + 7) // 8
+    tile_mask = np.unpackbits(data[12:12 + bitmap_size])[:rows * cols].astype(bool).reshape((rows, cols))
+    blocks = data[12 + bitmap_size:].reshape((-1, 3, tile_size, tile_size))
+    return tile_size, tile_mask, blocks
 
 
 @dataclass
@@ -37,12 +63,19 @@ class VisionItem:
     type: VisionItemType
     timestamp: float
     data: np.ndarray
+    payload: Optional[bytes] = field(default=None, repr=False)  # compressed data, if already encoded
+    scale: int = 1  # 1 for full resolution, or the downsampling factor of a pyramid level
+
+    def to_bytes(self) -> bytes:
+        if self.payload is None:
+            return _numpy_to_bytes(self.data)
+        return self.payload
 
     def to_json(self):
         return {
             'type': self.type.name.lower(),
             'timestamp': self.timestamp,
-            'data': _numpy_to_base64(self.data),
+            'data': base64_encode(self.to_bytes()),
         }
 
 
@@ -54,68 +87,189 @@ def _base64_url_to_image(url: str):
         f'Url should start with {_BASE64_URL_PREFIX!r}, ' \
         f'but {truncate(url, show_length=True, tail_length=15, width=120)!r} found'
 
-    with TemporaryDirectory() as td:
-        filename = os.path.join(td, 'file.png')
-        with open(filename, 'wb') as f:
-            f.write(base64_decode(url[len(_BASE64_URL_PREFIX):]))
-
-        image = Image.open(filename)
+    with io.BytesIO(base64_decode(url[len(_BASE64_URL_PREFIX):])) as bio:
+        image = Image.open(bio)
         image.load()
         return image
 
 
+def _image_to_lab(image: Union[Image.Image, np.ndarray]) -> np.ndarray:
+    if isinstance(image, np.ndarray):  # raw RGB array from screen capture
+        image = Image.fromarray(image)
+    return np.array(image.convert('LAB'))
+
+
+def _base64_url_to_lab(url: str) -> np.ndarray:
+    return _image_to_lab(_base64_url_to_image(url))
+
+
+def _downsample_lab(lab: np.ndarray, factor: int) -> np.ndarray:
+    # box average of each channel, the size is rounded up like ceil(height / factor).
+    # the bytes are wrapped as rgb, because pillow treats a and b of LAB images as signed
+    return np.asarray(Image.fromarray(lab, 'RGB').reduce(factor))
+
+
+def _pyramid_levels(lab: np.ndarray, scales: Iterable[int]) -> Iterator[Tuple[int, np.ndarray]]:
+    # each level is reduced from the previous one, scales are increasing powers of 2
+    level_lab, level_scale = lab, 1
+    for scale in scales:
+        level_lab, level_scale = _downsample_lab(level_lab, scale // level_scale), scale
+        yield scale, level_lab
+
+
+# downsampled frames are small, so keyframes are cheap and can be frequent
+PYRAMID_MAX_DIFF_FRAMES = 10
+
+
 class VisionRecorder:
-    def __init__(self, max_diff_frames: int = 50, min_deflation: float = 0.1, pixel_diff_threshold: float = 0.05):
+    def __init__(self, max_diff_frames: int = 50, min_deflation: float = 0.1, pixel_diff_threshold: float = 0.05,
+                 sink: Optional[Callable[[VisionItem], None]] = None, tile_size: Optional[int] = 16,
+                 skip_identical: bool = True, signature_stride: int = 4, metrics=None,
+                 pyramid_scales: Sequence[int] = (), scale: int = 1):
         self._records: List[VisionItem] = []
-        self._last_view: Optional[Image.Image] = None
+        self._count: int = 0
+        self._last_timestamp: Optional[float] = None
+        self._last_lab: Optional[np.ndarray] = None
         self._last_new_frame: int = -1
 
         self.max_diff_frames = max_diff_frames
         self.min_deflation = min_deflation
         self.pixel_diff_threshold = pixel_diff_threshold
 
-    def _append_new_frame(self, view: Image.Image, timestamp: float):
-        self._last_view = view
-        data = np.array(view.convert('LAB')).transpose((2, 0, 1))
-        self._last_new_frame = len(self._records)
-        self._records.append(VisionItem(VisionItemType.NEW_FRAME, timestamp, data))
+        # when a sink is given, items are handed over to it instead of being kept in memory
+        self.sink = sink
+        # diff frames are encoded as dirty tiles, use None for the legacy per-pixel encoding
+        self.tile_size = tile_size
+        # frames identical to the last one are dropped before diffing
+        self.skip_identical = skip_identical
+        self.signature_stride = signature_stride
+        self.skipped: int = 0
+        # optional Metrics or ScopedMetrics, deflation of diff frames is observed
+        self.metrics = metrics
 
-    def _try_append_diff_frame(self, view: Image.Image, timestamp: float):
-        lab1 = np.array(self._last_view.convert('LAB'))
-        lab2 = np.array(view.convert('LAB'))
+        # downsampled tracks (e.g. 4 and 16 for 1/4 and 1/16) with their own keyframes, for thumbnails.
+        # their items go to the same sink with item.scale set, or are kept in pyramid_to_json
+        self.scale = scale
+        for level in pyramid_scales:
+            if level < 2 or level & (level - 1):
+                raise ValueError(f'Pyramid scale should be a power of 2, but {level!r} found.')
+        self.pyramid: Dict[int, VisionRecorder] = {
+            level: VisionRecorder(
+                max_diff_frames=PYRAMID_MAX_DIFF_FRAMES, min_deflation=min_deflation,
+                pixel_diff_threshold=pixel_diff_threshold, sink=self._emit_pyramid, tile_size=tile_size,
+                skip_identical=skip_identical, signature_stride=signature_stride, scale=level,
+            )
+            for level in sorted(set(pyramid_scales))
+        }
+        self._pyramid_records: Dict[int, List[VisionItem]] = {level: [] for level in self.pyramid}
 
-        f_lab1 = lab1.astype(float) / 255.0
-        f_lab2 = lab2.astype(float) / 255.0
+    def __len__(self):
+        return self._count
 
+    def _emit(self, item: VisionItem):
+        self._count += 1
+        self._last_timestamp = item.timestamp
+        if self.sink is not None:
+            self.sink(item)
+        else:
+            self._records.append(item)
+
+    def _append_new_frame(self, lab: np.ndarray, timestamp: float):
+        self._last_lab = lab
+        self._last_new_frame = self._count
+        self._emit(VisionItem(VisionItemType.NEW_FRAME, timestamp, lab.transpose((2, 0, 1)), scale=self.scale))
+
+    def _changed_pixels(self, lab1: np.ndarray, lab2: np.ndarray) -> np.ndarray:
+        # same as euclidean distance of lab / 255.0 > pixel_diff_threshold, but in integers
+        diff = lab1.astype(np.int32) - lab2.astype(np.int32)
+        return (diff * diff).sum(axis=2) > (self.pixel_diff_threshold * 255.0) ** 2
+
+    def _pixel_diff(self, lab2: np.ndarray, changed: np.ndarray) -> np.ndarray:
         i_lab2 = lab2.astype(np.uint32).transpose((2, 0, 1))
         i_lab2 = (i_lab2[0] << 16) | (i_lab2[1] << 8) | i_lab2[2]
+        xs, ys = np.where(changed)
+        return np.stack([xs.astype(np.uint32), ys.astype(np.uint32), i_lab2[xs, ys]])
+
+    def _tile_diff(self, lab2: np.ndarray, changed: np.ndarray) -> np.ndarray:
+        height, width, _ = lab2.shape
+        t = self.tile_size
+        rows, cols = -(-height // t), -(-width // t)
+        pad = ((0, rows * t - height), (0, cols * t - width))
 
-        distances = ((f_lab1 - f_lab2) ** 2).sum(axis=2) ** 0.5
-        xs, ys = np.where(distances > self.pixel_diff_threshold)
+        tile_mask = np.pad(changed, pad).reshape((rows, t, cols, t)).any(axis=(1, 3))
+        blocks = np.pad(lab2, (*pad, (0, 0))).reshape((rows, t, cols, t, 3)) \
+            .transpose((0, 2, 4, 1, 3))[tile_mask]
+        return _pack_tile_diff(t, tile_mask, blocks)
 
-        diff_data = np.stack([xs.astype(np.uint32), ys.astype(np.uint32), i_lab2[xs, ys]])
-        deflation = (lab2.nbytes - diff_data.nbytes) / lab2.nbytes
+    def _is_identical(self, lab: np.ndarray) -> bool:
+        # the downsampled signature rejects most of the changed frames cheaply,
+        # the full comparison is still much cheaper than a diff
+        s = self.signature_stride
+        if not np.array_equal(lab[::s, ::s], self._last_lab[::s, ::s]):
+            return False
+        return np.array_equal(lab, self._last_lab)
+
+    def _encode_diff(self, lab: np.ndarray, changed: np.ndarray):
+        if self.tile_size:
+            return VisionItemType.TILE_DIFF_FRAME, self._tile_diff(lab, changed)
+        else:
+            return VisionItemType.DIFF_FRAME, self._pixel_diff(lab, changed)
+
+    def _try_append_diff_frame(self, lab: np.ndarray, timestamp: float):
+        changed = self._changed_pixels(self._last_lab, lab)
+        type_, diff_data = self._encode_diff(lab, changed)
+        deflation = (lab.nbytes - diff_data.nbytes) / lab.nbytes
+        if self.metrics is not None:
+            self.metrics.observe('deflation', deflation, RATIO_BUCKETS)
 
         if deflation < self.min_deflation:  # two low, just create a new frame
-            self._append_new_frame(view, timestamp)
+            self._append_new_frame(lab, timestamp)
         else:  # create a diff frame
-            self._last_view = view
-            self._records.append(VisionItem(VisionItemType.DIFF_FRAME, timestamp, diff_data))
+            self._last_lab = lab
+            self._emit(VisionItem(type_, timestamp, diff_data, scale=self.scale))
 
     def append(self, view: Image.Image, timestamp: float):
-        if self._records and self._records[-1].timestamp > timestamp:
+        self.append_lab(_image_to_lab(view), timestamp)
+
+    def append_lab(self, lab: np.ndarray, timestamp: float):
+        # lab should be an uint8 array of shape (height, width, 3)
+        if self._last_timestamp is not None and self._last_timestamp > timestamp:
             raise ValueError('Timestamp should be monotonically increasing, '
-                             f'but it was detected that the previous timestamp was {self._records[-1].timestamp!r}, '
+                             f'but it was detected that the previous timestamp was {self._last_timestamp!r}, '
                              f'while this one is {timestamp}.')
 
-        if self._last_view is None or self._last_view.size != view.size or \
-                (len(self._records) - self._last_new_frame) > self.max_diff_frames:
-            self._append_new_frame(view, timestamp)
+        if self._last_lab is None or self._last_lab.shape != lab.shape or \
+                (self._count - self._last_new_frame) > self.max_diff_frames:
+            self._append_new_frame(lab, timestamp)
+        elif self.skip_identical and self._is_identical(lab):
+            self.skipped += 1
+            return
         else:
-            self._try_append_diff_frame(view, timestamp)
+            self._try_append_diff_frame(lab, timestamp)
+
+        for level, level_lab in _pyramid_levels(lab, self.pyramid):
+            self.pyramid[level].append_lab(level_lab, timestamp)
+
+    def _emit_pyramid(self, item: VisionItem):
+        if self.sink is not None:
+            self.sink(item)
+        else:
+            self._pyramid_records[item.scale].append(item)
 
     def append_base64_url(self, url: str, timestamp: float):
         self.append(_base64_url_to_image(url), timestamp)
 
-    def to_json(self):
+    def to_json(self, executor: Optional[Executor] = None):
+        if executor is not None:  # compression of the items can run in parallel
+            return list(executor.map(VisionItem.to_json, self._records))
         return [item.to_json() for item in self._records]
+
+    def pyramid_to_json(self, executor: Optional[Executor] = None) -> Dict[str, list]:
+        # {scale: items}, the same layout as 'pyramid' of json records
+        retval = {}
+        for level, items in self._pyramid_records.items():
+            if executor is not None:
+                retval[str(level)] = list(executor.map(VisionItem.to_json, items))
+            else:
+                retval[str(level)] = [item.to_json() for item in items]
+        return retval
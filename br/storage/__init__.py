@@ -0,0 +1,4 @@
+from .container import RecordWriter, RecordReader, PayloadRef, StreamType, EventBlockType, is_container_file, \
+    recover_container, pyramid_stream, pyramid_streams
+from .convert import json_to_container, container_to_json
+from .json_reader import JsonRecordReader
@@ -0,0 +1,339 @@
+import io
+import json
+import mmap
+import os
+import struct
+import zipfile
+import zlib
+from enum import IntEnum
+from threading import Lock
+from typing import List, Optional, Dict, Any
+
+import numpy as np
+
+_MAGIC = b'BRRC'
+_TRAILER_MAGIC = b'BRIX'
+_CHUNK_MAGIC = b'CHNK'
+_VERSION = 1
+
+_HEADER = struct.Struct('<4sHH')  # magic, version, reserved
+_CHUNK_HEADER = struct.Struct('<4sBB2xdQ')  # magic, stream, type, timestamp, payload length
+_TRAILER = struct.Struct('<QQQ4s')  # index offset, index count, metadata length, magic
+
+INDEX_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('stream', 'u1'),
+    ('type', 'u1'),
+    ('_reserved', 'V6'),
+    ('offset', '<u8'),
+    ('length', '<u8'),
+])
+assert INDEX_DTYPE.itemsize == 32
+
+
+class StreamType(IntEnum):
+    EVENTS = 0x0
+    PAGE_VISION = 0x1
+    SYSTEM_VISION = 0x2
+
+
+def pyramid_stream(stream: int, scale: int) -> int:
+    # stream of downsampled frames, e.g. 0x21 for page frames at 1/4, scale should be a power of 2
+    shift = int(scale).bit_length() - 1
+    if scale < 2 or (1 << shift) != scale or shift > 0xf:
+        raise ValueError(f'Pyramid scale should be a power of 2 in [2, 32768], but {scale!r} found.')
+    return (shift << 4) | int(stream)
+
+
+def pyramid_streams(index: np.ndarray, stream: int) -> Dict[int, int]:
+    # {scale: stream} of the pyramid levels of stream in the index
+    retval = {}
+    for value in np.unique(index['stream']).tolist():
+        if value & 0xf == int(stream) and value >> 4:
+            retval[1 << (value >> 4)] = value
+    return dict(sorted(retval.items()))
+
+
+class EventBlockType(IntEnum):
+    JSON = 0x1
+    COLUMNS = 0x2  # high-frequency events as columns, see listener.js
+
+
+def is_container_file(file) -> bool:
+    with open(file, 'rb') as f:
+        return f.read(len(_MAGIC)) == _MAGIC
+
+
+def _dumps_events(events: List[dict]) -> bytes:
+    return zlib.compress(json.dumps(events).encode())
+
+
+def _loads_events(payload: bytes) -> List[dict]:
+    return json.loads(zlib.decompress(payload).decode())
+
+
+def _dumps_columns(columns: Dict[str, Dict[str, np.ndarray]]) -> bytes:
+    with io.BytesIO() as bio:
+        np.savez_compressed(bio, **{
+            f'{event}.{name}': np.asarray(column, dtype=np.float64)
+            for event, event_columns in columns.items() for name, column in event_columns.items()
+        })
+        return bio.getvalue()
+
+
+def _loads_columns(payload: bytes) -> Dict[str, Dict[str, np.ndarray]]:
+    columns = {}
+    with io.BytesIO(payload) as bio, np.load(bio) as npz:
+        for key in npz.files:
+            event, name = key.split('.', maxsplit=1)
+            columns.setdefault(event, {})[name] = npz[key]
+    return columns
+
+
+def _merge_columns(columns: Dict[str, Dict[str, np.ndarray]], new_columns: Dict[str, Dict[str, np.ndarray]]):
+    for event, event_columns in new_columns.items():
+        if event not in columns:
+            columns[event] = {name: np.asarray(column, dtype=np.float64) for name, column in event_columns.items()}
+        else:
+            for name, column in event_columns.items():
+                columns[event][name] = np.concatenate([columns[event][name], np.asarray(column, dtype=np.float64)])
+
+
+def _count_events(counts: Dict[str, int], events: List[dict]):
+    for item in events:
+        counts[item['event']] = counts.get(item['event'], 0) + 1
+
+
+def _count_columns(counts: Dict[str, int], columns: Dict[str, Dict[str, np.ndarray]]):
+    for event, event_columns in columns.items():
+        counts[event] = counts.get(event, 0) + len(event_columns['time'])
+
+
+def _write_footer(f, index_offset: int, index: list, event_counts: Dict[str, int],
+                  metadata: Optional[Dict[str, Any]] = None):
+    index = np.array(index, dtype=INDEX_DTYPE)
+    meta = {
+        **(metadata or {}),
+        'version': _VERSION,
+        'event_count': sum(event_counts.values()),
+        'event_counts': event_counts,
+        'vision_counts': {
+            stream.name.lower(): int((index['stream'] == stream).sum())
+            for stream in StreamType if stream != StreamType.EVENTS
+        },
+    }
+    meta_bytes = json.dumps(meta).encode()
+
+    f.write(index.tobytes())
+    f.write(meta_bytes)
+    f.write(_TRAILER.pack(index_offset, len(index), len(meta_bytes), _TRAILER_MAGIC))
+
+
+class RecordWriter:
+    def __init__(self, file, flush: bool = False):
+        self.file = file
+        self.flush = flush
+        save_dir = os.path.dirname(self.file)
+        if save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+
+        self._f = open(self.file, 'wb')
+        self._f.write(_HEADER.pack(_MAGIC, _VERSION, 0))
+        self._offset = _HEADER.size
+        self._index = []
+        self._event_counts: Dict[str, int] = {}
+        self._closed = False
+        self._lock = Lock()
+
+    @property
+    def bytes_written(self) -> int:
+        return self._offset
+
+    def write_chunk(self, stream: int, type_: int, timestamp: float, payload: bytes):
+        with self._lock:
+            if self._closed:
+                raise ValueError(f'Record writer of {self.file!r} is already closed.')
+
+            self._f.write(_CHUNK_HEADER.pack(_CHUNK_MAGIC, int(stream), int(type_), timestamp, len(payload)))
+            self._f.write(payload)
+            if self.flush:  # make sure the chunk survives a crash of this process
+                self._f.flush()
+
+            offset = self._offset + _CHUNK_HEADER.size
+            self._index.append((timestamp, int(stream), int(type_), b'', offset, len(payload)))
+            self._offset = offset + len(payload)
+
+    def write_vision(self, stream: int, type_: int, timestamp: float, payload: bytes):
+        self.write_chunk(stream, type_, timestamp, payload)
+
+    def write_events(self, events: List[dict]):
+        if not events:
+            return
+        with self._lock:
+            _count_events(self._event_counts, events)
+        self.write_chunk(StreamType.EVENTS, EventBlockType.JSON, events[0]['time'], _dumps_events(events))
+
+    def write_event_columns(self, columns: Dict[str, Dict[str, np.ndarray]]):
+        columns = {event: event_columns for event, event_columns in columns.items() if len(event_columns['time'])}
+        if not columns:
+            return
+        with self._lock:
+            _count_columns(self._event_counts, columns)
+        timestamp = min(float(np.min(event_columns['time'])) for event_columns in columns.values())
+        self.write_chunk(StreamType.EVENTS, EventBlockType.COLUMNS, timestamp, _dumps_columns(columns))
+
+    def close(self, metadata: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            if self._closed:
+                return
+
+            _write_footer(self._f, self._offset, self._index, self._event_counts, metadata)
+            self._offset = self._f.tell()  # with the footer, the size of the file
+            self._f.close()
+            self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class PayloadRef:
+    __slots__ = ('reader', 'offset', 'length')
+
+    def __init__(self, reader: 'RecordReader', offset: int, length: int):
+        self.reader = reader
+        self.offset = offset
+        self.length = length
+
+    def read(self) -> bytes:
+        return self.reader.payload(self.offset, self.length)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} offset: {self.offset}, length: {self.length}>'
+
+
+class RecordReader:
+    def __init__(self, file):
+        self.file = file
+        self._f = open(self.file, 'rb')
+        try:
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file cannot be mapped
+            self._f.close()
+            raise ValueError(f'Empty record file - {self.file!r}.')
+
+        if len(self._mm) < _HEADER.size:
+            self.close()
+            raise ValueError(f'Not a record container - {self.file!r}.')
+        magic, version, _ = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError(f'Not a record container - {self.file!r}.')
+        if version > _VERSION:
+            self.close()
+            raise ValueError(f'Unsupported record container version {version!r} in {self.file!r}.')
+        if len(self._mm) < _HEADER.size + _TRAILER.size:  # killed before the first chunk was complete
+            self.close()
+            raise ValueError(f'Record container {self.file!r} is not finalized, '
+                             f'please use recover_container to recover it.')
+
+        index_offset, index_count, meta_length, trailer_magic = \
+            _TRAILER.unpack_from(self._mm, len(self._mm) - _TRAILER.size)
+        if trailer_magic != _TRAILER_MAGIC:
+            self.close()
+            raise ValueError(f'Record container {self.file!r} is not finalized, '
+                             f'please use recover_container to recover it.')
+
+        index_end = index_offset + index_count * INDEX_DTYPE.itemsize
+        self.index = np.frombuffer(self._mm[index_offset:index_end], dtype=INDEX_DTYPE)
+        self.metadata = json.loads(self._mm[index_end:index_end + meta_length].decode())
+
+    @property
+    def start_time(self) -> float:
+        return self.metadata['start_time']
+
+    @property
+    def end_time(self) -> float:
+        return self.metadata['end_time']
+
+    def entries(self, stream: int) -> np.ndarray:
+        return self.index[self.index['stream'] == int(stream)]
+
+    def payload(self, offset: int, length: int) -> bytes:
+        return self._mm[offset:offset + length]
+
+    def payload_ref(self, entry) -> PayloadRef:
+        return PayloadRef(self, int(entry['offset']), int(entry['length']))
+
+    def read_events(self) -> List[dict]:
+        events = []
+        for entry in self.entries(StreamType.EVENTS):
+            if entry['type'] == EventBlockType.JSON:
+                events.extend(_loads_events(self.payload(entry['offset'], entry['length'])))
+        # blocks are flushed independently while recording, so they may interleave a little
+        events.sort(key=lambda x: x['time'])
+        return events
+
+    def read_event_columns(self) -> Dict[str, Dict[str, np.ndarray]]:
+        columns = {}
+        for entry in self.entries(StreamType.EVENTS):
+            if entry['type'] == EventBlockType.COLUMNS:
+                _merge_columns(columns, _loads_columns(self.payload(entry['offset'], entry['length'])))
+        return columns
+
+    def close(self):
+        if not self._mm.closed:
+            self._mm.close()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def recover_container(file) -> int:
+    # rebuild the footer of a container which was not finalized (e.g. the recording process was killed),
+    # chunks are scanned from the beginning and the incomplete tail is truncated
+    with open(file, 'r+b') as f:
+        f.seek(0, os.SEEK_END)
+        file_size = f.tell()
+        f.seek(0)
+        magic, version, _ = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError(f'Not a record container - {file!r}.')
+
+        offset = _HEADER.size
+        index, event_counts = [], {}
+        while offset + _CHUNK_HEADER.size <= file_size:
+            f.seek(offset)
+            chunk_magic, stream, type_, timestamp, length = _CHUNK_HEADER.unpack(f.read(_CHUNK_HEADER.size))
+            payload_offset = offset + _CHUNK_HEADER.size
+            if chunk_magic != _CHUNK_MAGIC or payload_offset + length > file_size:
+                break
+
+            if stream == StreamType.EVENTS:
+                try:
+                    if type_ == EventBlockType.COLUMNS:
+                        _count_columns(event_counts, _loads_columns(f.read(length)))
+                    else:
+                        _count_events(event_counts, _loads_events(f.read(length)))
+                except (zlib.error, zipfile.BadZipFile, ValueError, OSError, KeyError):
+                    break
+
+            index.append((timestamp, stream, type_, b'', payload_offset, length))
+            offset = payload_offset + length
+
+        timestamps = [timestamp for timestamp, *_ in index]
+        f.seek(offset)
+        f.truncate()
+        _write_footer(f, offset, index, event_counts, {
+            'start_time': min(timestamps) if timestamps else None,
+            'end_time': max(timestamps) if timestamps else None,
+            'recovered': True,
+        })
+
+    return len(index)
@@ -0,0 +1,72 @@
+import json
+import os
+
+from hbutils.encoding import base64_decode, base64_encode
+
+from .container import RecordWriter, RecordReader, StreamType, pyramid_stream, pyramid_streams
+from ..page.vision import VisionItemType
+
+_VISION_STREAMS = [
+    ('page_vision', StreamType.PAGE_VISION),
+    ('system_vision', StreamType.SYSTEM_VISION),
+]
+
+
+def json_to_container(json_file: str, container_file: str, event_block_size: int = 4096):
+    with open(json_file, 'r') as f:
+        data = json.load(f)
+
+    with RecordWriter(container_file) as writer:
+        events = data['events']
+        for i in range(0, len(events), event_block_size):
+            writer.write_events(events[i:i + event_block_size])
+        if data.get('event_columns'):
+            writer.write_event_columns(data['event_columns'])
+
+        for key, stream in _VISION_STREAMS:
+            for item in data[key]:
+                writer.write_vision(stream, VisionItemType.loads(item['type']),
+                                    item['timestamp'], base64_decode(item['data']))
+            for scale, items in (data.get('pyramid') or {}).get(key, {}).items():
+                for item in items:
+                    writer.write_vision(pyramid_stream(stream, int(scale)), VisionItemType.loads(item['type']),
+                                        item['timestamp'], base64_decode(item['data']))
+
+        writer.close({'start_time': data['start_time'], 'end_time': data['end_time']})
+
+
+def _vision_to_json(reader: RecordReader, stream: int) -> list:
+    return [
+        {
+            'type': VisionItemType(entry['type']).name.lower(),
+            'timestamp': float(entry['timestamp']),
+            'data': base64_encode(reader.payload(entry['offset'], entry['length'])),
+        }
+        for entry in reader.entries(stream)
+    ]
+
+
+def container_to_json(container_file: str, json_file: str):
+    with RecordReader(container_file) as reader:
+        data = {
+            'start_time': reader.start_time,
+            'end_time': reader.end_time,
+            'events': reader.read_events(),
+        }
+        columns = reader.read_event_columns()
+        if columns:
+            data['event_columns'] = {
+                event: {name: column.tolist() for name, column in event_columns.items()}
+                for event, event_columns in columns.items()
+            }
+        for key, stream in _VISION_STREAMS:
+            data[key] = _vision_to_json(reader, stream)
+            for scale, level_stream in pyramid_streams(reader.index, stream).items():
+                data.setdefault('pyramid', {}).setdefault(key, {})[str(scale)] = \
+                    _vision_to_json(reader, level_stream)
+
+    save_dir = os.path.dirname(json_file)
+    if save_dir:
+        os.makedirs(save_dir, exist_ok=True)
+    with open(json_file, 'w') as f:
+        json.dump(data, f, indent=4)
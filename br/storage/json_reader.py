@@ -0,0 +1,265 @@
+import json
+import mmap
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+
+import numpy as np
+from hbutils.encoding import base64_decode
+
+from .container import PayloadRef, StreamType, INDEX_DTYPE, pyramid_stream
+from ..page.vision import VisionItemType
+
+_WHITESPACE = b' \t\r\n'
+_MIN_WINDOW = 1 << 14
+
+_VISION_KEYS = {
+    'page_vision': StreamType.PAGE_VISION,
+    'system_vision': StreamType.SYSTEM_VISION,
+}
+
+# byte range of each event in the json file
+EVENT_INDEX_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('offset', '<u8'),
+    ('length', '<u8'),
+])
+
+
+class _Scanner:
+    # walks a json record once. Small values are decoded from a sliding text window,
+    # while the huge base64 strings of frames are skipped by searching their closing quote
+    def __init__(self, mm: mmap.mmap):
+        self._mm = mm
+        self._decoder = json.JSONDecoder()
+        self._window = ''
+        self._window_start = 0
+        self._window_ascii = True
+        self.pos = 0
+
+    def skip_whitespace(self):
+        mm, pos = self._mm, self.pos
+        while pos < len(mm) and mm[pos] in _WHITESPACE:
+            pos += 1
+        self.pos = pos
+
+    def peek(self) -> bytes:
+        self.skip_whitespace()
+        if self.pos >= len(self._mm):
+            raise ValueError('Unexpected end of json record.')
+        return self._mm[self.pos:self.pos + 1]
+
+    def expect(self, char: bytes):
+        if self.peek() != char:
+            raise ValueError(f'Expected {char.decode()!r} at byte {self.pos}, '
+                             f'but {self._mm[self.pos:self.pos + 1].decode()!r} found.')
+        self.pos += 1
+
+    def value(self) -> Tuple[Any, int, int]:
+        # decodes a small json value, returns (value, start, end)
+        self.skip_whitespace()
+        start, size = self.pos, _MIN_WINDOW
+        while True:
+            window_end = self._window_start + len(self._window)
+            if not (self._window_ascii and self._window_start <= start and
+                    start + min(size, len(self._mm) - start) <= window_end):
+                raw = self._mm[start:start + size]
+                self._window = raw.decode('utf-8', errors='ignore')  # the last character may be cut
+                self._window_start = start
+                # with ensure_ascii of json.dump, byte offsets are character offsets
+                self._window_ascii = len(self._window) == len(raw)
+                window_end = start + len(raw)
+
+            try:
+                obj, end = self._decoder.raw_decode(self._window, start - self._window_start)
+            except json.JSONDecodeError:
+                end = None
+            if end is not None:
+                end = start + len(self._window[:end].encode()) if not self._window_ascii \
+                    else end + self._window_start
+            # a value ending exactly at the window end (e.g. a number) may be cut, so decode again
+            if end is not None and (end < window_end or window_end >= len(self._mm)):
+                self.pos = end
+                return obj, start, end
+            if window_end >= len(self._mm):
+                raise ValueError(f'Invalid json value at byte {start}.')
+            size *= 4
+
+    def key(self) -> str:
+        key, _, _ = self.value()
+        self.expect(b':')
+        return key
+
+    def string_span(self) -> Tuple[int, int]:
+        # byte range of a string's content, without decoding it
+        self.expect(b'"')
+        start = self.pos
+        end = self._mm.find(b'"', start)
+        while end > 0 and self._mm[end - 1] == 0x5c:  # escaped quote, count the backslashes
+            backslashes = 0
+            while self._mm[end - 1 - backslashes] == 0x5c:
+                backslashes += 1
+            if backslashes % 2 == 0:
+                break
+            end = self._mm.find(b'"', end + 1)
+        if end < 0:
+            raise ValueError(f'Unterminated string at byte {start}.')
+        self.pos = end + 1
+        return start, end
+
+    def separator(self, close: bytes) -> bool:
+        # True when there is another item
+        char = self.peek()
+        self.pos += 1
+        if char == b',':
+            return True
+        elif char == close:
+            return False
+        else:
+            raise ValueError(f'Expected {close.decode()!r} or \',\' at byte {self.pos - 1}, '
+                             f'but {char.decode()!r} found.')
+
+    def items(self, open_: bytes, close: bytes):
+        self.expect(open_)
+        if self.peek() == close:
+            self.pos += 1
+            return
+        while True:
+            yield
+            if not self.separator(close):
+                return
+
+
+class JsonRecordReader:
+    # reads a json record without json.load, the file is scanned once into an offset index of events and
+    # frames, and frames are decoded from their byte range when needed. Same interface as RecordReader
+    def __init__(self, file):
+        self.file = file
+        self._f = open(self.file, 'rb')
+        try:
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file cannot be mapped
+            self._f.close()
+            raise ValueError(f'Empty record file - {self.file!r}.')
+
+        self._values: Dict[str, Any] = {}
+        self._events_span: Optional[Tuple[int, int]] = None
+        self._event_index: List[Tuple[float, int, int]] = []
+        self._event_counts = Counter()
+        self._vision_index: List[Tuple[float, int, int, int, int]] = []
+        try:
+            self._scan()
+        except Exception:
+            self.close()
+            raise
+
+        index = np.zeros(len(self._vision_index), dtype=INDEX_DTYPE)
+        if self._vision_index:
+            timestamps, streams, types, offsets, lengths = zip(*self._vision_index)
+            index['timestamp'], index['stream'], index['type'] = timestamps, streams, types
+            index['offset'], index['length'] = offsets, lengths
+        self.index = index
+        self.event_index = np.array(self._event_index, dtype=EVENT_INDEX_DTYPE)
+        del self._vision_index, self._event_index
+
+        for event, columns in (self._values.get('event_columns') or {}).items():
+            self._event_counts[event] += len(columns.get('time', []))
+        self.metadata = {
+            'start_time': self._values['start_time'],
+            'end_time': self._values['end_time'],
+            'event_count': sum(self._event_counts.values()),
+            'event_counts': dict(self._event_counts),
+            'vision_counts': {key: int((self.index['stream'] == stream).sum()) for key, stream in _VISION_KEYS.items()},
+        }
+
+    def _scan(self):
+        scanner = _Scanner(self._mm)
+        for _ in scanner.items(b'{', b'}'):
+            key = scanner.key()
+            if key in _VISION_KEYS:
+                self._scan_vision(scanner, _VISION_KEYS[key])
+            elif key == 'events':
+                self._scan_events(scanner)
+            elif key == 'pyramid':  # {'page_vision': {'4': [items]}}
+                for _ in scanner.items(b'{', b'}'):
+                    stream = _VISION_KEYS[scanner.key()]
+                    for _ in scanner.items(b'{', b'}'):
+                        self._scan_vision(scanner, pyramid_stream(stream, int(scanner.key())))
+            else:
+                self._values[key], _, _ = scanner.value()
+
+    def _scan_events(self, scanner: _Scanner):
+        scanner.skip_whitespace()
+        start = scanner.pos
+        for _ in scanner.items(b'[', b']'):
+            event, event_start, event_end = scanner.value()
+            self._event_index.append((event['time'], event_start, event_end - event_start))
+            self._event_counts[event['event']] += 1
+        self._events_span = (start, scanner.pos)
+
+    def _scan_vision(self, scanner: _Scanner, stream: StreamType):
+        for _ in scanner.items(b'[', b']'):
+            item, span = {}, None
+            for _ in scanner.items(b'{', b'}'):
+                key = scanner.key()
+                if key == 'data':
+                    span = scanner.string_span()
+                else:
+                    item[key], _, _ = scanner.value()
+            type_ = int(VisionItemType.loads(item['type']))
+            self._vision_index.append((item['timestamp'], int(stream), type_, span[0], span[1] - span[0]))
+
+    @property
+    def start_time(self) -> float:
+        return self.metadata['start_time']
+
+    @property
+    def end_time(self) -> float:
+        return self.metadata['end_time']
+
+    def entries(self, stream: int) -> np.ndarray:
+        return self.index[self.index['stream'] == int(stream)]
+
+    def payload(self, offset: int, length: int) -> bytes:
+        # compressed payload, the same as the one in containers
+        text = self._mm[offset:offset + length]
+        if b'\\' in text:  # json escapes are not expected in base64, but still valid json
+            text = json.loads(b'"' + text + b'"').encode()
+        return base64_decode(text.decode())
+
+    def payload_ref(self, entry) -> PayloadRef:
+        return PayloadRef(self, int(entry['offset']), int(entry['length']))
+
+    def read_event(self, index: int) -> dict:
+        entry = self.event_index[index]
+        return json.loads(self._mm[entry['offset']:entry['offset'] + entry['length']])
+
+    def iter_events(self) -> Iterator[dict]:
+        # one event at a time, in the order of the file
+        if self._events_span is None:
+            return
+        scanner = _Scanner(self._mm)
+        scanner.pos, _ = self._events_span
+        for _ in scanner.items(b'[', b']'):
+            event, _, _ = scanner.value()
+            yield event
+
+    def read_events(self) -> List[dict]:
+        # the same as json.load
+        return list(self.iter_events())
+
+    def read_event_columns(self) -> Dict[str, Dict[str, np.ndarray]]:
+        return {
+            event: {name: np.asarray(column, dtype=np.float64) for name, column in columns.items()}
+            for event, columns in (self._values.get('event_columns') or {}).items()
+        }
+
+    def close(self):
+        if not self._mm.closed:
+            self._mm.close()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
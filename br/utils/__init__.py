@@ -1,2 +1,3 @@
-from .capture import capture_screen
+from .capture import capture_screen, capture_screen_array
 from .selenium import get_browser_driver
+from .x11 import X11Grabber, get_x11_grabber, close_x11_grabber
@@ -3,12 +3,34 @@ import shutil
 import subprocess
 import time
 from tempfile import TemporaryDirectory
-from typing import Tuple
+from typing import Tuple, Union
 
+import numpy as np
 from PIL import Image, ImageGrab
 
+from .x11 import get_x11_grabber
 
-def capture_screen() -> Tuple[Image.Image, float]:
+
+def _capture() -> Tuple[Union[np.ndarray, Image.Image], float]:
+    # RGB array grabbed in-process when an X display is available, otherwise an image from scrot or PIL
+    grabber = get_x11_grabber()
+    if grabber is not None:
+        timestamp = time.time()
+        try:
+            return grabber.grab(), timestamp
+        except OSError:  # e.g. the display went away, captured with PIL instead
+            pass
+    return _capture_screen_image()
+
+
+def capture_screen_array() -> Tuple[np.ndarray, float]:
+    screen, timestamp = _capture()
+    if isinstance(screen, Image.Image):
+        screen = np.asarray(screen.convert('RGB'))
+    return screen, timestamp
+
+
+def _capture_screen_image() -> Tuple[Image.Image, float]:
     if shutil.which('scrot'):
         with TemporaryDirectory() as td:
             filename = os.path.join(td, 'screen.png')
@@ -23,3 +45,10 @@ def capture_screen() -> Tuple[Image.Image, float]:
         image = ImageGrab.grab()
 
     return image, timestamp
+
+
+def capture_screen() -> Tuple[Image.Image, float]:
+    screen, timestamp = _capture()
+    if isinstance(screen, np.ndarray):
+        screen = Image.fromarray(screen)
+    return screen, timestamp
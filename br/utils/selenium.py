@@ -1,19 +1,29 @@
+from typing import Optional, Tuple
+
 import browsers
-from selenium.webdriver import Chrome
+from selenium.webdriver import Chrome, ChromeOptions
 from selenium.webdriver.remote.webdriver import WebDriver
 from webdriver_manager.dispatch import get_browser_manager
 
 _ORDER = ['chrome', 'firefox', 'msedge', 'opera']
 
 
-def get_browser_driver() -> WebDriver:
+def get_browser_driver(headless: bool = False, window_size: Optional[Tuple[int, int]] = None) -> WebDriver:
     for b in _ORDER:
         browser = browsers.get(b)
         if not browser:
             continue
 
         bm = get_browser_manager(b)
-        chrome = Chrome(bm.driver_executable)
+        options = ChromeOptions()
+        # devtools events (e.g. frames of the screencast backend) are read from the performance log
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': False, 'enablePage': True})
+        if headless:
+            options.add_argument('--headless=new')
+        if window_size is not None:
+            options.add_argument(f'--window-size={window_size[0]},{window_size[1]}')
+        chrome = Chrome(bm.driver_executable, options=options)
         return chrome
     else:
         raise ModuleNotFoundError('No browser detected!.')
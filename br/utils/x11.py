@@ -0,0 +1,224 @@
+import ctypes
+import ctypes.util
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+
+_ZPIXMAP = 2
+_ALL_PLANES = 0xffffffffffffffff if ctypes.sizeof(ctypes.c_ulong) == 8 else 0xffffffff
+_IPC_PRIVATE = 0
+_IPC_CREAT = 0o1000
+_IPC_RMID = 0
+_SHMAT_FAILED = ctypes.c_void_p(-1).value
+
+
+class _XImage(ctypes.Structure):
+    _fields_ = [
+        ('width', ctypes.c_int),
+        ('height', ctypes.c_int),
+        ('xoffset', ctypes.c_int),
+        ('format', ctypes.c_int),
+        ('data', ctypes.c_void_p),
+        ('byte_order', ctypes.c_int),
+        ('bitmap_unit', ctypes.c_int),
+        ('bitmap_bit_order', ctypes.c_int),
+        ('bitmap_pad', ctypes.c_int),
+        ('depth', ctypes.c_int),
+        ('bytes_per_line', ctypes.c_int),
+        ('bits_per_pixel', ctypes.c_int),
+        ('red_mask', ctypes.c_ulong),
+        ('green_mask', ctypes.c_ulong),
+        ('blue_mask', ctypes.c_ulong),
+    ]
+
+
+class _XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ('shmseg', ctypes.c_ulong),
+        ('shmid', ctypes.c_int),
+        ('shmaddr', ctypes.c_void_p),
+        ('readOnly', ctypes.c_int),
+    ]
+
+
+def _load_library(name: str):
+    path = ctypes.util.find_library(name)
+    return ctypes.CDLL(path) if path else None
+
+
+def _declare(lib, name, restype, *argtypes):
+    func = getattr(lib, name)
+    func.restype = restype
+    func.argtypes = list(argtypes)
+    return func
+
+
+class X11Grabber:
+    # in-process screen grabber, uses a reusable MIT-SHM segment when the server supports it,
+    # otherwise falls back to XGetImage
+    def __init__(self, display: Optional[str] = None, use_shm: bool = True):
+        self._xlib = _load_library('X11')
+        if self._xlib is None:
+            raise OSError('libX11 not found.')
+        self._setup_xlib()
+
+        self._display = self._xlib.XOpenDisplay(display.encode() if display else None)
+        if not self._display:
+            raise OSError(f'Unable to open X display {display or os.environ.get("DISPLAY")!r}.')
+
+        screen = self._xlib.XDefaultScreen(self._display)
+        self._root = self._xlib.XDefaultRootWindow(self._display)
+        self._visual = self._xlib.XDefaultVisual(self._display, screen)
+        self._depth = self._xlib.XDefaultDepth(self._display, screen)
+        self.width = self._xlib.XDisplayWidth(self._display, screen)
+        self.height = self._xlib.XDisplayHeight(self._display, screen)
+
+        self._shm_image = None
+        self._shm_info = None
+        if use_shm:
+            self._setup_shm()
+
+    def _setup_xlib(self):
+        x = self._xlib
+        _declare(x, 'XOpenDisplay', ctypes.c_void_p, ctypes.c_char_p)
+        _declare(x, 'XCloseDisplay', ctypes.c_int, ctypes.c_void_p)
+        _declare(x, 'XDefaultScreen', ctypes.c_int, ctypes.c_void_p)
+        _declare(x, 'XDefaultRootWindow', ctypes.c_ulong, ctypes.c_void_p)
+        _declare(x, 'XDefaultVisual', ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int)
+        _declare(x, 'XDefaultDepth', ctypes.c_int, ctypes.c_void_p, ctypes.c_int)
+        _declare(x, 'XDisplayWidth', ctypes.c_int, ctypes.c_void_p, ctypes.c_int)
+        _declare(x, 'XDisplayHeight', ctypes.c_int, ctypes.c_void_p, ctypes.c_int)
+        _declare(x, 'XSync', ctypes.c_int, ctypes.c_void_p, ctypes.c_int)
+        _declare(x, 'XGetImage', ctypes.POINTER(_XImage), ctypes.c_void_p, ctypes.c_ulong,
+                 ctypes.c_int, ctypes.c_int, ctypes.c_uint, ctypes.c_uint, ctypes.c_ulong, ctypes.c_int)
+        _declare(x, 'XDestroyImage', ctypes.c_int, ctypes.POINTER(_XImage))
+
+    def _setup_shm(self):
+        xext, libc = _load_library('Xext'), _load_library('c')
+        if xext is None or libc is None:
+            return
+
+        _declare(xext, 'XShmQueryExtension', ctypes.c_int, ctypes.c_void_p)
+        _declare(xext, 'XShmCreateImage', ctypes.POINTER(_XImage), ctypes.c_void_p, ctypes.c_void_p,
+                 ctypes.c_uint, ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo),
+                 ctypes.c_uint, ctypes.c_uint)
+        _declare(xext, 'XShmAttach', ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo))
+        _declare(xext, 'XShmDetach', ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo))
+        _declare(xext, 'XShmGetImage', ctypes.c_int, ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(_XImage),
+                 ctypes.c_int, ctypes.c_int, ctypes.c_ulong)
+        _declare(libc, 'shmget', ctypes.c_int, ctypes.c_int, ctypes.c_size_t, ctypes.c_int)
+        _declare(libc, 'shmat', ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_int)
+        _declare(libc, 'shmdt', ctypes.c_int, ctypes.c_void_p)
+        _declare(libc, 'shmctl', ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_void_p)
+        if not xext.XShmQueryExtension(self._display):
+            return
+
+        info = _XShmSegmentInfo()
+        image = xext.XShmCreateImage(self._display, self._visual, self._depth, _ZPIXMAP, None,
+                                     ctypes.byref(info), self.width, self.height)
+        if not image:
+            return
+
+        size = image.contents.bytes_per_line * image.contents.height
+        info.shmid = libc.shmget(_IPC_PRIVATE, size, _IPC_CREAT | 0o600)
+        if info.shmid < 0:
+            image.contents.data = None
+            self._xlib.XDestroyImage(image)
+            return
+        shmaddr = libc.shmat(info.shmid, None, 0)
+        if shmaddr is None or shmaddr == _SHMAT_FAILED:  # (void *) -1, the segment is removed and xlib is used
+            libc.shmctl(info.shmid, _IPC_RMID, None)
+            image.contents.data = None
+            self._xlib.XDestroyImage(image)
+            return
+        info.shmaddr = shmaddr
+        image.contents.data = info.shmaddr
+        info.readOnly = 0
+
+        attached = xext.XShmAttach(self._display, ctypes.byref(info))
+        self._xlib.XSync(self._display, 0)
+        # the segment is destroyed as soon as both sides are detached
+        libc.shmctl(info.shmid, _IPC_RMID, None)
+        if not attached:
+            libc.shmdt(info.shmaddr)
+            image.contents.data = None
+            self._xlib.XDestroyImage(image)
+            return
+
+        self._xext, self._libc = xext, libc
+        self._shm_image, self._shm_info = image, info
+
+    @property
+    def use_shm(self) -> bool:
+        return self._shm_image is not None
+
+    @staticmethod
+    def _to_rgb(image: _XImage) -> np.ndarray:
+        if image.bits_per_pixel != 32:
+            raise OSError(f'Unsupported bits per pixel of X image - {image.bits_per_pixel!r}.')
+
+        size = image.bytes_per_line * image.height
+        raw = np.ctypeslib.as_array((ctypes.c_uint8 * size).from_address(image.data))
+        pixels = raw.reshape((image.height, image.bytes_per_line))[:, :image.width * 4] \
+            .reshape((image.height, image.width, 4))
+        if image.red_mask == 0xff0000:  # BGRX in memory
+            return pixels[:, :, [2, 1, 0]]
+        else:
+            return pixels[:, :, [0, 1, 2]]
+
+    def grab(self) -> np.ndarray:
+        # returns an RGB uint8 array of shape (height, width, 3)
+        if self._shm_image is not None:
+            if not self._xext.XShmGetImage(self._display, self._root, self._shm_image, 0, 0, _ALL_PLANES):
+                raise OSError('XShmGetImage failed.')
+            return self._to_rgb(self._shm_image.contents)
+        else:
+            image = self._xlib.XGetImage(self._display, self._root, 0, 0, self.width, self.height,
+                                         _ALL_PLANES, _ZPIXMAP)
+            if not image:
+                raise OSError('XGetImage failed.')
+            try:
+                return self._to_rgb(image.contents)
+            finally:
+                self._xlib.XDestroyImage(image)
+
+    def close(self):
+        if self._shm_image is not None:
+            self._xext.XShmDetach(self._display, ctypes.byref(self._shm_info))
+            self._libc.shmdt(self._shm_info.shmaddr)
+            self._shm_image.contents.data = None
+            self._xlib.XDestroyImage(self._shm_image)
+            self._shm_image, self._shm_info = None, None
+        if self._display:
+            self._xlib.XCloseDisplay(self._display)
+            self._display = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+_LOCAL = threading.local()
+
+
+def get_x11_grabber() -> Optional[X11Grabber]:
+    # one grabber per thread, None when there is no usable X display
+    if not hasattr(_LOCAL, 'grabber'):
+        try:
+            _LOCAL.grabber = X11Grabber() if os.environ.get('DISPLAY') else None
+        except OSError:
+            _LOCAL.grabber = None
+    return _LOCAL.grabber
+
+
+def close_x11_grabber():
+    # closes the grabber of this thread, e.g. when a capture thread exits, the next call opens a new one
+    grabber = getattr(_LOCAL, 'grabber', None)
+    if hasattr(_LOCAL, 'grabber'):
+        del _LOCAL.grabber
+    if grabber is not None:
+        grabber.close()
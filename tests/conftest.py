@@ -0,0 +1,114 @@
+import io
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+from hbutils.encoding import base64_encode
+
+from br.page.monitor import _DRAIN_ALL_SCRIPT
+from br.page.vision import VisionRecorder
+from br.storage import json_to_container
+
+START_TIME = 1000.0
+INTERVAL = 0.1
+
+
+def lab_frames(count: int, height: int = 40, width: int = 56, seed: int = 0):
+    # random frames with a small patch changed each time, so most of them become tile diffs
+    rnd = np.random.RandomState(seed)
+    lab = rnd.randint(0, 256, (height, width, 3)).astype(np.uint8)
+    for _ in range(count):
+        lab = lab.copy()
+        y, x = rnd.randint(0, height - 6), rnd.randint(0, width - 6)
+        lab[y:y + 6, x:x + 6] = rnd.randint(0, 256, (6, 6, 3)).astype(np.uint8)
+        yield lab
+
+
+def make_record_data(count: int = 30, pyramid_scales=(2, 4), seed: int = 0) -> dict:
+    recorder = VisionRecorder(max_diff_frames=8, pyramid_scales=pyramid_scales)
+    frames = []
+    for i, lab in enumerate(lab_frames(count, seed=seed)):
+        recorder.append_lab(lab, START_TIME + i * INTERVAL)
+        frames.append(lab)
+    height, width, _ = frames[0].shape
+    end_time = START_TIME + count * INTERVAL
+    data = {
+        'start_time': START_TIME,
+        'end_time': end_time,
+        'events': [
+            {'event': 'resize', 'time': START_TIME, 'view_width': width, 'view_height': height},
+            {'event': 'scroll', 'time': START_TIME, 'scroll_x': 0, 'scroll_y': 0},
+            {'event': 'click', 'time': START_TIME + 1.0, 'x': 3, 'y': 4, 'text': 'ok'},
+        ],
+        'page_vision': recorder.to_json(),
+        'system_vision': [],
+    }
+    if pyramid_scales:
+        data['pyramid'] = {'page_vision': recorder.pyramid_to_json()}
+    return data
+
+
+@pytest.fixture()
+def record_data():
+    return make_record_data()
+
+
+@pytest.fixture()
+def json_record(tmp_path, record_data):
+    file = str(tmp_path / 'record.json')
+    with open(file, 'w') as f:
+        json.dump(record_data, f, indent=4)
+    return file
+
+
+@pytest.fixture()
+def container_record(tmp_path, json_record):
+    file = str(tmp_path / 'record.brc')
+    json_to_container(json_record, file)
+    return file
+
+
+def png_data_url(rgb: np.ndarray) -> str:
+    with io.BytesIO() as bio:
+        Image.fromarray(rgb).save(bio, format='PNG')
+        return 'data:image/png;base64,' + base64_encode(bio.getvalue())
+
+
+class FakeDriver:
+    # answers drainAll with the queued page states, and records the scripts and devtools commands
+    def __init__(self, states=(), user_agent: str = 'Mozilla/5.0 HeadlessChrome/120.0'):
+        self.states = list(states)
+        self.user_agent = user_agent
+        self.url = 'http://example.com/'
+        self.monitored = False
+        self.registered = False  # scripts registered for new documents
+        self.drains = []
+        self.scripts = []
+        self.cdp = []
+        self.logs = []
+
+    def execute_script(self, script: str, *args):
+        if script == _DRAIN_ALL_SCRIPT:
+            self.drains.append(args[0] if args else None)
+            state = dict(self.states.pop(0)) if self.states else {}
+            if state.pop('navigate', False):  # a new document
+                self.monitored = self.registered
+            self.url = state.pop('url', self.url)
+            return {'url': self.url, 'events': [], 'screenshots': [], **state, 'monitored': self.monitored}
+        elif script == 'return navigator.userAgent;':
+            return self.user_agent
+        else:  # injected listener or html2canvas
+            self.scripts.append(script)
+            self.monitored = True
+            return None
+
+    def execute_cdp_cmd(self, cmd: str, params: dict):
+        self.cdp.append((cmd, params))
+        if cmd == 'Page.addScriptToEvaluateOnNewDocument':
+            self.registered = True
+        return {}
+
+    def get_log(self, name: str):
+        logs, self.logs = self.logs, []
+        return logs
@@ -0,0 +1,104 @@
+import json
+
+import numpy as np
+import pytest
+
+from br.page.backend import ScreenshotBackend, ScreencastBackend, Html2CanvasBackend, get_capture_backend
+from br.page.vision import _image_to_lab
+from .conftest import FakeDriver, png_data_url, lab_frames
+
+
+def _png_base64(rgb: np.ndarray) -> str:
+    # raw base64, as returned by the devtools protocol
+    return png_data_url(rgb).split(',', 1)[1]
+
+
+class _CdpDriver(FakeDriver):
+    def __init__(self, image: np.ndarray):
+        FakeDriver.__init__(self)
+        self.image = image
+
+    def execute_cdp_cmd(self, cmd: str, params: dict):
+        FakeDriver.execute_cdp_cmd(self, cmd, params)
+        if cmd == 'Page.getLayoutMetrics':
+            height, width, _ = self.image.shape
+            return {'cssContentSize': {'width': width, 'height': height}}
+        elif cmd == 'Page.captureScreenshot':
+            return {'data': _png_base64(self.image)}
+        return {}
+
+
+def _screencast_entry(rgb: np.ndarray, session_id: int, timestamp: float, scroll_y: float = 0.0) -> dict:
+    height, width, _ = rgb.shape
+    message = {'message': {'method': 'Page.screencastFrame', 'params': {
+        'data': _png_base64(rgb), 'sessionId': session_id,
+        'metadata': {'timestamp': timestamp, 'deviceWidth': width, 'deviceHeight': height,
+                     'scrollOffsetX': 0, 'scrollOffsetY': scroll_y},
+    }}}
+    return {'message': json.dumps(message), 'timestamp': timestamp * 1000.0}
+
+
+def test_screenshot_interval():
+    rgb = next(lab_frames(1))
+    driver = _CdpDriver(rgb)
+    backend = ScreenshotBackend(interval=60.0)
+    frames = backend.poll(driver, {})
+    assert len(frames) == 1
+    np.testing.assert_array_equal(backend.to_lab(frames[0][0]), _image_to_lab(rgb))
+    assert driver.cdp[-1][1]['clip']['height'] == rgb.shape[0]
+
+    assert backend.poll(driver, {}) == []  # not yet due
+    backend._last_time = None
+    assert backend.poll(driver, {}, ready=False) == []  # encode queue is full
+    assert len([cmd for cmd, _ in driver.cdp if cmd == 'Page.captureScreenshot']) == 1
+
+
+def test_screencast_acks():
+    frames = list(lab_frames(3))
+    driver = FakeDriver()
+    backend = ScreencastBackend()
+    backend.start(driver)
+    assert driver.cdp[-1][0] == 'Page.startScreencast'
+
+    driver.logs = [_screencast_entry(frames[0], 1, 10.0), {'message': json.dumps({'message': {}}), 'timestamp': 0}]
+    assert [timestamp for _, timestamp in backend.poll(driver, {}, ready=False)] == [10.0]
+    assert not [cmd for cmd, _ in driver.cdp if cmd == 'Page.screencastFrameAck']  # held back
+
+    driver.logs = [_screencast_entry(frames[1], 2, 9.0)]
+    assert [timestamp for _, timestamp in backend.poll(driver, {})] == [10.0]  # never goes back in time
+    assert [params['sessionId'] for cmd, params in driver.cdp if cmd == 'Page.screencastFrameAck'] == [1, 2]
+
+    driver.logs = [_screencast_entry(frames[2], 3, 11.0)]
+    backend.poll(driver, {}, ready=False)
+    backend.stop(driver)
+    assert [cmd for cmd, _ in driver.cdp][-2:] == ['Page.screencastFrameAck', 'Page.stopScreencast']
+
+
+def test_screencast_compose():
+    view = next(lab_frames(1, height=20, width=30))
+    backend = ScreencastBackend()
+    lab, offset = backend.to_lab((_png_base64(view), {'deviceWidth': 30, 'deviceHeight': 20,
+                                                      'scrollOffsetY': 15.4}))
+    assert offset == (0, 15)
+    first = backend.compose((lab, (0, 0)))
+    assert first.shape == (20, 30, 3)
+
+    canvas = backend.compose((lab, offset))
+    assert canvas.shape == (35, 30, 3)  # grows with the viewport
+    np.testing.assert_array_equal(canvas[:15], first[:15])
+    np.testing.assert_array_equal(canvas[15:], lab)
+
+    again = backend.compose((np.zeros_like(lab), (0, 0)))
+    assert again.shape == (35, 30, 3) and again is not canvas
+    np.testing.assert_array_equal(canvas[15:], lab)  # the previous canvas is never changed
+
+
+def test_get_capture_backend():
+    backend = ScreencastBackend()
+    assert get_capture_backend(backend) is backend
+    html2canvas = get_capture_backend('html2canvas', interval=0.5)
+    assert isinstance(html2canvas, Html2CanvasBackend) and html2canvas.interval == 0.5
+    with pytest.raises(ValueError):
+        get_capture_backend('webrtc')
+    with pytest.raises(TypeError):
+        get_capture_backend(1)
@@ -0,0 +1,71 @@
+import io
+import threading
+
+import numpy as np
+from PIL import Image
+from hbutils.encoding import base64_encode
+
+from br.page.vision import _base64_url_to_image, _base64_url_to_lab, _image_to_lab
+from br.utils import capture, x11
+
+
+class _FakeGrabber:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.closed = False
+
+    def grab(self):
+        if self.fail:
+            raise OSError('XShmGetImage failed.')
+        return np.full((4, 6, 3), 7, dtype=np.uint8)
+
+    def close(self):
+        self.closed = True
+
+
+def test_capture_with_grabber(monkeypatch):
+    monkeypatch.setattr(capture, 'get_x11_grabber', lambda: _FakeGrabber())
+    array, _ = capture.capture_screen_array()
+    image, _ = capture.capture_screen()
+    assert array.shape == (4, 6, 3)
+    assert image.size == (6, 4) and np.array_equal(np.asarray(image), array)
+
+
+def test_capture_fallback(monkeypatch):
+    fallback = Image.new('RGBA', (5, 3), (1, 2, 3, 255))
+    monkeypatch.setattr(capture, 'get_x11_grabber', lambda: _FakeGrabber(fail=True))
+    monkeypatch.setattr(capture, '_capture_screen_image', lambda: (fallback, 1.0))
+    array, timestamp = capture.capture_screen_array()
+    assert timestamp == 1.0 and array.shape == (3, 5, 3) and array[0, 0].tolist() == [1, 2, 3]
+    image, _ = capture.capture_screen()
+    assert image is fallback
+
+
+def test_close_grabber_of_thread(monkeypatch):
+    grabbers = []
+    monkeypatch.setenv('DISPLAY', ':99')
+    monkeypatch.setattr(x11, 'X11Grabber', lambda: grabbers.append(_FakeGrabber()) or grabbers[-1])
+
+    def _capture_thread():
+        assert x11.get_x11_grabber() is x11.get_x11_grabber()  # one per thread
+        x11.close_x11_grabber()
+
+    thread = threading.Thread(target=_capture_thread)
+    thread.start()
+    thread.join()
+    assert len(grabbers) == 1 and grabbers[0].closed
+
+    x11.close_x11_grabber()  # nothing opened in this thread
+    assert x11.get_x11_grabber() is grabbers[-1] and len(grabbers) == 2
+    x11.close_x11_grabber()
+    assert grabbers[-1].closed
+
+
+def test_base64_url_decode_in_memory():
+    image = Image.fromarray(np.random.RandomState(0).randint(0, 256, (9, 11, 3)).astype(np.uint8))
+    with io.BytesIO() as bio:
+        image.save(bio, format='PNG')
+        url = 'data:image/png;base64,' + base64_encode(bio.getvalue())
+    assert np.array_equal(np.asarray(_base64_url_to_image(url)), np.asarray(image))
+    assert np.array_equal(_base64_url_to_lab(url), _image_to_lab(image))
+    assert np.array_equal(_image_to_lab(np.asarray(image)), _image_to_lab(image))
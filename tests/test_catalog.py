@@ -0,0 +1,119 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from br.load import BrowserRecord, Catalog
+from br.load.catalog import Hit
+from .conftest import make_record_data, START_TIME, INTERVAL
+
+
+def _navigating_record(file: str):
+    # two pages, and mousemove samples of compact mode
+    data = make_record_data(pyramid_scales=())
+    data['events'].extend([
+        {'event': 'url_change', 'time': START_TIME, 'last_url': None, 'new_url': 'http://example.com/a'},
+        {'event': 'url_change', 'time': START_TIME + 2.0, 'last_url': 'http://example.com/a',
+         'new_url': 'http://example.com/b'},
+        {'event': 'click', 'time': START_TIME + 2.5, 'x': 5, 'y': 6, 'text': 'next'},
+    ])
+    data['events'].sort(key=lambda x: x['time'])
+    data['event_columns'] = {'mousemove': {'time': [START_TIME + 0.5, START_TIME + 2.2], 'x': [1.0, 2.0],
+                                           'y': [3.0, 4.0]}}
+    with open(file, 'w') as f:
+        json.dump(data, f)
+
+
+@pytest.fixture()
+def catalog(tmp_path):
+    catalog = Catalog(str(tmp_path / 'catalog.db'))
+    try:
+        yield catalog
+    finally:
+        catalog.close()
+
+
+def test_ingest(tmp_path, catalog, json_record, container_record):
+    broken = str(tmp_path / 'broken.json')
+    with open(broken, 'w') as f:
+        f.write('{"start_time": ')
+    result = catalog.ingest([str(tmp_path)], workers=1)
+    assert (result['added'], result['skipped'], result['removed']) == (2, 0, 0)
+    assert list(result['failed']) == [os.path.abspath(broken)]
+
+    records = catalog.records()
+    assert [item['format'] for item in records] == ['container', 'json']
+    for item in records:
+        assert (item['event_count'], item['page_frames'], item['system_frames']) == (3, 30, 0)
+        assert (item['view_width'], item['view_height'], item['page_width'], item['page_height']) == (56, 40, 56, 40)
+        assert item['duration'] == pytest.approx(30 * INTERVAL)
+    assert catalog.records(min_duration=10.0) == []
+
+    os.remove(broken)
+    result = catalog.ingest([str(tmp_path)], workers=1)
+    assert (result['added'], result['skipped']) == (0, 2)
+
+    os.utime(json_record, (0, 0))  # changed, parsed again
+    os.remove(container_record)
+    result = catalog.ingest([json_record], workers=1, prune=True)
+    assert (result['added'], result['skipped'], result['removed']) == (1, 0, 1)
+    assert len(catalog) == 1
+
+
+def test_events(tmp_path, catalog):
+    file = str(tmp_path / 'record.json')
+    _navigating_record(file)
+    catalog.ingest([file], workers=1, columns=True)
+    path = os.path.abspath(file)
+
+    clicks = catalog.events('click')
+    assert clicks == [Hit(path, START_TIME + 1.0, 'click', {'x': 3, 'y': 4, 'text': 'ok'}),
+                      Hit(path, START_TIME + 2.5, 'click', {'x': 5, 'y': 6, 'text': 'next'})]
+    assert catalog.events('click', url='%/b') == clicks[1:]
+    assert catalog.events(['click', 'mousemove'], start=START_TIME + 2.0, limit=2) == [
+        Hit(path, START_TIME + 2.2, 'mousemove', {'x': 2.0, 'y': 4.0}), clicks[1]]
+    assert catalog.events('click', record=str(tmp_path / 'other.json')) == []
+    assert [item['path'] for item in catalog.records(url='%example.com/a')] == [path]
+    assert catalog.query('SELECT url, start_time FROM urls ORDER BY start_time') == [
+        ('http://example.com/a', START_TIME), ('http://example.com/b', START_TIME + 2.0)]
+
+    with catalog.open(clicks[0]) as record:
+        expected = record.page_vision._vision.vision_array(clicks[0].time)
+        np.testing.assert_array_equal(catalog.frame_array(clicks[0]), expected)
+        assert catalog.frame(clicks[0]).size == (56, 40)
+
+
+def test_frame_array_container(catalog, container_record):
+    catalog.ingest([container_record], workers=1)
+    with BrowserRecord.load(container_record) as record:
+        vision = record.page_vision._vision
+        for i in (0, 5, 17, 29):
+            time_ = START_TIME + i * INTERVAL + 0.01
+            np.testing.assert_array_equal(catalog.frame_array(container_record, time_), vision.vision_array(time_))
+        assert catalog.frame_array(container_record, START_TIME - 1.0) is None
+    with pytest.raises(KeyError):
+        catalog.frame_array('missing.brc', START_TIME)
+
+
+def test_frame_array_same_timestamps(tmp_path):
+    # diffs right before and after each keyframe have the same timestamp as it
+    data = make_record_data(pyramid_scales=())
+    items = data['page_vision']
+    keyframes = [i for i, item in enumerate(items) if item['type'] == 'new_frame']
+    assert len(keyframes) > 1
+    for i in keyframes[1:]:
+        items[i - 1]['timestamp'] = items[i + 1]['timestamp'] = items[i]['timestamp']
+    file = str(tmp_path / 'record.json')
+    with open(file, 'w') as f:
+        json.dump(data, f)
+
+    catalog = Catalog(str(tmp_path / 'catalog.db'))
+    try:
+        assert catalog.ingest([file], workers=1)['added'] == 1
+        with BrowserRecord.load(file) as record:
+            vision = record.page_vision._vision
+            for time_ in sorted({item['timestamp'] for item in items}):
+                np.testing.assert_array_equal(catalog.frame_array(file, time_), vision.vision_array(time_))
+    finally:
+        catalog.close()
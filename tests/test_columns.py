@@ -0,0 +1,56 @@
+import time
+
+import numpy as np
+import pytest
+
+from br.load import BrowserRecord
+from br.page.monitor import WebDriverMonitor
+from br.storage import RecordWriter, RecordReader
+from .conftest import FakeDriver
+
+
+def _column_states(count: int, start: float):
+    # mousemove samples coalesced in page, shipped as columns by drainAll
+    return [{'columns': {'mousemove': {'time': [start + i + 0.1 * j for j in range(3)],
+                                       'x': [10.0 * i + j for j in range(3)], 'y': [float(i)] * 3}},
+             'events': [{'event': 'resize', 'time': start + i, 'view_width': 100, 'view_height': 80},
+                        {'event': 'scroll', 'time': start + i, 'scroll_x': 0, 'scroll_y': 0}]}
+            for i in range(count)]
+
+
+def test_columns_in_container(tmp_path):
+    file = str(tmp_path / 'record.brc')
+    with RecordWriter(file) as writer:
+        writer.write_event_columns({'mousemove': {'time': np.array([1.0, 2.0]), 'x': [1, 2], 'y': [3, 4]}})
+        writer.write_event_columns({'mousemove': {'time': [3.0], 'x': [5], 'y': [6]},
+                                    'scroll': {'time': [], 'scroll_x': [], 'scroll_y': []}})
+        writer.close({'start_time': 1.0, 'end_time': 3.0})
+
+    with RecordReader(file) as reader:
+        columns = reader.read_event_columns()
+        assert list(columns) == ['mousemove']
+        np.testing.assert_array_equal(columns['mousemove']['x'], [1, 2, 5])
+        assert reader.metadata['event_counts'] == {'mousemove': 3}
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_monitor_compact_events(tmp_path, streaming):
+    start = time.time()
+    driver = FakeDriver(_column_states(4, start))
+    save_as = str(tmp_path / ('record.brc' if streaming else 'record.json'))
+    monitor = WebDriverMonitor(driver, save_as, event_interval=0.01, injection='execute_script',
+                               system_capture=False, compact_events=True, streaming=streaming,
+                               max_buffered_events=5)
+    monitor.start()
+    deadline = time.time() + 10.0
+    while driver.states and time.time() < deadline:
+        time.sleep(0.01)
+    monitor.stop()
+
+    with BrowserRecord.load(save_as) as record:
+        columns = record.event_columns['mousemove']
+        np.testing.assert_allclose(columns['x'], [10.0 * i + j for i in range(4) for j in range(3)])
+        assert record.event_counts['mousemove'] == 12
+        assert record.cursor.position(start + 2.15) == (21.0, 2.0)
+        positions, mask = record.cursor.positions(np.array([start - 1, start + 3.5]))
+        assert mask.tolist() == [False, True] and positions[1].tolist() == [32.0, 3.0]
@@ -0,0 +1,56 @@
+import json
+
+import numpy as np
+import pytest
+
+from br.load import BrowserRecord, compact_record
+from br.page.vision import VisionItemType
+from .conftest import START_TIME, INTERVAL
+
+
+@pytest.mark.parametrize('target', ['seek', 'size'])
+def test_compact_keeps_frames(tmp_path, json_record, target):
+    output_file = str(tmp_path / 'compact.brc')
+    stats = compact_record(json_record, output_file, target=target, max_diff_frames=3)
+    assert stats['page_vision']['frames'] == 30
+
+    with BrowserRecord.load(json_record) as record, BrowserRecord.load(output_file) as compacted:
+        assert list(compacted.events) == list(record.events)
+        vision, compacted_vision = record.page_vision._vision, compacted.page_vision._vision
+        for i in range(30):
+            time_ = START_TIME + i * INTERVAL
+            np.testing.assert_array_equal(compacted_vision.vision_array(time_), vision.vision_array(time_))
+
+
+def test_compact_starts_with_diff(tmp_path, json_record, record_data):
+    # e.g. a recovered container which lost its first keyframe
+    items = record_data['page_vision']
+    first_key = next(i for i, item in enumerate(items)
+                     if i and VisionItemType.loads(item['type']) == VisionItemType.NEW_FRAME)
+    input_file = str(tmp_path / 'cut.json')
+    with open(input_file, 'w') as f:
+        json.dump({**record_data, 'page_vision': items[1:], 'pyramid': {}}, f)
+
+    output_file = str(tmp_path / 'compact.brc')
+    stats = compact_record(input_file, output_file, max_diff_frames=3)
+    assert stats['page_vision']['frames'] == len(items) - first_key
+
+    with BrowserRecord.load(json_record) as record, BrowserRecord.load(output_file) as compacted:
+        vision, compacted_vision = record.page_vision._vision, compacted.page_vision._vision
+        assert compacted_vision.start_time == items[first_key]['timestamp']
+        for i in range(first_key, len(items)):
+            time_ = START_TIME + i * INTERVAL
+            np.testing.assert_array_equal(compacted_vision.vision_array(time_), vision.vision_array(time_))
+
+
+def test_compact_keeps_pyramid(tmp_path, json_record):
+    output_file = str(tmp_path / 'compact.brc')
+    compact_record(json_record, output_file)
+
+    with BrowserRecord.load(json_record) as record, BrowserRecord.load(output_file) as compacted:
+        vision, compacted_vision = record.page_vision._vision, compacted.page_vision._vision
+        assert sorted(compacted_vision.pyramid) == sorted(vision.pyramid) == [2, 4]
+        for scale in (2, 4):
+            time_ = START_TIME + 17 * INTERVAL
+            np.testing.assert_array_equal(compacted_vision.pyramid[scale].vision_array(time_),
+                                          vision.pyramid[scale].vision_array(time_))
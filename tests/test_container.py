@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from br.page.vision import VisionItemType, _numpy_to_bytes
+from br.storage import RecordWriter, RecordReader, StreamType, recover_container, json_to_container, \
+    container_to_json
+from .conftest import lab_frames
+
+
+def test_json_container_round_trip(tmp_path, json_record, record_data):
+    container_file, json_file = str(tmp_path / 'record.brc'), str(tmp_path / 'back.json')
+    json_to_container(json_record, container_file)
+    container_to_json(container_file, json_file)
+    with open(json_file, 'r') as f:
+        assert json.load(f) == record_data
+
+
+def _write_unfinished(file, count: int = 5) -> list:
+    writer = RecordWriter(file)
+    writer.write_events([{'event': 'click', 'time': 1.0, 'x': 1, 'y': 2}])
+    payloads = []
+    for i, lab in enumerate(lab_frames(count)):
+        payload = _numpy_to_bytes(lab.transpose((2, 0, 1)))
+        writer.write_vision(StreamType.PAGE_VISION, VisionItemType.NEW_FRAME, 1.0 + i, payload)
+        payloads.append(payload)
+    writer._f.close()  # killed before the footer was written
+    return payloads
+
+
+def test_recover_container(tmp_path):
+    file = str(tmp_path / 'record.brc')
+    payloads = _write_unfinished(file)
+    with pytest.raises(ValueError, match='recover_container'):
+        RecordReader(file)
+
+    recover_container(file)
+    with RecordReader(file) as reader:
+        assert reader.read_events() == [{'event': 'click', 'time': 1.0, 'x': 1, 'y': 2}]
+        entries = reader.entries(StreamType.PAGE_VISION)
+        assert [reader.payload(entry['offset'], entry['length']) for entry in entries] == payloads
+        assert reader.start_time == 1.0
+        assert reader.end_time == 1.0 + len(payloads) - 1
+
+
+def test_recover_container_cut_chunk(tmp_path):
+    file = str(tmp_path / 'record.brc')
+    payloads = _write_unfinished(file)
+    with open(file, 'r+b') as f:  # the last chunk is incomplete
+        f.truncate(f.seek(0, 2) - 10)
+
+    recover_container(file)
+    with RecordReader(file) as reader:
+        assert len(reader.entries(StreamType.PAGE_VISION)) == len(payloads) - 1
+
+
+def test_reader_short_file(tmp_path):
+    file = str(tmp_path / 'record.brc')
+    RecordWriter(file)._f.close()
+    with pytest.raises(ValueError, match='recover_container'):
+        RecordReader(file)
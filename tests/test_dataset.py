@@ -0,0 +1,83 @@
+import glob
+import json
+import os
+
+import pytest
+import yaml
+
+pytest.importorskip('ultralytics')
+pytest.importorskip('ditk')
+
+from br.page.vision import VisionRecorder
+from zoo.web.dataset import export_dataset, _load_names
+from zoo.web.track import Detection, DetectionTrack, detection_track_file
+from .conftest import make_record_data, lab_frames, START_TIME, INTERVAL
+
+
+def _write_record(file: str, frames=None, labels=('button',)):
+    # record with a detection track next to it, frames replace the page frames when given
+    data = make_record_data(pyramid_scales=())
+    if frames is not None:
+        recorder = VisionRecorder()
+        for i, lab in enumerate(frames):
+            recorder.append_lab(lab, START_TIME + i * INTERVAL)
+        data['page_vision'] = recorder.to_json()
+    with open(file, 'w') as f:
+        json.dump(data, f)
+
+    track = DetectionTrack([([Detection(label, 0.9, 2.0, 2.0, 20.0, 10.0) for label in labels], START_TIME)])
+    track.save(detection_track_file(file))
+
+
+def _files(output_dir: str, kind: str):
+    return sorted(glob.glob(os.path.join(output_dir, kind, '*', '*', '*')))
+
+
+def test_load_names(tmp_path):
+    output_dir = str(tmp_path / 'dataset')
+    os.makedirs(output_dir)
+    with open(os.path.join(output_dir, 'data.yaml'), 'w') as f:
+        yaml.safe_dump({'names': {0: 'button', 2: 'link'}}, f)  # edited by hand, id 1 was removed
+    file = str(tmp_path / 'record.json')
+    _write_record(file, labels=('link', 'text', 'image'))
+    assert _load_names(output_dir, [file]) == {'button': 0, 'link': 2, 'image': 3, 'text': 4}
+    assert _load_names(str(tmp_path / 'empty'), [file]) == {'image': 0, 'link': 1, 'text': 2}
+
+
+def test_export_resume(tmp_path):
+    records = [str(tmp_path / 'records' / f'{i}.json') for i in range(2)]
+    os.makedirs(str(tmp_path / 'records'))
+    for file in records:
+        _write_record(file)
+    output_dir = str(tmp_path / 'dataset')
+
+    result = export_dataset([str(tmp_path / 'records')], output_dir, workers=1, min_change=0.0, silent=True)
+    assert (result['records'], result['exported'], result['skipped'], result['failed']) == (2, 2, 0, {})
+    assert result['images'] == result['images_total'] > 0
+    images = _files(output_dir, 'images')
+    assert len(images) == result['images'] and len(_files(output_dir, 'labels')) == result['images']
+    with open(os.path.join(output_dir, 'data.yaml')) as f:
+        assert yaml.safe_load(f)['names'] == {0: 'button'}
+
+    result = export_dataset([str(tmp_path / 'records')], output_dir, workers=1, min_change=0.0, silent=True)
+    assert (result['exported'], result['skipped'], result['images']) == (0, 2, 0)
+    assert result['images_total'] == len(images)
+
+    os.utime(records[0], (0, 0))  # changed, exported again without leaving the old images
+    result = export_dataset([str(tmp_path / 'records')], output_dir, workers=1, min_change=0.0, silent=True)
+    assert (result['exported'], result['skipped']) == (1, 1)
+    assert _files(output_dir, 'images') == images
+    with open(os.path.join(output_dir, 'manifest.jsonl')) as f:
+        assert len(f.readlines()) == len(images)
+
+
+def test_export_near_duplicates(tmp_path):
+    first, second = lab_frames(2, seed=3)
+    second = 255 - second  # nothing like the first one
+    file = str(tmp_path / 'record.json')
+    _write_record(file, [first, second] * 5)
+
+    result = export_dataset([file], str(tmp_path / 'dataset'), workers=1, min_interval=0.0, min_change=0.0,
+                            silent=True)
+    assert result['images'] == 2
+    assert result['duplicates'] == result['samples'] - 2
@@ -0,0 +1,90 @@
+import json
+
+import numpy as np
+import pytest
+
+pytest.importorskip('ultralytics')
+pytest.importorskip('onnxruntime')
+pytest.importorskip('ditk')
+
+from br.load import BrowserRecord
+from br.page.vision import VisionRecorder, VisionItemType
+from zoo.web.detect import _plan, detect_record
+from zoo.web.track import Detection, DetectionTrack, _changed_pixels, _sample_times
+from .conftest import make_record_data, lab_frames, START_TIME
+
+
+@pytest.mark.parametrize('tile_size', [None, 4])
+def test_changed_pixels(tile_size):
+    first = next(lab_frames(1))
+    changed = first.copy()
+    changed[10:13, 20:30] = 255 - changed[10:13, 20:30]
+    changed[35, 50] = 255 - changed[35, 50]
+    recorder = VisionRecorder(tile_size=tile_size, pixel_diff_threshold=0.0)
+    recorder.append_lab(first, 0.0)
+    recorder.append_lab(changed, 1.0)
+    item = recorder._records[1]
+    assert item.type == (VisionItemType.TILE_DIFF_FRAME if tile_size else VisionItemType.DIFF_FRAME)
+
+    mask = (first != changed).any(axis=2)
+    if tile_size:  # whole tiles are counted
+        mask = np.kron(mask.reshape((10, 4, 14, 4)).any(axis=(1, 3)), np.ones((4, 4), dtype=bool))
+    for area in [(0, 0, 56, 40), (22, 11, 5, 20), (0, 0, 20, 10), (48, 32, 8, 8)]:
+        x, y, width, height = area
+        assert _changed_pixels(item.type, item.data, area) == int(mask[y:y + height, x:x + width].sum())
+
+
+def _scrolling_record(file: str):
+    # the viewport is scrolled down at 1.55s, and shrinks to half of its size at 2.05s
+    data = make_record_data(pyramid_scales=(2, 4))
+    data['events'].extend([
+        {'event': 'scroll', 'time': START_TIME + 1.55, 'scroll_x': 0, 'scroll_y': 4},
+        {'event': 'resize', 'time': START_TIME + 2.05, 'view_width': 28, 'view_height': 20},
+    ])
+    with open(file, 'w') as f:
+        json.dump(data, f)
+
+
+def test_plan(tmp_path):
+    file = str(tmp_path / 'record.json')
+    _scrolling_record(file)
+    with BrowserRecord.load(file, lazy=True) as record:
+        times = [START_TIME - 1.0, *_sample_times(record, 0.2)]
+        assert _plan(record, times, 0.0) == [False] + [True] * (len(times) - 1)
+
+        # only the first frame and the changed viewports, a sample is the latest time of its window
+        plan = _plan(record, times, 100.0)
+        assert [round(time_ - START_TIME, 2) for time_, flag in zip(times, plan) if flag] == [0.1, 1.6, 2.1]
+
+        plan = _plan(record, times, 0.5)
+        assert 3 < sum(plan) < len(times) - 1
+
+
+class _FakeDetector:
+    # records the images, and detects the whole viewport
+    size = 16
+    batch_size = 3
+    model_file = 'fake.onnx'
+
+    def __init__(self):
+        self.images = []
+
+    def _prepare(self, images, sizes):
+        self.images.extend(images)
+        return sizes
+
+    def _run(self, prepared):
+        return [[Detection('page', 1.0, 0.0, 0.0, float(width), float(height))] for width, height in prepared]
+
+
+def test_detect_record_scale(tmp_path):
+    file = str(tmp_path / 'record.json')
+    _scrolling_record(file)
+    detector = _FakeDetector()
+    track, stats = detect_record(file, detector, diff_threshold=0.0, silent=True)
+    assert stats['inferred'] == len(detector.images) == track.inferred_count
+    # each frame is scaled for its own viewport, to about the input size of the model
+    assert all(max(image.size) == detector.size for image in detector.images)
+    assert track.detections(START_TIME + 1.0)[0].x1 == 56.0
+    assert track.detections(START_TIME + 2.5)[0].x1 == 28.0
+    assert DetectionTrack.load(str(tmp_path / 'record.detections.json')).to_json() == track.to_json()
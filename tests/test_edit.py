@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from br.load import BrowserRecord
+from .conftest import START_TIME, INTERVAL
+
+
+@pytest.mark.parametrize('offset', [0.0, 0.05])  # on a diff frame, and between two frames
+def test_clip_start_frame(json_record, offset):
+    t0 = START_TIME + 13 * INTERVAL + offset
+    with BrowserRecord.load(json_record) as record:
+        clip = record.clip(t0, t0 + 1.0)
+        assert clip.start_time == t0
+        vision, clipped = record.page_vision._vision, clip.page_vision._vision
+        # the frame on screen at t0 becomes a keyframe of the clip, later ones are the same diffs
+        np.testing.assert_array_equal(clipped.vision_array(t0), vision.vision_array(t0))
+        for i in range(1, 10):
+            time_ = t0 + i * INTERVAL
+            np.testing.assert_array_equal(clipped.vision_array(time_), vision.vision_array(time_))
+
+
+def test_clip_state_events(json_record):
+    with BrowserRecord.load(json_record) as record:
+        clip = record.clip(START_TIME + 1.5, START_TIME + 2.0)
+        # the viewport before the cut is still known, while the click is not in the clip
+        assert [(item['event'], item['time']) for item in clip.events] == \
+               [('resize', START_TIME + 1.5), ('scroll', START_TIME + 1.5)]
+        with pytest.raises(ValueError):
+            record.clip(START_TIME + 5.0, START_TIME + 6.0)
+
+
+@pytest.mark.parametrize('close_gaps', [True, False])
+def test_trim(json_record, close_gaps):
+    with BrowserRecord.load(json_record) as record:
+        trimmed = record.trim([(START_TIME + 1.05, START_TIME + 2.05)], close_gaps=close_gaps)
+        shift = 1.0 if close_gaps else 0.0
+        assert trimmed.start_time == START_TIME
+        assert trimmed.end_time == pytest.approx(record.end_time - shift)
+        assert [item['event'] for item in trimmed.events] == ['resize', 'scroll', 'click', 'resize', 'scroll']
+
+        vision, trimmed_vision = record.page_vision._vision, trimmed.page_vision._vision
+        for i in (2, 7, 10):
+            time_ = START_TIME + i * INTERVAL
+            np.testing.assert_array_equal(trimmed_vision.vision_array(time_), vision.vision_array(time_))
+        for i in (21, 24, 29):
+            time_ = START_TIME + i * INTERVAL
+            np.testing.assert_array_equal(trimmed_vision.vision_array(time_ - shift), vision.vision_array(time_))
+
+
+@pytest.mark.parametrize('container', [True, False])
+def test_concat(tmp_path, json_record, container):
+    with BrowserRecord.load(json_record) as record:
+        first, second = record.clip(START_TIME, START_TIME + 1.0), record.clip(START_TIME + 2.0, START_TIME + 3.0)
+        with pytest.raises(ValueError):
+            BrowserRecord.concat([second, first], gap=None)
+
+        joined = BrowserRecord.concat([first, second], gap=0.5)
+        assert (joined.start_time, joined.end_time) == (START_TIME, START_TIME + 2.5)
+        assert sorted(joined.page_vision._vision.pyramid) == [2, 4]
+        file = str(tmp_path / ('joined.brc' if container else 'joined.json'))
+        joined.save(file, container=container)
+
+        vision = record.page_vision._vision
+        with BrowserRecord.load(file) as saved:
+            saved_vision = saved.page_vision._vision
+            assert saved.event_counts == {'resize': 2, 'scroll': 2, 'click': 1}
+            np.testing.assert_array_equal(saved_vision.vision_array(START_TIME + 0.55),
+                                          vision.vision_array(START_TIME + 0.55))
+            np.testing.assert_array_equal(saved_vision.vision_array(START_TIME + 2.05),
+                                          vision.vision_array(START_TIME + 2.55))
@@ -0,0 +1,102 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+import numpy as np
+import pytest
+
+from br.load import BrowserRecord
+from br.page import host as host_module
+from br.page.host import RecordingHost, _CountingExecutor
+from .conftest import FakeDriver, png_data_url, lab_frames
+
+
+def _page_states(count: int, seed: int):
+    return [{'screenshots': [{'raw': png_data_url(lab), 'time': time.time() + i * 0.01}],
+             'events': [{'event': 'scroll', 'time': time.time() + i * 0.01, 'scroll_x': 0, 'scroll_y': i}]}
+            for i, lab in enumerate(lab_frames(count, seed=seed))]
+
+
+def _wait_for(condition, timeout: float = 10.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    assert condition()
+
+
+def test_host_sessions(tmp_path):
+    drivers = [FakeDriver(_page_states(4, seed)) for seed in range(3)]
+    host = RecordingHost(poll_workers=2, encode_workers=2)
+    files = [str(tmp_path / f'record_{i}.json') for i in range(3)]
+    for driver, file in zip(drivers[:2], files):
+        host.add(driver, file, event_interval=0.01, injection='execute_script')
+    with pytest.raises(KeyError):
+        host.add(drivers[2], files[2], name='session-0')
+
+    with host:
+        with pytest.raises(RuntimeError):
+            host.start()
+        host.add(drivers[2], files[2], name='late', event_interval=0.01, injection='execute_script')
+        _wait_for(lambda: not any(driver.states for driver in drivers))
+        host.remove('session-0')
+        assert not host.sessions['session-0'].system_capture
+        stats = host.stats()
+        assert stats['sessions']['session-0']['finished']
+        assert not stats['sessions']['late']['finished']
+
+    stats = host.stats()
+    assert stats['active'] == 0 and stats['encode_pending'] == 0
+    for i, file in enumerate(files):
+        session = stats['sessions']['late' if i == 2 else f'session-{i}']
+        assert session['ticks'] >= 4 and session['error'] is None
+        assert session['bytes_written'] > 0 and session['pipelines']['page_vision']['encoded'] == 4
+        with BrowserRecord.load(file) as record:
+            assert [item['scroll_y'] for item in record.events_between(types=['scroll'])] == list(range(4))
+            assert len(record.page_vision._vision) == 4
+
+
+@pytest.mark.parametrize('adaptive_capture, interval', [(False, 1.0), (True, 0.1)])
+def test_tick_interval(tmp_path, adaptive_capture, interval):
+    host = RecordingHost(poll_workers=1)
+    monitor = host.add(FakeDriver([{}]), str(tmp_path / 'record.json'), event_interval=1.0,
+                       injection='execute_script', adaptive_capture=adaptive_capture, max_capture_rate=10.0)
+    session = host._sessions['session-0']
+    monitor._open()
+    try:
+        due = time.time() + 10.0
+        host._tick(session, due)
+        assert host._heap[0][0] == pytest.approx(due + interval)  # the capture interval of the scheduler
+    finally:
+        monitor._close_capture()
+        host._executor.shutdown()
+
+
+def test_system_capture_interval(tmp_path, monkeypatch):
+    frames = lab_frames(1000, height=8, width=8)
+    monkeypatch.setattr(host_module, 'capture_screen_array', lambda: (next(frames), time.time()))
+    host = RecordingHost(system_capture=True, system_view_interval=0.2)
+    user_agent = 'Mozilla/5.0 Chrome/120.0'  # not headless, so the screen is recorded
+    fast = host.add(FakeDriver(user_agent=user_agent), str(tmp_path / 'fast.json'),
+                    system_view_interval=0.02, injection='execute_script')
+    slow = host.add(FakeDriver(user_agent=user_agent), str(tmp_path / 'slow.json'), injection='execute_script')
+    with host:
+        time.sleep(0.6)
+
+    assert fast.system_capture and slow.system_capture
+    counts = [monitor._system_vision_pipeline.stats()['encoded'] for monitor in (fast, slow)]
+    assert 2 <= counts[1] <= 5 and counts[0] >= 3 * counts[1]
+
+
+def test_counting_executor():
+    release = Event()
+    executor = _CountingExecutor(ThreadPoolExecutor(max_workers=1))
+    futures = [executor.submit(release.wait) for _ in range(3)]
+    assert executor.pending == 3
+    release.set()
+    assert all(future.result() for future in futures)
+    _wait_for(lambda: executor.pending == 0)
+    assert list(executor.map(np.square, [1, 2])) == [1, 4]
+    executor.shutdown()
+    with pytest.raises(RuntimeError):
+        executor.submit(release.wait)
+    assert executor.pending == 0
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from br.load.index import EventIndex, NavigationSegment
+
+_EVENTS = [
+    {'event': 'click', 'time': 2.0, 'x': 1, 'y': 1},
+    {'event': 'url_change', 'time': 3.0, 'last_url': 'a', 'new_url': 'b'},
+    {'event': 'scroll', 'time': 1.0, 'scroll_x': 0, 'scroll_y': 10},
+    {'event': 'click', 'time': 4.0, 'x': 2, 'y': 2},
+    {'event': 'mousemove', 'time': 2.5, 'x': 5, 'y': 5},
+    {'event': 'url_change', 'time': 6.0, 'last_url': 'b', 'new_url': 'c'},
+]
+# mousemove samples of compact mode, out of order on purpose
+_COLUMNS = {'mousemove': {'time': [3.5, 1.5, 5.0], 'x': [35.0, 15.0, 50.0], 'y': [0.0, 1.0, 2.0]}}
+
+
+@pytest.fixture()
+def index():
+    return EventIndex(_EVENTS, _COLUMNS, start_time=0.0, end_time=8.0)
+
+
+def test_between(index):
+    assert index.times.tolist() == [1.0, 2.0, 2.5, 3.0, 4.0, 6.0]
+    assert [item['event'] for item in index.between(2.0, 4.0)] == ['click', 'mousemove', 'url_change', 'click']
+    clicks = index.between(types='click')
+    assert [item['x'] for item in clicks] == [1, 2] and clicks.times.tolist() == [2.0, 4.0]
+    assert clicks[0] is _EVENTS[0]  # not copied
+    assert [item['event'] for item in index.between(3.0, None, ['click', 'url_change'])] == \
+           ['url_change', 'click', 'url_change']
+    assert len(index.between(types=['missing'])) == 0
+    assert len(index.between(7.0, 9.0)) == 0
+
+
+def test_between_columns(index):
+    moves = index.between(types=['mousemove'])
+    assert moves.times.tolist() == [1.5, 2.5, 3.5, 5.0]
+    assert [(item['x'], item['y']) for item in moves] == [(15.0, 1.0), (5, 5), (35.0, 0.0), (50.0, 2.0)]
+    assert moves[0] == {'event': 'mousemove', 'time': 1.5, 'x': 15.0, 'y': 1.0}
+
+    moves = index.between(2.0, 4.0, ['mousemove', 'click'])
+    assert [(item['event'], item['time']) for item in moves] == \
+           [('click', 2.0), ('mousemove', 2.5), ('mousemove', 3.5), ('click', 4.0)]
+    assert len(index.of_type('mousemove')) == index.count('mousemove') == 4
+
+
+def test_counts_and_columns(index):
+    assert index.types == ['click', 'mousemove', 'scroll', 'url_change']
+    assert index.counts == {'click': 2, 'url_change': 2, 'scroll': 1, 'mousemove': 4}
+    assert index.count('mousemove', 2.0, 4.0) == 2
+    columns = index.columns_between('mousemove', 1.5, 3.5)
+    np.testing.assert_array_equal(columns['x'], [15.0, 35.0])
+    assert index.columns_between('click') == {}
+
+    times, values = index.arrays('mousemove', 'x', 'y')
+    assert sorted(zip(times.tolist(), values[:, 0].tolist())) == [(1.5, 15.0), (2.5, 5.0), (3.5, 35.0), (5.0, 50.0)]
+    times, values = index.arrays('resize', 'view_width', 'view_height')
+    assert times.shape == (0,) and values.shape == (0, 2)
+
+
+def test_navigation(index):
+    assert index.navigation == [
+        NavigationSegment('a', 0.0, 3.0),
+        NavigationSegment('b', 3.0, 6.0),
+        NavigationSegment('c', 6.0, 8.0),
+    ]
+    assert index.segment(-1.0) is None
+    assert index.segment(3.0).url == 'b'
+    assert index.segment(7.5).url == 'c'
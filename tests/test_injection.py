@@ -0,0 +1,86 @@
+import pytest
+from selenium.common.exceptions import WebDriverException
+
+from br.page.monitor import WebDriverMonitor, register_on_new_document
+from .conftest import FakeDriver
+
+
+class _NoCdpDriver(FakeDriver):
+    # e.g. firefox, no devtools commands at all
+    def __getattribute__(self, name):
+        if name == 'execute_cdp_cmd':
+            raise AttributeError(name)
+        return super().__getattribute__(name)
+
+
+class _FailingCdpDriver(FakeDriver):
+    def execute_cdp_cmd(self, cmd: str, params: dict):
+        raise WebDriverException('not supported')
+
+
+def test_register_once_per_driver():
+    driver = FakeDriver()
+    assert register_on_new_document(driver)
+    assert len(driver.cdp) == 2  # listener and html2canvas
+    assert all(cmd == 'Page.addScriptToEvaluateOnNewDocument' for cmd, _ in driver.cdp)
+    assert 'window.top === window' in driver.cdp[0][1]['source']
+
+    assert register_on_new_document(driver)
+    assert len(driver.cdp) == 2
+    assert register_on_new_document(driver, compact=True, html2canvas=False)
+    assert len(driver.cdp) == 3  # options changed, registered again
+
+    other = FakeDriver()
+    assert register_on_new_document(other, html2canvas=False)
+    assert len(other.cdp) == 1
+
+
+def test_register_without_cdp():
+    assert not register_on_new_document(_NoCdpDriver())
+    driver = _FailingCdpDriver()
+    assert not register_on_new_document(driver)
+    assert not register_on_new_document(driver)  # not remembered as registered
+
+
+def test_injection_modes(tmp_path):
+    with pytest.raises(ValueError):
+        WebDriverMonitor(FakeDriver(), str(tmp_path / 'record.json'), injection='inline')
+
+    monitor = WebDriverMonitor(_NoCdpDriver(), str(tmp_path / 'record.json'), injection='cdp',
+                               system_capture=False)
+    with pytest.raises(RuntimeError):
+        monitor._register_scripts()
+
+    driver = FakeDriver()
+    monitor = WebDriverMonitor(driver, str(tmp_path / 'record.json'), injection='execute_script',
+                               system_capture=False)
+    monitor._register_scripts()
+    assert driver.cdp == []
+
+
+@pytest.mark.parametrize('injection', ['auto', 'cdp'])
+def test_no_reinjection_with_cdp(tmp_path, injection):
+    driver = FakeDriver([{}, {'url': 'http://example.com/next', 'navigate': True}, {}])
+    monitor = WebDriverMonitor(driver, str(tmp_path / 'record.json'), injection=injection,
+                               system_capture=False)
+    monitor._open()
+    try:
+        assert monitor._poll_page()  # the first document was loaded before the registration
+        assert len(driver.scripts) == 2
+        assert monitor._poll_page() and monitor._poll_page()
+        assert len(driver.drains) == 3
+        assert len(driver.scripts) == 2  # new documents are monitored from their beginning
+    finally:
+        monitor._close_capture()
+    assert len(driver.cdp) == 2
+
+
+def test_auto_falls_back_to_execute_script(tmp_path):
+    driver = _NoCdpDriver([{}, {'navigate': True}])
+    monitor = WebDriverMonitor(driver, str(tmp_path / 'record.json'), system_capture=False)
+    monitor._open()
+    try:
+        assert monitor._poll_page() and monitor._poll_page()
+        assert len(driver.scripts) == 4  # injected again after the navigation
+    finally:
+        monitor._close_capture()
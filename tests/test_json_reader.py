@@ -0,0 +1,67 @@
+import json
+import mmap
+
+from br.page.vision import VisionItemType
+from br.storage import JsonRecordReader, StreamType
+from br.storage.json_reader import _Scanner
+
+_OBJ = {
+    'quoted': 'say "hi" and \\"',
+    'backslash': 'ends with \\',
+    'text': 'ü 中文 ✓',
+    'after': [1, 2.5, None],
+}
+
+
+def _scan(file):
+    with open(file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        scanner = _Scanner(mm)
+        retval = {}
+        for _ in scanner.items(b'{', b'}'):
+            key = scanner.key()
+            if key == 'quoted':  # skipped without decoding, like the frames
+                start, end = scanner.string_span()
+                retval[key] = json.loads(b'"' + mm[start:end] + b'"')
+            else:
+                retval[key], _, _ = scanner.value()
+        return retval
+
+
+def test_scanner_escaped_quotes_and_unicode(tmp_path):
+    for ensure_ascii in (True, False):
+        file = str(tmp_path / f'obj_{ensure_ascii}.json')
+        with open(file, 'w', encoding='utf-8') as f:
+            json.dump(_OBJ, f, ensure_ascii=ensure_ascii)
+        assert _scan(file) == _OBJ
+
+
+def test_json_reader_non_ascii_events(tmp_path, record_data):
+    record_data['events'].append({'event': 'click', 'time': 1002.0, 'x': 1, 'y': 1, 'text': 'ok "中文" \\'})
+    file = str(tmp_path / 'record.json')
+    with open(file, 'w', encoding='utf-8') as f:
+        json.dump(record_data, f, ensure_ascii=False)
+
+    with JsonRecordReader(file) as reader:
+        assert reader.read_events() == record_data['events']
+        assert reader.start_time == record_data['start_time']
+        assert len(reader.entries(StreamType.PAGE_VISION)) == len(record_data['page_vision'])
+
+
+def test_json_reader_iter_events(json_record, record_data):
+    with JsonRecordReader(json_record) as reader:
+        events = reader.iter_events()
+        assert next(events) == record_data['events'][0]
+        assert list(events) == record_data['events'][1:]
+
+
+def test_json_reader_vision_types(tmp_path, record_data):
+    # numeric types are accepted as well
+    record_data['page_vision'] = [{**item, 'type': VisionItemType.loads(item['type']).value}
+                                  for item in record_data['page_vision']]
+    file = str(tmp_path / 'record.json')
+    with open(file, 'w') as f:
+        json.dump(record_data, f)
+
+    with JsonRecordReader(file) as reader:
+        entries = reader.entries(StreamType.PAGE_VISION)
+        assert entries['type'].tolist() == [item['type'] for item in record_data['page_vision']]
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from br.load import BrowserRecord
+from br.storage import PayloadRef, StreamType
+from .conftest import START_TIME, INTERVAL
+
+
+@pytest.mark.parametrize('fixture', ['json_record', 'container_record'])
+def test_lazy_same_as_eager(request, fixture):
+    file = request.getfixturevalue(fixture)
+    with BrowserRecord.load(file) as eager, BrowserRecord.load(file, lazy=True) as lazy:
+        assert (lazy.start_time, lazy.end_time) == (eager.start_time, eager.end_time)
+        assert list(lazy.events) == list(eager.events)
+        assert lazy.event_counts == eager.event_counts
+        for i in range(30):
+            time_ = START_TIME + i * INTERVAL
+            np.testing.assert_array_equal(lazy.page_vision._vision.vision_array(time_),
+                                          eager.page_vision._vision.vision_array(time_))
+            assert lazy.view_area.area(time_) == eager.view_area.area(time_)
+
+
+@pytest.mark.parametrize('fixture', ['json_record', 'container_record'])
+def test_lazy_reads_on_demand(request, fixture, monkeypatch):
+    file = request.getfixturevalue(fixture)
+    with BrowserRecord.load(file, lazy=True) as record:
+        reads = []
+        payload = record._reader.payload
+        monkeypatch.setattr(record._reader, 'payload', lambda *args: reads.append(args) or payload(*args))
+
+        assert record.start_time == START_TIME
+        assert 'events' not in record.data._values
+        items = record.data['page_vision']
+        assert all(isinstance(item['data'], PayloadRef) for item in items)
+        assert not reads
+
+        # a frame only reads its keyframe and the diffs after it
+        vision = record.page_vision._vision  # events are read for the view area
+        reads.clear()
+        index = vision._get_index_before_time(START_TIME + 5 * INTERVAL)
+        keyframe = max(i for i in range(index + 1) if items[i]['type'] == 1)
+        vision.vision_array(START_TIME + 5 * INTERVAL)
+        assert len(reads) == index - keyframe + 1
+
+
+def test_lazy_closed_reader(container_record):
+    record = BrowserRecord.load(container_record, lazy=True)
+    record.close()
+    with pytest.raises(ValueError):
+        record.page_vision._vision.vision_array(START_TIME)
+
+
+def test_stream_index(json_record, container_record):
+    for file in (json_record, container_record):
+        with BrowserRecord.load(file, lazy=True) as record:
+            index = record.stream_index
+            index = index[index['stream'] != StreamType.EVENTS]
+            assert len(index) == len(record.data['page_vision']) + \
+                sum(len(items) for items in record.data['pyramid']['page_vision'].values())
+            times, values = record.event_arrays('resize', 'view_width', 'view_height')
+            assert times.tolist() == [record.start_time] and values.tolist() == [[56, 40]]
+        with BrowserRecord.load(file) as record:
+            assert record.stream_index is None
@@ -0,0 +1,71 @@
+import json
+import math
+import os
+import time
+
+import pytest
+
+from br.page.metrics import Histogram, Metrics
+from br.page.monitor import WebDriverMonitor
+from .conftest import FakeDriver, png_data_url, lab_frames
+
+
+def test_histogram():
+    hist = Histogram([1.0, 2.0, 4.0])
+    assert hist.snapshot() == {'count': 0}
+    assert math.isnan(hist.percentile(50))
+    for value in [0.5, 1.5, 1.5, 3.0, 10.0]:
+        hist.observe(value)
+    assert hist.counts == [1, 2, 1, 1]
+    snapshot = hist.snapshot()
+    assert snapshot['count'] == 5 and snapshot['mean'] == pytest.approx(3.3)
+    assert (snapshot['min'], snapshot['max']) == (0.5, 10.0)
+    assert hist.percentile(10) == 1.0
+    assert hist.percentile(50) == 2.0
+    assert hist.percentile(100) == 10.0  # the overflow bucket is bounded by the maximum
+
+
+def test_metrics():
+    metrics = Metrics()
+    scoped = metrics.scoped('page').scoped('vision')
+    metrics.count('ticks')
+    metrics.count('ticks', 2)
+    scoped.count('frames')
+    scoped.gauge('pending', 3)
+    with scoped.timer('encode'):
+        pass
+    scoped.observe('deflation', 0.5, [0.0, 1.0])
+
+    snapshot = metrics.snapshot()
+    assert snapshot['counters'] == {'ticks': 3, 'page.vision.frames': 1}
+    assert snapshot['gauges'] == {'page.vision.pending': 3}
+    assert set(snapshot['histograms']) == {'page.vision.encode', 'page.vision.deflation'}
+    assert scoped.histogram('deflation')['p50'] == 0.5
+    assert metrics.histogram('missing') == {'count': 0}
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_monitor_stats(tmp_path, streaming):
+    driver = FakeDriver([{'screenshots': [{'raw': png_data_url(lab), 'time': time.time() + i * 0.01}],
+                          'events': [{'event': 'click', 'time': time.time(), 'x': 0, 'y': 0}]}
+                         for i, lab in enumerate(lab_frames(3))])
+    save_as = str(tmp_path / ('record.brc' if streaming else 'record.json'))
+    metrics_file = str(tmp_path / 'metrics.jsonl')
+    monitor = WebDriverMonitor(driver, save_as, event_interval=0.01, injection='execute_script',
+                               system_capture=False, streaming=streaming, metrics_file=metrics_file)
+    monitor.start()
+    deadline = time.time() + 10.0
+    while driver.states and time.time() < deadline:
+        time.sleep(0.01)
+    monitor.stop()
+
+    stats = monitor.stats()
+    assert stats['tick_latency']['count'] == len(driver.drains)
+    assert stats['tick_latency'] == stats['histograms']['page.drain']
+    assert stats['counters']['page.events'] == 3
+    assert stats['pipelines']['page_vision']['encoded'] == 3
+    assert stats['bytes_written'] == os.path.getsize(save_as)
+
+    with open(metrics_file) as f:
+        reports = [json.loads(line) for line in f]
+    assert reports[-1]['bytes_written'] == stats['bytes_written']  # reported once at the end
@@ -0,0 +1,100 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from br.page.metrics import Metrics
+from br.page.pipeline import EncodePipeline, OverflowPolicy
+from br.page.vision import VisionRecorder
+from .conftest import lab_frames
+
+
+def _gated_pipeline(policy: str, sink=None, max_pending: int = 2, metrics=None):
+    # frames wait in to_lab until the gate is opened, so the queue fills up
+    gate = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=4)
+    pipeline = EncodePipeline(VisionRecorder(), lambda raw: gate.wait() and raw, executor,
+                              max_pending=max_pending, policy=policy, sink=sink,
+                              metrics=None if metrics is None else metrics.scoped('encode'))
+    pipeline.start()
+    return pipeline, gate, executor
+
+
+def _wait(predicate, timeout: float = 5.0):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, 'Timed out.'
+        time.sleep(0.01)
+
+
+def test_policy_loads():
+    assert OverflowPolicy.loads('drop_oldest') == OverflowPolicy.DROP_OLDEST
+    with pytest.raises(TypeError):
+        OverflowPolicy.loads(3)
+
+
+def test_block():
+    pipeline, gate, executor = _gated_pipeline('block')
+    frames = list(lab_frames(4))
+    assert pipeline.submit(frames[0], 0.0) and pipeline.submit(frames[1], 1.0)
+    assert pipeline.full()
+
+    submitter = threading.Thread(target=lambda: [pipeline.submit(frame, 2.0 + i)
+                                                 for i, frame in enumerate(frames[2:])])
+    submitter.start()
+    time.sleep(0.1)
+    assert submitter.is_alive()  # waits for room in the queue
+
+    gate.set()
+    submitter.join(5.0)
+    pipeline.close()
+    executor.shutdown()
+    assert (pipeline.encoded, pipeline.dropped) == (4, 0)
+    assert [item.timestamp for item in pipeline.recorder._records] == [0.0, 1.0, 2.0, 3.0]
+
+
+def test_drop_oldest():
+    metrics = Metrics()
+    pipeline, gate, executor = _gated_pipeline('drop_oldest', metrics=metrics)
+    for i, frame in enumerate(lab_frames(5)):
+        assert pipeline.submit(frame, float(i))
+    gate.set()
+    pipeline.close()
+    executor.shutdown()
+
+    # the head was already taken by the diff stage, the frames behind it are replaced by newer ones
+    assert (pipeline.submitted, pipeline.encoded, pipeline.dropped) == (5, 2, 3)
+    assert [item.timestamp for item in pipeline.recorder._records] == [0.0, 4.0]
+    assert metrics.snapshot()['counters']['encode.dropped'] == 3
+
+
+def test_degrade():
+    pipeline, gate, executor = _gated_pipeline('degrade', max_pending=4)
+    frames = list(lab_frames(8))
+    results = [pipeline.submit(frame, float(i)) for i, frame in enumerate(frames[:6])]
+    assert results == [True] * 4 + [False] * 2
+    assert pipeline.interval_scale == 4.0
+
+    gate.set()
+    _wait(lambda: pipeline.encoded == 4)
+    assert pipeline.submit(frames[6], 6.0)
+    _wait(lambda: pipeline.encoded == 5)
+    pipeline.close()
+    executor.shutdown()
+    assert pipeline.interval_scale < 4.0  # capture speeds up again once the queue drains
+    assert pipeline.stats()['dropped'] == 2
+
+
+def test_sink_order():
+    written = []
+    metrics = Metrics()
+    pipeline, gate, executor = _gated_pipeline('block', sink=written.append, max_pending=3, metrics=metrics)
+    gate.set()
+    for i, frame in enumerate(lab_frames(10)):
+        pipeline.submit(frame, float(i))
+    pipeline.close()
+    executor.shutdown()
+    assert [item.timestamp for item in written] == [float(i) for i in range(10)]
+    assert all(item.payload for item in written)
+    assert metrics.snapshot()['counters']['encode.bytes'] == sum(len(item.payload) for item in written)
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from br.load import BrowserRecord
+from br.load.cache import FrameCache
+from br.load.vision import apply_diff
+from br.page.vision import VisionItemType
+from .conftest import START_TIME, INTERVAL
+
+
+def test_frame_cache_eviction():
+    cache = FrameCache(max_bytes=300)
+    for i in range(4):
+        cache.put(i, np.zeros(100, dtype=np.uint8))
+    assert 0 not in cache and all(i in cache for i in (1, 2, 3))
+    assert cache.bytes == 300
+
+    assert cache.get(1) is not None  # recently used ones are kept
+    cache.put(4, np.zeros(100, dtype=np.uint8))
+    assert 2 not in cache and 1 in cache
+    assert not cache.get(1).flags.writeable
+
+    cache.put(5, np.zeros(400, dtype=np.uint8))  # larger than the cache
+    assert 5 not in cache
+
+
+def test_cached_frames(json_record):
+    with BrowserRecord.load(json_record) as record:
+        vision = record.page_vision._vision
+        time_ = START_TIME + 20 * INTERVAL
+        first = vision.vision_array(time_)
+        assert vision.vision_array(time_) is first
+        assert vision.cache.hits == 1
+
+        # the cached frame is the base of later diffs
+        vision.cache.clear()
+        expected = vision.vision_array(time_ + INTERVAL).copy()
+        vision.cache.clear()
+        vision.vision_array(time_)
+        np.testing.assert_array_equal(vision.vision_array(time_ + INTERVAL), expected)
+
+
+@pytest.mark.parametrize('fps', [3.0, 10.0, 25.0])
+def test_iter_frames(json_record, fps):
+    with BrowserRecord.load(json_record) as record:
+        vision = record.page_vision._vision
+        frames = list(vision.iter_frames(START_TIME - 0.2, fps=fps))
+        assert len(frames) == int(np.floor((vision.end_time - START_TIME + 0.2) * fps + 1e-9)) + 1
+        assert frames[0][1] is None
+        for time_, image_arr in frames[3:]:
+            np.testing.assert_array_equal(image_arr, vision.vision_array(time_))
+
+
+def test_iter_frames_region(json_record):
+    with BrowserRecord.load(json_record) as record:
+        vision = record.page_vision._vision
+        region = (5, 7, 30, 20)
+        for time_, image_arr in vision.iter_frames(START_TIME, fps=10.0, region=region):
+            np.testing.assert_array_equal(image_arr, vision.vision_array(time_)[:, 7:27, 5:35])
+
+
+@pytest.mark.parametrize('fps', [0, -1.0, float('nan')])
+def test_iter_frames_invalid_fps(json_record, fps):
+    with BrowserRecord.load(json_record) as record:
+        with pytest.raises(ValueError):
+            record.page_vision._vision.iter_frames(fps=fps)
+
+
+def test_iter_items(json_record, record_data):
+    with BrowserRecord.load(json_record, lazy=True) as record:
+        vision = record.page_vision.full_page
+        assert vision is record.page_vision._vision
+        items = list(vision.iter_items(2, 12, frames=False))
+        assert [timestamp for _, _, timestamp in items] == \
+               [item['timestamp'] for item in record_data['page_vision'][2:12]]
+        for type_, arr, _ in items:
+            assert (arr is None) == (type_ == VisionItemType.NEW_FRAME)
+
+        # replaying all the items gives the last frame
+        image_arr = None
+        for type_, arr, _ in vision.iter_items():
+            if type_ == VisionItemType.NEW_FRAME:
+                image_arr = arr.copy()
+            else:
+                apply_diff(image_arr, type_, arr)
+        np.testing.assert_array_equal(image_arr, vision.vision_array(vision.end_time))
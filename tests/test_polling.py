@@ -0,0 +1,70 @@
+import time
+
+import numpy as np
+
+from br.load import BrowserRecord
+from br.page.monitor import WebDriverMonitor, drain_all
+from br.page.vision import _image_to_lab
+from .conftest import FakeDriver, png_data_url, lab_frames
+
+
+def _rgb_frames(count: int):
+    return [lab[:, :, [2, 1, 0]].copy() for lab in lab_frames(count, seed=7)]
+
+
+def test_drain_all():
+    driver = FakeDriver([{'events': [{'event': 'click', 'time': 1.0}]}])
+    driver.monitored = True
+    state = drain_all(driver, {'screenshot_interval_ms': 500})
+    assert driver.drains == [{'screenshot_interval_ms': 500}]
+    assert state['monitored'] and state['events'] == [{'event': 'click', 'time': 1.0}]
+
+
+def test_poll_page_one_round_trip(tmp_path):
+    frames = _rgb_frames(2)
+    driver = FakeDriver([
+        {},
+        {'events': [{'event': 'click', 'time': 1.0, 'x': 1, 'y': 2}],
+         'screenshots': [{'raw': png_data_url(frames[0]), 'time': 1.0}]},
+        {'url': 'http://example.com/next', 'navigate': True,
+         'screenshots': [{'raw': png_data_url(frames[1]), 'time': 2.0}]},
+        {},
+    ])
+    monitor = WebDriverMonitor(driver, str(tmp_path / 'record.json'), injection='execute_script',
+                               system_capture=False)
+    monitor._open()
+    try:
+        assert monitor._poll_page()
+        assert len(driver.scripts) == 2  # listener and html2canvas, injected into the first document
+        assert monitor._poll_page() and monitor._poll_page() and monitor._poll_page()
+        assert len(driver.drains) == 4
+        assert len(driver.scripts) == 4  # and again after the navigation
+    finally:
+        monitor._close_capture()
+
+    events = monitor._page_event_records
+    assert [(item['event'], item.get('new_url')) for item in events] == [
+        ('url_change', 'http://example.com/'), ('click', None), ('url_change', 'http://example.com/next')]
+    assert [item.timestamp for item in monitor._page_vision._records] == [1.0, 2.0]
+
+
+def test_monitor_record(tmp_path):
+    frames = _rgb_frames(5)
+    driver = FakeDriver([{'screenshots': [{'raw': png_data_url(frame), 'time': time.time() + i * 0.01}],
+                          'events': [{'event': 'scroll', 'time': time.time(), 'scroll_x': 0, 'scroll_y': i}]}
+                         for i, frame in enumerate(frames)])
+    save_as = str(tmp_path / 'record.json')
+    monitor = WebDriverMonitor(driver, save_as, event_interval=0.01, injection='execute_script',
+                               system_capture=False)
+    monitor.start()
+    deadline = time.time() + 10.0
+    while driver.states and time.time() < deadline:
+        time.sleep(0.01)
+    monitor.stop()
+
+    with BrowserRecord.load(save_as) as record:
+        assert [item['scroll_y'] for item in record.events_between(types=['scroll'])] == list(range(5))
+        vision = record.page_vision._vision
+        assert len(vision) == 5
+        np.testing.assert_array_equal(vision.vision_array(vision.end_time),
+                                      _image_to_lab(frames[-1]).transpose((2, 0, 1)))
@@ -0,0 +1,22 @@
+import json
+
+from br.load import BrowserRecord, build_pyramid
+from br.page.vision import VisionItemType
+from .conftest import make_record_data
+
+
+def test_build_pyramid_starting_with_diff(tmp_path):
+    # e.g. a record cut in the middle of a keyframe interval
+    data = make_record_data(pyramid_scales=())
+    data['page_vision'] = data['page_vision'][1:]
+    assert data['page_vision'][0]['type'] != 'new_frame'
+    input_file, output_file = str(tmp_path / 'record.json'), str(tmp_path / 'pyramid.brc')
+    with open(input_file, 'w') as f:
+        json.dump(data, f)
+
+    build_pyramid(input_file, output_file, scales=(2, 4))
+    keyframe = next(i for i, item in enumerate(data['page_vision']) if item['type'] == 'new_frame')
+    with BrowserRecord.load(output_file) as record:
+        for scale, items in record.data['pyramid']['page_vision'].items():
+            assert VisionItemType.loads(items[0]['type']) == VisionItemType.NEW_FRAME
+            assert items[0]['timestamp'] == data['page_vision'][keyframe]['timestamp']
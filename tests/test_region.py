@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from br.load import BrowserRecord
+from br.load.vision import lab_to_image
+from .conftest import START_TIME, INTERVAL
+
+# inside the page, with fractions, and over the right bottom corner (the frames are 56x40)
+REGIONS = [(5, 7, 30, 20), (4.6, 2.4, 20.5, 10.7), (40, 30, 30, 20)]
+TIMES = [START_TIME + i * INTERVAL for i in (0, 3, 8, 9, 17, 29)]
+
+
+def _rounded(region):
+    x, y, width, height = (int(round(v)) for v in region)
+    return x, y, width, height
+
+
+@pytest.mark.parametrize('region', REGIONS)
+def test_region_array(json_record, region):
+    with BrowserRecord.load(json_record) as record:
+        vision = record.page_vision._vision
+        x, y, width, height = _rounded(region)
+        for time_ in TIMES:
+            full = vision.vision_array(time_).copy()
+            vision.cache.clear()  # decoded from the region, not cropped from the cached frame
+            np.testing.assert_array_equal(vision.vision_array(time_, region), full[:, y:y + height, x:x + width])
+
+
+@pytest.mark.parametrize('region', REGIONS + [(-3.2, -5.0, 20, 12)])
+def test_region_image(json_record, region):
+    with BrowserRecord.load(json_record) as record:
+        vision = record.page_vision._vision
+        x, y, width, height = _rounded(region)
+        for time_ in TIMES:
+            expected = lab_to_image(vision.vision_array(time_)).crop((x, y, x + width, y + height))
+            vision.cache.clear()
+            image = vision.vision(time_, region)
+            assert image.size == (width, height)
+            np.testing.assert_array_equal(np.asarray(image), np.asarray(expected))
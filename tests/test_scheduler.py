@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from br.page.scheduler import AdaptiveScheduler
+from br.page.vision import VisionRecorder
+from .conftest import lab_frames
+
+
+def test_backoff_and_activity():
+    scheduler = AdaptiveScheduler(min_interval=0.1, max_interval=0.5, backoff=2.0)
+    assert scheduler.interval == 0.1
+    assert [scheduler.tick(float(i)) for i in range(4)] == pytest.approx([0.2, 0.4, 0.5, 0.5])
+
+    scheduler.notify_activity(0)  # nothing happened
+    assert scheduler.tick(4.0) == 0.5
+    scheduler.notify_activity(3)
+    assert scheduler.interval == 0.1
+    assert scheduler.tick(5.0) == 0.1  # active since the last capture
+    assert scheduler.tick(6.0) == pytest.approx(0.2)
+
+
+def test_effective_rate():
+    scheduler = AdaptiveScheduler.from_rates(0.5, 10.0, window=2.0)
+    assert (scheduler.min_interval, scheduler.max_interval) == pytest.approx((0.1, 2.0))
+    assert scheduler.effective_rate == 0.0
+    for i in range(11):
+        scheduler.tick(i * 0.5)
+    assert scheduler.effective_rate == pytest.approx(2.0)  # only the captures of the last 2 seconds
+
+
+@pytest.mark.parametrize('min_interval, max_interval', [(0.0, 1.0), (-1.0, 1.0), (2.0, 1.0)])
+def test_invalid_range(min_interval, max_interval):
+    with pytest.raises(ValueError):
+        AdaptiveScheduler(min_interval, max_interval)
+
+
+def test_skip_identical():
+    frames = list(lab_frames(3))
+    recorder = VisionRecorder()
+    for i, lab in enumerate([frames[0], frames[0].copy(), frames[1], frames[1], frames[2]]):
+        recorder.append_lab(lab, float(i))
+    assert recorder.skipped == 2
+    assert [item.timestamp for item in recorder._records] == [0.0, 2.0, 4.0]
+
+    changed = frames[0].copy()
+    changed[-1, -1] = 255 - changed[-1, -1]  # not in the signature, still a change
+    recorder.append_lab(changed, 5.0)
+    assert recorder.skipped == 2 and len(recorder) == 4
+
+    recorder = VisionRecorder(skip_identical=False)
+    for i in range(3):
+        recorder.append_lab(frames[0], float(i))
+    assert recorder.skipped == 0 and len(recorder) == 3
+    np.testing.assert_array_equal(recorder._last_lab, frames[0])
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from br.load.vision import _apply_tile_diff, _apply_pixel_diff
+from br.page.vision import VisionRecorder, VisionItemType, _pack_tile_diff, _unpack_tile_diff
+from .conftest import lab_frames
+
+
+def test_tile_diff_pack_unpack():
+    rnd = np.random.RandomState(1)
+    tile_mask = rnd.rand(3, 5) > 0.5
+    blocks = rnd.randint(0, 256, (int(tile_mask.sum()), 3, 8, 8)).astype(np.uint8)
+    tile_size, mask, unpacked = _unpack_tile_diff(_pack_tile_diff(8, tile_mask, blocks))
+    assert tile_size == 8
+    np.testing.assert_array_equal(mask, tile_mask)
+    np.testing.assert_array_equal(unpacked, blocks)
+
+
+@pytest.mark.parametrize('tile_size', [8, 16])
+def test_apply_tile_diff(tile_size):
+    # sizes which are not multiples of the tile size, so the edge tiles are padded
+    recorder = VisionRecorder(tile_size=tile_size)
+    before, after = list(lab_frames(2, height=37, width=53, seed=2))
+    diff = recorder._tile_diff(after, recorder._changed_pixels(before, after))
+
+    image_arr = before.transpose((2, 0, 1)).copy()
+    _apply_tile_diff(image_arr, diff)
+    np.testing.assert_array_equal(image_arr, after.transpose((2, 0, 1)))
+
+
+def test_apply_tile_diff_region():
+    recorder = VisionRecorder(tile_size=8)
+    before, after = list(lab_frames(2, height=37, width=53, seed=5))
+    diff = recorder._tile_diff(after, recorder._changed_pixels(before, after))
+
+    region = before.transpose((2, 0, 1))[:, 5:30, 11:40].copy()
+    _apply_tile_diff(region, diff, 11, 5)
+    np.testing.assert_array_equal(region, after.transpose((2, 0, 1))[:, 5:30, 11:40])
+
+
+def test_tile_and_pixel_diffs_agree():
+    # with no threshold, both encodings are lossless
+    pixel = VisionRecorder(tile_size=None, pixel_diff_threshold=0.0)
+    tile = VisionRecorder(tile_size=16, pixel_diff_threshold=0.0)
+    frames = list(lab_frames(10, seed=6))
+    for lab in frames:
+        pixel.append_lab(lab, 0.0)
+        tile.append_lab(lab, 0.0)
+    assert {item.type for item in tile._records[1:]} == {VisionItemType.TILE_DIFF_FRAME}
+    assert {item.type for item in pixel._records[1:]} == {VisionItemType.DIFF_FRAME}
+
+    pixel_arr = pixel._records[0].data.copy()
+    tile_arr = tile._records[0].data.copy()
+    for pixel_item, tile_item in zip(pixel._records[1:], tile._records[1:]):
+        _apply_pixel_diff(pixel_arr, pixel_item.data)
+        _apply_tile_diff(tile_arr, tile_item.data)
+    np.testing.assert_array_equal(pixel_arr, tile_arr)
+    np.testing.assert_array_equal(tile_arr, frames[-1].transpose((2, 0, 1)))
@@ -0,0 +1,55 @@
+import numpy as np
+
+from br.load.events import CursorTracker, ScrollTracker, ResizeTracker, ViewAreaTracker, RelCursorTracker
+
+
+def _trackers():
+    rnd = np.random.RandomState(3)
+    cursor = CursorTracker([((float(x), float(y)), t) for (x, y), t in
+                            zip(rnd.randint(0, 500, (50, 2)), np.sort(rnd.rand(50) * 10) + 1)])
+    scroll = ScrollTracker([((0.0, float(y)), t) for y, t in zip(rnd.randint(0, 300, 20), np.sort(rnd.rand(20) * 10))])
+    resize = ResizeTracker([((800.0, 600.0), 0.5), ((640.0, 480.0), 6.0)])
+    return cursor, ViewAreaTracker(scroll, resize)
+
+
+def _query_times():
+    return np.concatenate([[-1.0, 0.0, 0.5, 6.0, 11.0], np.random.RandomState(4).rand(200) * 12 - 1])
+
+
+def test_batch_same_as_scalar():
+    cursor, view_area = _trackers()
+    times = _query_times()
+    for tracker, batch, scalar in [
+        (cursor, cursor.positions, cursor.position),
+        (view_area.resize, view_area.resize.sizes, view_area.resize.size),
+        (view_area, view_area.areas, view_area.area),
+        (None, RelCursorTracker(cursor, view_area).positions, RelCursorTracker(cursor, view_area).position),
+    ]:
+        states, mask = batch(times)
+        for time_, state, flag in zip(times, states, mask):
+            expected = scalar(time_)
+            if expected is None:
+                assert not flag and np.isnan(state).all()
+            else:
+                assert flag
+                np.testing.assert_allclose(state, expected)
+
+
+def test_interpolate():
+    cursor = CursorTracker([((0.0, 0.0), 1.0), ((10.0, 20.0), 2.0), ((10.0, 20.0), 2.0)])
+    states, mask = cursor.positions(np.array([0.5, 1.0, 1.25, 2.0, 3.0]), interpolate=True)
+    assert mask.tolist() == [False, True, True, True, True]
+    np.testing.assert_allclose(states[1:], [[0.0, 0.0], [2.5, 5.0], [10.0, 20.0], [10.0, 20.0]])
+
+
+def test_empty_tracker():
+    cursor = CursorTracker([])
+    states, mask = cursor.positions(np.array([0.0, 1.0]))
+    assert states.shape == (2, 2) and np.isnan(states).all() and not mask.any()
+    assert cursor.position(1.0) is None
+
+
+def test_from_arrays_sorted():
+    tracker = ScrollTracker.from_arrays(np.array([2.0, 1.0]), np.array([[0.0, 20.0], [0.0, 10.0]]))
+    assert tracker.position(1.5) == (0.0, 10.0)
+    assert tracker.items == [((0.0, 10.0), 1.0), ((0.0, 20.0), 2.0)]
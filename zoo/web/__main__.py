@@ -7,6 +7,7 @@ from huggingface_hub import hf_hub_download
 from tqdm.auto import tqdm
 from ultralytics import YOLO
 
+from .dataset import export_dataset
 from .onnx import export_yolo_to_onnx
 from ..utils import GLOBAL_CONTEXT_SETTINGS
 from ..utils import print_version as _origin_print_version
@@ -42,5 +43,68 @@ def export(output_dir: str):
         export_yolo_to_onnx(yolo, output_file)
 
 
+@cli.command('detect', help='Detect web elements over the viewport of records, saved next to each record.',
+             context_settings={**GLOBAL_CONTEXT_SETTINGS})
+@click.option('--model', '-m', 'model_file', type=click.Path(dir_okay=False, exists=True), required=True,
+              help='Onnx model exported by the export command.')
+@click.option('--input', '-i', 'input_files', type=click.Path(dir_okay=False, exists=True), multiple=True,
+              required=True, help='Record files (json or container).')
+@click.option('--batch-size', '-b', 'batch_size', type=int, default=8,
+              help='Frames per inference batch.', show_default=True)
+@click.option('--intra-op-threads', 'intra_op_threads', type=int, default=0,
+              help='Threads inside each operator, 0 means chosen by onnxruntime.', show_default=True)
+@click.option('--inter-op-threads', 'inter_op_threads', type=int, default=0,
+              help='Threads running independent operators, 0 means chosen by onnxruntime.', show_default=True)
+@click.option('--diff-threshold', 'diff_threshold', type=float, default=0.01,
+              help='Changed share of the viewport below which the last detections are reused.', show_default=True)
+@click.option('--min-interval', 'min_interval', type=float, default=0.2,
+              help='Min seconds between detected frames.', show_default=True)
+@click.option('--conf', 'conf_threshold', type=float, default=0.25,
+              help='Min confidence of detections.', show_default=True)
+def detect(model_file: str, input_files, batch_size: int, intra_op_threads: int, inter_op_threads: int,
+           diff_threshold: float, min_interval: float, conf_threshold: float):
+    from .detect import WebDetector, detect_record  # onnxruntime is only needed here
+
+    detector = WebDetector(model_file, batch_size=batch_size, intra_op_threads=intra_op_threads,
+                           inter_op_threads=inter_op_threads, conf_threshold=conf_threshold)
+    frames, seconds = 0, 0.0
+    for input_file in input_files:
+        _, stats = detect_record(input_file, detector, diff_threshold=diff_threshold, min_interval=min_interval)
+        frames, seconds = frames + stats['frames'], seconds + stats['seconds']
+    click.echo(f'{frames} frames of {len(input_files)} records in {seconds:.2f}s, '
+               f'{frames / seconds if seconds > 0 else float("nan"):.1f} frames/s.')
+
+
+@cli.command('dataset', help='Export viewport images of records as an ultralytics dataset, without near-duplicates.',
+             context_settings={**GLOBAL_CONTEXT_SETTINGS})
+@click.option('--input', '-i', 'inputs', type=click.Path(exists=True), multiple=True, required=True,
+              help='Record files, or directories to search for records.')
+@click.option('--output_dir', '-O', 'output_dir', type=click.Path(file_okay=False), required=True,
+              help='Output directory of dataset, records already exported into it are skipped.')
+@click.option('--workers', '-j', 'workers', type=int, default=None,
+              help='Worker processes, all the cpus when not given.')
+@click.option('--shards', 'shards', type=int, default=16,
+              help='Sub-directories the images are spread across.', show_default=True)
+@click.option('--val-ratio', 'val_ratio', type=float, default=0.1,
+              help='Share of records in the validation split.', show_default=True)
+@click.option('--min-interval', 'min_interval', type=float, default=0.5,
+              help='Min seconds between sampled frames.', show_default=True)
+@click.option('--min-change', 'min_change', type=float, default=0.01,
+              help='Changed share of the viewport below which a frame is skipped without hashing.',
+              show_default=True)
+@click.option('--max-distance', 'max_distance', type=int, default=4,
+              help='Frames with hashes within this hamming distance of a kept one are near-duplicates.',
+              show_default=True)
+@click.option('--format', 'image_format', type=click.Choice(['jpg', 'png']), default='jpg',
+              help='Format of images.', show_default=True)
+def dataset(inputs, output_dir: str, workers, shards: int, val_ratio: float, min_interval: float,
+            min_change: float, max_distance: int, image_format: str):
+    result = export_dataset(inputs, output_dir, workers=workers, shards=shards, val_ratio=val_ratio,
+                            min_interval=min_interval, min_change=min_change, max_distance=max_distance,
+                            image_format=image_format)
+    click.echo(f'{result["exported"]} records exported, {result["skipped"]} skipped, '
+               f'{len(result["failed"])} failed, {result["images_total"]} images in dataset.')
+
+
 if __name__ == '__main__':
     cli()
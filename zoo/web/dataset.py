@@ -0,0 +1,254 @@
+import glob
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Iterable, Dict, Tuple
+
+import numpy as np
+import yaml
+from PIL import Image
+from ditk import logging
+from tqdm.auto import tqdm
+
+from br.load import BrowserRecord, record_files, apply_diff, lab_to_image
+from br.page.vision import VisionItemType
+from .track import DetectionTrack, detection_track_file, _changed_pixels, _sample_times
+
+_MANIFEST_DIR = 'manifest'
+
+
+def _record_id(file: str) -> str:
+    return hashlib.sha1(os.path.abspath(file).encode()).hexdigest()[:16]
+
+
+def _dhash(luminance: np.ndarray, hash_size: int) -> int:
+    # difference hash of the L channel, so frames are hashed before any colour conversion
+    image = Image.fromarray(luminance).resize((hash_size + 1, hash_size), Image.BOX)
+    pixels = np.asarray(image, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+
+def _hamming(hashes: np.ndarray, value: int) -> np.ndarray:
+    return np.unpackbits((hashes ^ np.uint64(value)).view(np.uint8)).reshape((-1, 64)).sum(axis=1)
+
+
+def _viewport_lab(image_arr: np.ndarray, area: Tuple[int, int, int, int]) -> Tuple[np.ndarray, Tuple[int, int]]:
+    # part of the frame inside the viewport, and its offset in the viewport
+    x, y, width, height = area
+    _, page_height, page_width = image_arr.shape
+    x0, y0 = min(max(x, 0), page_width), min(max(y, 0), page_height)
+    x1, y1 = min(max(x + width, 0), page_width), min(max(y + height, 0), page_height)
+    return image_arr[:, y0:y1, x0:x1], (x0 - x, y0 - y)
+
+
+def _viewport_image(lab: np.ndarray, offset: Tuple[int, int], size: Tuple[int, int]) -> Image.Image:
+    # the same as VisibleTracker.vision, the area outside the page is black
+    image = lab_to_image(np.ascontiguousarray(lab))
+    if image.size != size:
+        canvas = Image.new('RGB', size)
+        canvas.paste(image, offset)
+        image = canvas
+    return image
+
+
+def _labels(track: Optional[DetectionTrack], time_: float, size: Tuple[int, int], names: Dict[str, int]) -> List[str]:
+    # yolo format, class and normalized (cx, cy, w, h)
+    if track is None:
+        return []
+    width, height = size
+    retval = []
+    for item in track.detections(time_) or []:
+        if item.label in names and item.x1 > item.x0 and item.y1 > item.y0:
+            retval.append(f'{names[item.label]} {(item.x0 + item.x1) / 2 / width:.6f} '
+                          f'{(item.y0 + item.y1) / 2 / height:.6f} {(item.x1 - item.x0) / width:.6f} '
+                          f'{(item.y1 - item.y0) / height:.6f}')
+    return retval
+
+
+def _export_record(file: str, output_dir: str, split: str, shard: str, names: Dict[str, int],
+                   min_interval: float, min_change: float, hash_size: int, max_distance: int,
+                   image_format: str) -> dict:
+    # runs in the worker processes. Frames are reconstructed in one pass (each diff applied once),
+    # samples are skipped when the diffs since the last kept one changed less than min_change of the
+    # viewport, or when their hash is within max_distance of a kept one of the same record
+    record_id = _record_id(file)
+    image_dir = os.path.join(output_dir, 'images', split, shard)
+    label_dir = os.path.join(output_dir, 'labels', split, shard)
+    os.makedirs(image_dir, exist_ok=True)
+    os.makedirs(label_dir, exist_ok=True)
+    for old_file in glob.glob(os.path.join(image_dir, f'{record_id}_*')) + \
+            glob.glob(os.path.join(label_dir, f'{record_id}_*')):  # left by an interrupted run
+        os.remove(old_file)
+
+    track_file = detection_track_file(file)
+    track = DetectionTrack.load(track_file) if os.path.exists(track_file) else None
+    stat = os.stat(file)
+    images, stats = [], {'samples': 0, 'unchanged': 0, 'duplicates': 0}
+    with BrowserRecord.load(file, lazy=True) as record:
+        vision = record.page_vision.full_page
+        times = _sample_times(record, min_interval)
+        stats['samples'] = len(times)
+
+        image_arr, cursor, changed, last_area = None, 0, 0.0, None
+        hashes, kept = np.zeros(len(times), dtype=np.uint64), 0  # hashes of the kept samples are hashes[:kept]
+        for time_ in times:
+            area = record.view_area.area(time_)
+            area = None if area is None else tuple(int(v) for v in area)
+            end = int(np.searchsorted(vision.times, time_, side='right'))
+            for type_, arr, _ in vision.iter_items(cursor, end):
+                if type_ == VisionItemType.NEW_FRAME:
+                    image_arr, changed = arr, 1.0
+                elif image_arr is not None:
+                    if area is not None:
+                        changed += _changed_pixels(type_, arr, area) / max(area[2] * area[3], 1)
+                    apply_diff(image_arr, type_, arr)
+            cursor = end
+            if image_arr is None or area is None or area[2] <= 0 or area[3] <= 0:
+                continue
+
+            if area == last_area and changed < min_change:
+                stats['unchanged'] += 1
+                continue
+            lab, offset = _viewport_lab(image_arr, area)
+            if lab.size == 0:
+                continue
+            value = _dhash(lab[0], hash_size)
+            if kept and _hamming(hashes[:kept], value).min() <= max_distance:
+                stats['duplicates'] += 1
+                continue
+            hashes[kept], kept = value, kept + 1
+            last_area, changed = area, 0.0
+
+            name = f'{record_id}_{len(images):05d}'
+            size = (area[2], area[3])
+            image_file = os.path.join(image_dir, f'{name}.{image_format}')
+            _viewport_image(lab, offset, size).save(image_file, **({'quality': 90} if image_format == 'jpg' else {}))
+            labels = _labels(track, time_, size, names)
+            if track is not None:  # images without label files are backgrounds for ultralytics
+                with open(os.path.join(label_dir, f'{name}.txt'), 'w') as f:
+                    f.write(''.join(f'{line}\n' for line in labels))
+            images.append({
+                'file': os.path.relpath(image_file, output_dir),
+                'time': time_,
+                'hash': f'{value:016x}',
+                'labels': len(labels),
+            })
+
+    stats['images'] = len(images)
+    manifest = {
+        'record': os.path.abspath(file),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'split': split,
+        'shard': shard,
+        'stats': stats,
+        'images': images,
+    }
+    # written last and renamed, so a record is only skipped on re-run when it was completely exported
+    manifest_file = os.path.join(output_dir, _MANIFEST_DIR, f'{record_id}.json')
+    with open(manifest_file + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(manifest_file + '.tmp', manifest_file)
+    return manifest
+
+
+def _export_record_safe(args) -> Tuple[str, Optional[dict], Optional[str]]:
+    file, kwargs = args
+    try:
+        return file, _export_record(file, **kwargs), None
+    except Exception as err:
+        return file, None, f'{type(err).__name__}: {err}'
+
+
+def _is_exported(output_dir: str, file: str) -> bool:
+    manifest_file = os.path.join(output_dir, _MANIFEST_DIR, f'{_record_id(file)}.json')
+    if not os.path.exists(manifest_file):
+        return False
+    with open(manifest_file, 'r') as f:
+        manifest = json.load(f)
+    stat = os.stat(file)
+    return manifest['size'] == stat.st_size and manifest['mtime'] == stat.st_mtime
+
+
+def _split(file: str, val_ratio: float) -> str:
+    # by record, so frames of one session are never in both splits
+    return 'val' if int(_record_id(file), 16) / 16 ** 16 < val_ratio else 'train'
+
+
+def _load_names(output_dir: str, files: List[str]) -> Dict[str, int]:
+    # class ids of an existing dataset are kept, new labels of detection tracks are appended
+    names: Dict[str, int] = {}
+    data_file = os.path.join(output_dir, 'data.yaml')
+    if os.path.exists(data_file):
+        with open(data_file, 'r') as f:
+            for id_, name in sorted(((yaml.safe_load(f) or {}).get('names') or {}).items()):
+                names[name] = int(id_)
+    labels = set()
+    for file in files:
+        track_file = detection_track_file(file)
+        if os.path.exists(track_file):
+            labels.update(item.label for (detections, _), _ in DetectionTrack.load(track_file).items
+                          for item in detections)
+    next_id = max(names.values(), default=-1) + 1  # ids of an edited data.yaml may have gaps
+    for label in sorted(labels - set(names)):
+        names[label], next_id = next_id, next_id + 1
+    return names
+
+
+def export_dataset(inputs: Iterable[str], output_dir: str, workers: Optional[int] = None, shards: int = 16,
+                   val_ratio: float = 0.1, min_interval: float = 0.5, min_change: float = 0.01, hash_size: int = 8,
+                   max_distance: int = 4, image_format: str = 'jpg', silent: bool = False) -> dict:
+    # viewport images of records in the ultralytics layout (images/{train,val}, labels/{train,val} and data.yaml),
+    # labels come from the detection tracks next to the records when there are. Records are exported in a
+    # process pool, sharded into sub-directories, and the ones already exported are skipped
+    if hash_size * hash_size > 64:
+        raise ValueError(f'Hash size should be at most 8 for 64-bit hashes, but {hash_size!r} found.')
+    if image_format not in ('jpg', 'png'):
+        raise ValueError(f'Unknown image format - {image_format!r}.')
+    files = [file for file in record_files(inputs) if not file.endswith('.detections.json')]
+    os.makedirs(os.path.join(output_dir, _MANIFEST_DIR), exist_ok=True)
+    names = _load_names(output_dir, files)
+
+    pending = [file for file in files if not _is_exported(output_dir, file)]
+    kwargs = dict(output_dir=output_dir, names=names, min_interval=min_interval, min_change=min_change,
+                  hash_size=hash_size, max_distance=max_distance, image_format=image_format)
+    tasks = [(file, {**kwargs, 'split': _split(file, val_ratio),
+                     'shard': f'shard-{int(_record_id(file), 16) % shards:03d}'}) for file in pending]
+
+    failed, totals = {}, {'samples': 0, 'unchanged': 0, 'duplicates': 0, 'images': 0}
+    with ProcessPoolExecutor(max_workers=workers) as executor, \
+            tqdm(total=len(tasks), disable=silent, desc='Export') as progress:
+        for file, manifest, error in executor.map(_export_record_safe, tasks):
+            if manifest is None:
+                failed[file] = error
+                logging.warning(f'Failed to export {file!r} - {error}')
+            else:
+                for key in totals:
+                    totals[key] += manifest['stats'][key]
+            progress.update()
+
+    # manifest of all the exported images, and the dataset yaml for training
+    count = 0
+    with open(os.path.join(output_dir, 'manifest.jsonl'), 'w') as f:
+        for manifest_file in sorted(glob.glob(os.path.join(output_dir, _MANIFEST_DIR, '*.json'))):
+            with open(manifest_file, 'r') as mf:
+                manifest = json.load(mf)
+            for item in manifest['images']:
+                f.write(json.dumps({'record': manifest['record'], 'split': manifest['split'], **item}) + '\n')
+                count += 1
+    with open(os.path.join(output_dir, 'data.yaml'), 'w') as f:
+        yaml.safe_dump({
+            'path': os.path.abspath(output_dir),
+            'train': 'images/train',
+            'val': 'images/val',
+            'names': {id_: name for name, id_ in sorted(names.items(), key=lambda x: x[1])},
+        }, f, sort_keys=False)
+
+    result = {'records': len(files), 'exported': len(pending) - len(failed), 'skipped': len(files) - len(pending),
+              'failed': failed, 'images_total': count, **totals}
+    logging.info(f'{result["exported"]} records exported ({totals["images"]} images of {totals["samples"]} samples, '
+                 f'{totals["unchanged"]} unchanged and {totals["duplicates"]} near-duplicates removed), '
+                 f'{result["skipped"]} already exported, {len(failed)} failed, {count} images in dataset.')
+    return result
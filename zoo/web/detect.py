@@ -0,0 +1,210 @@
+import ast
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Optional, Dict, Sequence
+
+import numpy as np
+import onnxruntime
+from PIL import Image
+from ditk import logging
+from tqdm.auto import tqdm
+
+from br.load import BrowserRecord
+from br.page.vision import VisionItemType
+from .track import Detection, DetectionTrack, detection_track_file, _changed_pixels, _sample_times
+
+
+def _letterbox(image: Image.Image, size: int) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+    # resized to fit (size, size) with the aspect ratio kept and padded with grey, the same as ultralytics.
+    # returns (3, size, size) float32 in [0, 1], ratio and padding
+    width, height = image.size
+    ratio = min(size / width, size / height)
+    new_width, new_height = max(int(round(width * ratio)), 1), max(int(round(height * ratio)), 1)
+    pad_x, pad_y = (size - new_width) // 2, (size - new_height) // 2
+
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    resized = image.convert('RGB').resize((new_width, new_height), Image.BILINEAR)
+    canvas[pad_y:pad_y + new_height, pad_x:pad_x + new_width] = np.asarray(resized)
+    return canvas.transpose((2, 0, 1)).astype(np.float32) / 255.0, ratio, (pad_x, pad_y)
+
+
+def _nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    # greedy non-maximum suppression, boxes are (x0, y0, x1, y1)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+    while len(order):
+        i, order = order[0], order[1:]
+        keep.append(i)
+        x0 = np.maximum(boxes[i, 0], boxes[order, 0])
+        y0 = np.maximum(boxes[i, 1], boxes[order, 1])
+        x1 = np.minimum(boxes[i, 2], boxes[order, 2])
+        y1 = np.minimum(boxes[i, 3], boxes[order, 3])
+        inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+        order = order[inter / np.maximum(areas[i] + areas[order] - inter, 1e-9) <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+class WebDetector:
+    # onnx model exported by export_yolo_to_onnx, run on cpu in batches.
+    # threads of 0 are chosen by onnxruntime
+    def __init__(self, model_file: str, batch_size: int = 8, intra_op_threads: int = 0, inter_op_threads: int = 0,
+                 conf_threshold: float = 0.25, iou_threshold: float = 0.7, max_detections: int = 300):
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL if inter_op_threads > 1 \
+            else onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(model_file, options, providers=['CPUExecutionProvider'])
+        self.model_file = model_file
+        self.batch_size = batch_size
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.max_detections = max_detections
+
+        # ultralytics keeps class names and image size in the metadata of exported models
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names: Dict[int, str] = ast.literal_eval(metadata['names']) if 'names' in metadata else {}
+        imgsz = ast.literal_eval(metadata['imgsz']) if 'imgsz' in metadata else 640
+        self.size = int(imgsz[0] if isinstance(imgsz, (list, tuple)) else imgsz)
+        self._input_name = self.session.get_inputs()[0].name
+
+    def _postprocess(self, output: np.ndarray, ratio: float, pad: Tuple[int, int],
+                     image_size: Tuple[int, int]) -> List[Detection]:
+        # output of yolov8 is (4 + classes, anchors), boxes are (cx, cy, w, h) in the letterboxed image
+        pred = output.T
+        class_scores = pred[:, 4:]
+        classes = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(pred)), classes]
+        mask = scores >= self.conf_threshold
+        pred, classes, scores = pred[mask], classes[mask], scores[mask]
+        if not len(pred):
+            return []
+
+        boxes = np.stack([
+            pred[:, 0] - pred[:, 2] / 2, pred[:, 1] - pred[:, 3] / 2,
+            pred[:, 0] + pred[:, 2] / 2, pred[:, 1] + pred[:, 3] / 2,
+        ], axis=1)
+        # per-class nms in one pass, boxes of different classes are moved apart
+        keep = _nms(boxes + classes[:, None] * (self.size * 2.0), scores, self.iou_threshold)[:self.max_detections]
+
+        width, height = image_size
+        boxes = (boxes[keep] - np.array([pad[0], pad[1], pad[0], pad[1]])) / ratio
+        boxes = np.clip(boxes, 0, [width, height, width, height])
+        return [
+            Detection(self.names.get(int(cls), str(int(cls))), float(score), *map(float, box))
+            for cls, score, box in zip(classes[keep], scores[keep], boxes)
+        ]
+
+    def _prepare(self, images: Sequence[Image.Image], sizes: Optional[Sequence[Tuple[int, int]]] = None):
+        # boxes are reported in sizes, e.g. the viewport of a downsampled image, or in the image itself
+        inputs, metas = [], []
+        for image, size in zip(images, sizes or [image.size for image in images]):
+            arr, ratio, pad = _letterbox(image, self.size)
+            inputs.append(arr)
+            metas.append((ratio * image.size[0] / size[0], pad, size))
+        return np.stack(inputs), metas
+
+    def _run(self, prepared) -> List[List[Detection]]:
+        inputs, metas = prepared
+        outputs = self.session.run(None, {self._input_name: inputs})[0]
+        return [self._postprocess(output, *meta) for output, meta in zip(outputs, metas)]
+
+    def detect(self, images: Sequence[Image.Image]) -> List[List[Detection]]:
+        retval = []
+        for i in range(0, len(images), self.batch_size):
+            retval.extend(self._run(self._prepare(images[i:i + self.batch_size])))
+        return retval
+
+
+def _plan(record: BrowserRecord, times: List[float], diff_threshold: float) -> List[bool]:
+    # whether each sample needs inference, the others reuse the last inferred detections.
+    # the changed share of the viewport is accumulated from the diff frames, which are decompressed
+    # but never applied to a frame
+    vision = record.page_vision.full_page
+    retval, last_area, changed, cursor = [], None, 0.0, 0
+    for time_ in times:
+        area = record.view_area.area(time_)
+        area = None if area is None else tuple(int(v) for v in area)
+        end = int(np.searchsorted(vision.times, time_, side='right'))
+        for type_, diff_arr, _ in vision.iter_items(cursor, end, frames=False):
+            if type_ == VisionItemType.NEW_FRAME or area is None:
+                changed = 1.0
+            else:
+                changed += _changed_pixels(type_, diff_arr, area) / max(area[2] * area[3], 1)
+        cursor = end
+
+        if area is None or end == 0:
+            retval.append(False)
+        elif area != last_area or changed > diff_threshold:
+            retval.append(True)
+            last_area, changed = area, 0.0
+        else:
+            retval.append(False)
+    return retval
+
+
+def detect_record(record_file: str, detector: WebDetector, output_file: Optional[str] = None,
+                  diff_threshold: float = 0.01, min_interval: float = 0.2, silent: bool = False) \
+        -> Tuple[DetectionTrack, dict]:
+    # detections over the viewport of a record, saved next to it unless output_file is given.
+    # frames of the next batch are decoded while the current batch is inferred
+    output_file = output_file or detection_track_file(record_file)
+    with BrowserRecord.load(record_file, lazy=True) as record:
+        start = time.perf_counter()
+        times = _sample_times(record, min_interval)
+        plan = _plan(record, times, diff_threshold)
+        inferred_times = [time_ for time_, flag in zip(times, plan) if flag]
+
+        pyramid = bool(record.page_vision.full_page.pyramid)
+
+        def _load_batch(batch_times):
+            images, sizes = [], []
+            for time_ in batch_times:
+                _, _, width, height = record.view_area.area(time_)
+                # with pyramid levels, frames are decoded at about the input size of the model,
+                # for the viewport at that time
+                scale = max(max(width, height) / detector.size, 1) if pyramid else 1
+                images.append(record.page_vision.vision(time_, scale=scale))
+                sizes.append((int(width), int(height)))
+            return detector._prepare(images, sizes)
+
+        results, inference_seconds = [], 0.0
+        batches = [inferred_times[i:i + detector.batch_size]
+                   for i in range(0, len(inferred_times), detector.batch_size)]
+        with ThreadPoolExecutor(max_workers=1) as executor, \
+                tqdm(total=len(inferred_times), disable=silent, desc=os.path.basename(record_file)) as progress:
+            future = executor.submit(_load_batch, batches[0]) if batches else None
+            for i in range(len(batches)):
+                prepared = future.result()
+                if i + 1 < len(batches):
+                    future = executor.submit(_load_batch, batches[i + 1])
+                inference_start = time.perf_counter()
+                results.extend(detector._run(prepared))
+                inference_seconds += time.perf_counter() - inference_start
+                progress.update(len(batches[i]))
+
+        items, last = [], []
+        inferred = iter(results)
+        for time_, flag in zip(times, plan):
+            if flag:
+                last = next(inferred)
+            items.append((last, time_))
+        track = DetectionTrack(items, plan, model=os.path.basename(detector.model_file))
+        track.save(output_file)
+        seconds = time.perf_counter() - start
+
+    stats = {
+        'frames': len(times),
+        'inferred': len(inferred_times),
+        'reused': len(times) - len(inferred_times),
+        'seconds': seconds,
+        'frames_per_second': len(times) / seconds if seconds > 0 else float('nan'),
+        'inferred_per_second': len(inferred_times) / inference_seconds if inference_seconds > 0 else float('nan'),
+    }
+    logging.info(f'{record_file!r}: {stats["frames"]} frames ({stats["inferred"]} inferred, '
+                 f'{stats["reused"]} reused) in {seconds:.2f}s, {stats["frames_per_second"]:.1f} frames/s, '
+                 f'{stats["inferred_per_second"]:.1f} inferred frames/s, saved to {output_file!r}.')
+    return track, stats
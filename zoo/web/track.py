@@ -0,0 +1,98 @@
+import json
+import os
+from typing import List, Tuple, NamedTuple, Optional
+
+import numpy as np
+
+from br.load import BrowserRecord
+from br.load.base import _TimeBasedSequence
+from br.page.vision import VisionItemType, _unpack_tile_diff
+
+
+class Detection(NamedTuple):
+    # box in viewport pixels
+    label: str
+    score: float
+    x0: float
+    y0: float
+    x1: float
+    y1: float
+
+
+class DetectionTrack(_TimeBasedSequence):
+    # detections on the viewport over time, the state holds until the next item.
+    # reused items are copied from the last inferred one, because the page barely changed
+    def __init__(self, items: List[Tuple[List[Detection], float]], inferred: Optional[List[bool]] = None,
+                 model: Optional[str] = None):
+        _TimeBasedSequence.__init__(self, [((detections, flag), time_) for (detections, time_), flag in
+                                           zip(items, inferred if inferred is not None else [True] * len(items))])
+        self.model = model
+
+    def detections(self, time_: float) -> Optional[List[Detection]]:
+        state = self._get_state_on_time(time_)
+        return None if state is None else state[0]
+
+    @property
+    def inferred_count(self) -> int:
+        return sum(1 for (_, flag), _ in self.items if flag)
+
+    def to_json(self) -> dict:
+        return {
+            'model': self.model,
+            'items': [
+                {'time': time_, 'inferred': flag, 'detections': [list(item) for item in detections]}
+                for (detections, flag), time_ in self.items
+            ],
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'DetectionTrack':
+        return cls(
+            [([Detection(*item) for item in row['detections']], row['time']) for row in data['items']],
+            [row['inferred'] for row in data['items']],
+            model=data.get('model'),
+        )
+
+    def save(self, file: str):
+        with open(file, 'w') as f:
+            json.dump(self.to_json(), f)
+
+    @classmethod
+    def load(cls, file: str) -> 'DetectionTrack':
+        with open(file, 'r') as f:
+            return cls.from_json(json.load(f))
+
+
+def detection_track_file(record_file: str) -> str:
+    # next to the record, e.g. 2x.brc -> 2x.detections.json
+    return os.path.splitext(record_file)[0] + '.detections.json'
+
+
+def _changed_pixels(type_: VisionItemType, diff_arr: np.ndarray, area: Tuple[int, int, int, int]) -> int:
+    # pixels of a diff frame inside the viewport area
+    x, y, width, height = area
+    if type_ == VisionItemType.DIFF_FRAME:
+        rows, cols = diff_arr[0].astype(np.int64), diff_arr[1].astype(np.int64)
+        return int(((rows >= y) & (rows < y + height) & (cols >= x) & (cols < x + width)).sum())
+    else:
+        tile_size, tile_mask, _ = _unpack_tile_diff(diff_arr)
+        rows, cols = np.nonzero(tile_mask)
+        ys, xs = rows * tile_size, cols * tile_size
+        overlap_h = np.clip(np.minimum(ys + tile_size, y + height) - np.maximum(ys, y), 0, None)
+        overlap_w = np.clip(np.minimum(xs + tile_size, x + width) - np.maximum(xs, x), 0, None)
+        return int((overlap_h * overlap_w).sum())
+
+
+def _sample_times(record: BrowserRecord, min_interval: float) -> List[float]:
+    # new frames, scrolls and resizes change what is visible, at most one sample per min_interval
+    vision = record.page_vision.full_page
+    view_area = record.view_area
+    times = np.unique(np.concatenate([vision.times, view_area.scroll.times, view_area.resize.times]))
+    retval, window_start = [], None
+    for time_ in times.tolist():
+        if window_start is None or time_ - window_start >= min_interval:
+            retval.append(time_)
+            window_start = time_
+        else:  # the latest state in the window wins
+            retval[-1] = time_
+    return retval